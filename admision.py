@@ -1,45 +1,48 @@
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
-from tkinter import messagebox, filedialog, ttk, Toplevel, StringVar, BooleanVar, Entry, Button
+from tkinter import messagebox, filedialog, simpledialog, Toplevel, StringVar, BooleanVar, Entry, Button
 import tkinter as tk  # Import tkinter for scrollbar
 from datetime import datetime
-import threading
-import time
 import csv
-import pyttsx3
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-from sala_espera import SalaEspera #importamos la clase de sala_espera
 from hospital_lib import (
     cargar_datos,
-    cargar_logo,
+    datos_vacios,
+    marcar_hito,
+    reportar_arranque,
     guardar_paciente_multiple_especialidades,
     validar_nombre_paciente,
-    obtener_conexion,
-    liberar_conexion
+    actualizar_paciente,
+    suscribir_cambios,
+    mantener_particiones,
+    importar_citas_csv,
+    IndiceFiltro,
+    iterar_turnos_rango,
+    obtener_resumen_colas,
+    resumen_por_consultorio,
+    obtener_carga_consultorios,
+    sugerir_consultorios,
+    espera_estimada,
+    EsquemaDesactualizado
 )
+from widgets import EjecutorTareas, TablaVirtual, ColaAnuncios, PRIORIDAD_PERSONAL, cargar_logo
+from exportar_reportes import exportar_reporte
     
 class ModuloAdmision:
     def __init__(self):
-        self.datos = cargar_datos()
+        # La ventana sale enseguida; los datos del día llegan en el ejecutor
+        self.datos = datos_vacios()
+        self.cargando = True
         self.app = tb.Window(themename="flatly")
         self.app.title("Sistema de Admisión - Hospital de Apoyo Palpa")
         self.app.geometry("900x700")
         self.app.minsize(700, 600)
+        self.tareas = EjecutorTareas(self.app)
+        self.al_actualizar_datos = None  # Lo define la ventana de reporte mientras está abierta
         
-        # Inicializamos pyttsx3 para la síntesis de voz
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 150)  # Establecer la velocidad de la voz
+        # El perifoneo se lee en el hilo de voz (pyttsx3 arranca con el primero),
+        # así la ventana no se congela mientras habla
         self.voice_spanish = None
-
-        # Buscar y seleccionar la voz en español
-        voices = self.engine.getProperty('voices')
-        for voice in voices:
-            if "Spanish" in voice.name:
-                self.voice_spanish = voice.id
-                self.engine.setProperty('voice', self.voice_spanish)
-                break
+        self.anuncios = ColaAnuncios(self.configurar_voz, pregrabar=0)
 
         self.especialidades = [esp['nombre'] for esp in self.datos['especialidades']]
         self.consultorios = [f"Consultorio {i}" for i in range(1, 15)]
@@ -47,9 +50,20 @@ class ModuloAdmision:
 
         self.seleccion_especialidades = []
         self.seleccion_consultorios = []
+        # Carga de los consultorios para sugerir; se relee con cada aviso de cambio
+        self.carga = None
         
+        # Si la tabla está particionada, deja creadas las particiones de los próximos días
+        self.tareas.enviar(self.preparar_particiones)
+        self.sincronizar_datos_periodicamente()
+        self.recargar_datos()
         self.setup_ui()
-        threading.Thread(target=self.sincronizar_datos_periodicamente, daemon=True).start()
+
+    def preparar_particiones(self):
+        try:
+            mantener_particiones()
+        except Exception as e:
+            print(f"Error al mantener particiones: {e}")
 
     def setup_ui(self):
         main_frame = tb.Frame(self.app, padding=20)
@@ -83,6 +97,10 @@ class ModuloAdmision:
         self.consultorio_entry.grid(row=2, column=1, sticky="ew", padx=5)
         self.consultorio_entry.bind("<Button-1>", lambda e: self.abrir_popup_consultorios())
 
+        self.asignacion_automatica = BooleanVar(value=False)
+        tb.Checkbutton(form_frame, text="Asignar el consultorio con menor espera", variable=self.asignacion_automatica,
+                       command=self.aplicar_sugerencia, bootstyle="info").grid(row=3, column=1, sticky="w", pady=4, padx=5)
+
         form_frame.columnconfigure(1, weight=1)
 
         self.info_label = tb.Label(main_frame, text="", font=("Segoe UI", 11), bootstyle="success")
@@ -96,6 +114,9 @@ class ModuloAdmision:
 
         self.btn_reporte = tb.Button(btn_frame, text="Ver Reporte", bootstyle="secondary-outline", command=self.mostrar_reporte)
         self.btn_reporte.pack(side="left", padx=10)
+
+        self.btn_importar = tb.Button(btn_frame, text="Importar Citas", bootstyle="primary-outline", command=self.importar_citas)
+        self.btn_importar.pack(side="left", padx=10)
         
         # Botón "Atención Personal" centrado
         btn_atencion_personal_frame = tb.Frame(main_frame)
@@ -104,6 +125,10 @@ class ModuloAdmision:
         self.btn_atencion_personal.pack()
         
         self.app.bind("<Return>", lambda e: self.registrar_paciente())
+        if self.cargando:
+            self.info_label.config(text="Cargando datos del día...", bootstyle="secondary")
+        marcar_hito('ventana creada')
+        self.app.after_idle(marcar_hito, 'ventana visible')
         
         self.app.mainloop()
 
@@ -138,19 +163,30 @@ class ModuloAdmision:
         llamar_btn = tb.Button(popup, text="Llamar", bootstyle="success", command=llamar_personal)
         llamar_btn.pack(pady=10)   
     
+    def configurar_voz(self, engine):
+        engine.setProperty('rate', 150)  # Establecer la velocidad de la voz
+
+        # Buscar y seleccionar la voz en español
+        voices = engine.getProperty('voices')
+        for voice in voices:
+            if "Spanish" in voice.name:
+                self.voice_spanish = voice.id
+                engine.setProperty('voice', self.voice_spanish)
+                break
+
     def reproducir_llamado(self, mensaje):
-        try:
-            print(f"Reproduciendo mensaje: {mensaje}")
-            self.engine.say(mensaje)  # Usamos pyttsx3 para reproducir el mensaje
-            self.engine.runAndWait()
-        except Exception as e:
-            print(f"Error al reproducir mensaje: {e}") 
+        print(f"Reproduciendo mensaje: {mensaje}")
+        if not self.anuncios.anunciar(mensaje, PRIORIDAD_PERSONAL):
+            print("Error al reproducir mensaje: la voz no está disponible")
 
     def abrir_popup_especialidades(self):
         popup = Toplevel(self.app)
         popup.title("Seleccionar Especialidades")
         popup.geometry("300x400")
 
+        if not self.especialidades:
+            tb.Label(popup, text="Cargando especialidades...", font=("Segoe UI", 11)).pack(pady=20)
+
         vars_check = []
         for esp in self.especialidades:
             var = BooleanVar(value=esp in self.seleccion_especialidades)
@@ -161,6 +197,7 @@ class ModuloAdmision:
         def guardar_seleccion():
             self.seleccion_especialidades = [esp for var, esp in vars_check if var.get()]
             self.especialidad_var.set(", ".join(self.seleccion_especialidades) if self.seleccion_especialidades else "")
+            self.aplicar_sugerencia()
             popup.destroy()
 
         btn_guardar = tb.Button(popup, text="Guardar", bootstyle="success", command=guardar_seleccion)
@@ -169,33 +206,116 @@ class ModuloAdmision:
     def abrir_popup_consultorios(self):
         popup = Toplevel(self.app)
         popup.title("Seleccionar Consultorios")
-        popup.geometry("300x400")
+        popup.geometry("320x520")
+
+        sugeridos = self.sugerencia()
+        if sugeridos:
+            lineas = [f"{esp}: {cons} (~{espera_estimada(self.carga, cons, sugeridos[:i].count(cons)):.0f} min)"
+                      for i, (esp, cons) in enumerate(zip(self.seleccion_especialidades, sugeridos))]
+            tb.Label(popup, text="Menor espera estimada:\n" + "\n".join(lineas), font=("Segoe UI", 10),
+                     bootstyle="info", justify="left").pack(anchor="w", padx=5, pady=(5, 0))
 
         vars_check = []
+        checks = {}
         for cons in self.consultorios:
             var = BooleanVar(value=cons in self.seleccion_consultorios)
             chk = tb.Checkbutton(popup, text=cons, variable=var)
             chk.pack(anchor="w", pady=2, padx=5)
             vars_check.append((var, cons))
+            checks[cons] = chk
+
+        # La cantidad en espera sale del resumen: unas decenas de filas, no la cola del día
+        def mostrar_resumen(filas):
+            if not popup.winfo_exists():
+                return
+            resumen = resumen_por_consultorio(filas)
+            for cons, chk in checks.items():
+                pendientes = resumen.get(cons, {}).get('pendientes', 0)
+                chk.config(text=f"{cons} ({pendientes} en espera)")
+
+        self.tareas.enviar(
+            obtener_resumen_colas,
+            clave='resumen_colas',
+            al_terminar=mostrar_resumen,
+            al_fallar=lambda e: print(f"Error al leer el resumen de colas: {e}")
+        )
 
         def guardar_seleccion():
             self.seleccion_consultorios = [cons for var, cons in vars_check if var.get()]
             self.consultorio_var.set(", ".join(self.seleccion_consultorios) if self.seleccion_consultorios else "")
             popup.destroy()
 
-        btn_guardar = tb.Button(popup, text="Guardar", bootstyle="success", command=guardar_seleccion)
-        btn_guardar.pack(pady=10)
-    
+        def usar_sugerencia():
+            self.aplicar_sugerencia(forzar=True)
+            popup.destroy()
+
+        botones = tb.Frame(popup)
+        botones.pack(pady=10)
+        btn_guardar = tb.Button(botones, text="Guardar", bootstyle="success", command=guardar_seleccion)
+        btn_guardar.pack(side="left", padx=5)
+        if sugeridos:
+            tb.Button(botones, text="Usar sugerencia", bootstyle="info-outline", command=usar_sugerencia).pack(side="left", padx=5)
+
+    def sugerencia(self):
+        if not self.carga or not self.seleccion_especialidades:
+            return None
+        return sugerir_consultorios(self.carga, self.seleccion_especialidades, self.consultorios)
+
+    def aplicar_sugerencia(self, forzar=False):
+        # Con la asignación automática la sugerencia sigue a cada cambio de especialidades o de carga
+        if not forzar and not self.asignacion_automatica.get():
+            return
+        sugeridos = self.sugerencia()
+        if sugeridos is None and self.seleccion_especialidades:
+            return  # La carga todavía no llegó
+        self.seleccion_consultorios = sugeridos or []
+        self.consultorio_var.set(", ".join(self.seleccion_consultorios))
+
 
     def sincronizar_datos_periodicamente(self):
-        while True:
-            try:
-                nuevos_datos = cargar_datos()
-                if nuevos_datos != self.datos:
-                    self.datos = nuevos_datos
-            except Exception as e:
-                print(f"Error sincronizando datos: {e}")
-            time.sleep(3)
+        # Cada aviso de cambio recarga los datos en el ejecutor; el resultado llega al hilo de la ventana
+        suscribir_cambios(lambda evento: self.recargar_datos())
+
+    def recargar_datos(self):
+        self.tareas.enviar(
+            cargar_datos,
+            clave='datos',
+            repetir=True,
+            al_terminar=self._recibir_datos,
+            al_fallar=self._error_datos
+        )
+        self.tareas.enviar(
+            obtener_carga_consultorios,
+            clave='carga',
+            repetir=True,
+            al_terminar=self._recibir_carga,
+            al_fallar=lambda e: print(f"Error al leer la carga de los consultorios: {e}")
+        )
+
+    def _recibir_carga(self, carga):
+        self.carga = carga
+        self.aplicar_sugerencia()
+
+    def _error_datos(self, e):
+        print(f"Error sincronizando datos: {e}")
+        if self.cargando:
+            # Se reintenta con el próximo aviso o con el de respaldo; con la base sin
+            # migrar no sirve reintentar y se muestra qué hacer
+            aviso = str(e) if isinstance(e, EsquemaDesactualizado) else "Sin conexión con la base de datos, reintentando..."
+            self.info_label.config(text=aviso, bootstyle="danger")
+
+    def _recibir_datos(self, nuevos_datos):
+        if self.cargando:
+            self.cargando = False
+            self.info_label.config(text="", bootstyle="success")
+            marcar_hito('primeros datos')
+            reportar_arranque('admision')
+        if nuevos_datos is self.datos:
+            return
+        self.datos = nuevos_datos
+        self.especialidades = [esp['nombre'] for esp in self.datos['especialidades']]
+        if self.al_actualizar_datos:
+            self.al_actualizar_datos()
 
     def registrar_paciente(self):
         nombre = self.nombre_entry.get().strip()
@@ -216,13 +336,11 @@ class ModuloAdmision:
             messagebox.showerror("Error", "La cantidad de especialidades y consultorios seleccionados debe coincidir", parent=self.app)
             return
 
-        try:
-            paciente_id = guardar_paciente_multiple_especialidades(
-                nombre,
-                self.seleccion_especialidades,
-                self.seleccion_consultorios
-            )
-            self.datos = cargar_datos()
+        if self.tareas.ocupado('registrar'):
+            return
+
+        def registrado(paciente_id):
+            self.btn_registrar.config(state="normal")
             self.info_label.config(text=f"Paciente registrado con éxito. Turnos: {len(self.seleccion_especialidades)}")
             self.nombre_entry.delete(0, "end")
             self.especialidad_var.set("")
@@ -230,94 +348,121 @@ class ModuloAdmision:
             self.seleccion_especialidades.clear()
             self.seleccion_consultorios.clear()
             self.nombre_entry.focus()
-        except Exception as e:
+
+        def fallido(e):
+            self.btn_registrar.config(state="normal")
             messagebox.showerror("Error", f"No se pudo registrar el paciente: {e}", parent=self.app)
 
-    def exportar_csv_func(self, pacientes):
-        import csv
-        from tkinter import filedialog, messagebox
+        self.btn_registrar.config(state="disabled")
+        self.tareas.enviar(
+            guardar_paciente_multiple_especialidades,
+            nombre,
+            list(self.seleccion_especialidades),
+            list(self.seleccion_consultorios),
+            clave='registrar',
+            al_terminar=registrado,
+            al_fallar=fallido
+        )
+
+    def importar_citas(self):
+        ruta = filedialog.askopenfilename(
+            filetypes=[("Archivo CSV", "*.csv")],
+            parent=self.app,
+            title="Importar citas (nombre, especialidad, consultorio)"
+        )
+        if not ruta:
+            return
+
+        fecha = simpledialog.askstring("Fecha de las citas", "Fecha (AAAA-MM-DD). Vacío = hoy:", parent=self.app)
+        if fecha is None:
+            return
+        fecha = fecha.strip() or None
+        if fecha:
+            try:
+                datetime.strptime(fecha, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Error", "Fecha no válida, use AAAA-MM-DD", parent=self.app)
+                return
+
+        def importado(resultado):
+            self.btn_importar.config(state="normal")
+            self.mostrar_resultado_importacion(resultado)
 
-        if not pacientes:
-            messagebox.showwarning("Aviso", "No hay pacientes para exportar.", parent=self.app)
+        def fallido(e):
+            self.btn_importar.config(state="normal")
+            self.info_label.config(text="")
+            messagebox.showerror("Error", f"No se pudieron importar las citas: {e}", parent=self.app)
+
+        self.btn_importar.config(state="disabled")
+        self.info_label.config(text="Importando citas...")
+        self.tareas.enviar(importar_citas_csv, ruta, fecha, clave='importar', al_terminar=importado, al_fallar=fallido)
+
+    def mostrar_resultado_importacion(self, resultado):
+        errores = resultado['errores']
+        self.info_label.config(text=f"Importados {resultado['pacientes']} pacientes, {resultado['turnos']} turnos")
+        if not errores:
+            messagebox.showinfo("Éxito", "Citas importadas correctamente.", parent=self.app)
+            return
+
+        detalle = "\n".join(f"Fila {fila}: {mensaje}" for fila, mensaje in errores[:10])
+        if len(errores) > 10:
+            detalle += f"\n... y {len(errores) - 10} más"
+        if not messagebox.askyesno(
+            "Filas con errores",
+            f"{len(errores)} filas no se importaron:\n{detalle}\n\n¿Guardar el reporte de errores?",
+            parent=self.app
+        ):
             return
 
         filepath = filedialog.asksaveasfilename(
             defaultextension=".csv",
             filetypes=[("Archivo CSV", "*.csv")],
             parent=self.app,
-            title="Guardar reporte CSV"
+            title="Guardar reporte de errores"
         )
         if not filepath:
             return
-
         try:
             with open(filepath, mode='w', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
-                writer.writerow(["ID", "Nombre", "Especialidad", "Consultorio", "Fecha Registro", "Atendido", "Fecha Atención"])
-                for p in pacientes:
-                    writer.writerow([
-                        p.get("paciente_id", ""),
-                        p.get("nombre", ""),
-                        p.get("especialidad", ""),
-                        p.get("consultorio", ""),
-                        p.get("fecha_registro", ""),
-                        "Sí" if p.get("atendido") else "No",
-                        p.get("fecha_atencion", "")
-                    ])
-            messagebox.showinfo("Éxito", "Reporte CSV exportado correctamente.", parent=self.app)
+                writer.writerow(["Fila", "Error"])
+                writer.writerows(errores)
         except Exception as e:
-            messagebox.showerror("Error", f"No se pudo exportar CSV: {e}", parent=self.app)
-
-    def exportar_pdf_func(self, pacientes):
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib import colors
-        from tkinter import filedialog, messagebox
+            messagebox.showerror("Error", f"No se pudo guardar el reporte: {e}", parent=self.app)
 
-        if not pacientes:
-            messagebox.showwarning("Aviso", "No hay pacientes para exportar.", parent=self.app)
+    def exportar_func(self, formato, desde, hasta, nombre, especialidad, consultorio):
+        try:
+            desde = datetime.strptime(desde.strip(), "%Y-%m-%d").date()
+            hasta = datetime.strptime(hasta.strip(), "%Y-%m-%d").date()
+        except ValueError:
+            messagebox.showerror("Error", "Fechas no válidas, use AAAA-MM-DD", parent=self.app)
+            return
+        if hasta < desde:
+            messagebox.showerror("Error", "La fecha final no puede ser anterior a la inicial", parent=self.app)
             return
 
+        extension = ".pdf" if formato == "pdf" else ".csv"
         filepath = filedialog.asksaveasfilename(
-            defaultextension=".pdf",
-            filetypes=[("Archivo PDF", "*.pdf")],
+            defaultextension=extension,
+            filetypes=[("Archivo PDF", "*.pdf")] if formato == "pdf" else [("Archivo CSV", "*.csv")],
             parent=self.app,
-            title="Guardar reporte PDF"
+            title=f"Guardar reporte {formato.upper()}"
         )
         if not filepath:
             return
 
-        try:
-            doc = SimpleDocTemplate(filepath, pagesize=landscape(letter))
-            data = [["ID", "Nombre", "Especialidad", "Consultorio", "Fecha Registro", "Atendido", "Fecha Atención"]]
-            for p in pacientes:
-                data.append([
-                    p.get("paciente_id", ""),
-                    p.get("nombre", ""),
-                    p.get("especialidad", ""),
-                    p.get("consultorio", ""),
-                    p.get("fecha_registro", ""),
-                    "Sí" if p.get("atendido") else "No",
-                    p.get("fecha_atencion", "")
-                ])
-
-            table = Table(data)
-            style = TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.lightblue),
-                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0,0), (-1,0), 12),
-                ('GRID', (0,0), (-1,-1), 1, colors.black),
-            ])
-            table.setStyle(style)
-
-            elems = [table]
-            doc.build(elems)
-
-            messagebox.showinfo("Éxito", "Reporte PDF exportado correctamente.", parent=self.app)
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo exportar PDF: {e}", parent=self.app)
+        def exportado(total):
+            if not total:
+                messagebox.showwarning("Aviso", "No hay pacientes para exportar.", parent=self.app)
+            else:
+                messagebox.showinfo("Éxito", f"Reporte {formato.upper()} exportado correctamente ({total} turnos).", parent=self.app)
+
+        # Los rangos largos tardan: el reporte se genera en el ejecutor
+        self.tareas.enviar(
+            exportar_reporte, filepath, formato, desde, hasta, nombre, especialidad, consultorio,
+            al_terminar=exportado,
+            al_fallar=lambda e: messagebox.showerror("Error", f"No se pudo exportar {formato.upper()}: {e}", parent=self.app)
+        )
 
     def mostrar_reporte(self):
         reporte_win = tb.Toplevel(self.app)
@@ -357,6 +502,18 @@ class ModuloAdmision:
         consultorio_filtro = tb.Combobox(filtro_frame, textvariable=consultorio_filtro_var, values=[""] + consultorios, state="readonly", bootstyle="secondary")
         consultorio_filtro.grid(row=0, column=5, padx=5)
 
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        tb.Label(filtro_frame, text="Desde:", width=15).grid(row=1, column=0, padx=5, pady=(8,0))
+        desde_var = StringVar(value=hoy)
+        tb.Entry(filtro_frame, textvariable=desde_var, bootstyle="info").grid(row=1, column=1, padx=5, pady=(8,0))
+        tb.Label(filtro_frame, text="Hasta:", width=18).grid(row=1, column=2, padx=5, pady=(8,0))
+        hasta_var = StringVar(value=hoy)
+        tb.Entry(filtro_frame, textvariable=hasta_var, bootstyle="info").grid(row=1, column=3, padx=5, pady=(8,0))
+
+        def exportar(formato):
+            self.exportar_func(formato, desde_var.get(), hasta_var.get(), nombre_filtro_var.get().strip(),
+                               especialidad_filtro_var.get(), consultorio_filtro_var.get())
+
         filtro_frame.columnconfigure(1, weight=1)
         filtro_frame.columnconfigure(3, weight=1)
         filtro_frame.columnconfigure(5, weight=1)
@@ -365,46 +522,41 @@ class ModuloAdmision:
         btn_frame.pack(anchor="ne", pady=(0,10))
 
         btn_export_csv = tb.Button(btn_frame, text="Exportar CSV", bootstyle="success-outline", width=15,
-                                   command=lambda: self.exportar_csv_func(filtrar_pacientes()))
+                                   command=lambda: exportar("csv"))
         btn_export_csv.pack(side="left", padx=5)
 
         btn_export_pdf = tb.Button(btn_frame, text="Exportar PDF", bootstyle="primary-outline", width=15,
-                                   command=lambda: self.exportar_pdf_func(filtrar_pacientes()))
+                                   command=lambda: exportar("pdf"))
         btn_export_pdf.pack(side="left", padx=5)
 
         btn_editar = tb.Button(btn_frame, text="Editar Paciente", bootstyle="warning-outline", width=15,
-                               command=lambda: self.editar_paciente_popup(tree))
+                               command=lambda: self.editar_paciente_popup(tabla))
         btn_editar.pack(side="left", padx=5)
 
         btn_actualizar = tb.Button(btn_frame, text="Actualizar Lista", bootstyle="info-outline", width=15,
-                                   command=lambda: llenar_tabla(filtrar_pacientes()))
+                                   command=self.recargar_datos)
         btn_actualizar.pack(side="left", padx=5)
 
         columnas = ("ID", "Nombre", "Especialidad", "Consultorio", "Fecha Registro", "Atendido", "Fecha Atención")
 
-        # Contenedor para Treeview + scrollbar
-        contenedor = tb.Frame(frame)
-        contenedor.pack(fill="both", expand=True)
-
-        tree = ttk.Treeview(contenedor, columns=columnas, show="headings", selectmode="browse")
-        tree.grid(row=0, column=0, sticky="nsew")
+        # Solo se dibujan las filas visibles; los datos quedan en un almacén por columnas
+        tabla = TablaVirtual(frame, columnas)
+        tabla.frame.pack(fill="both", expand=True)
 
-        vsb = tk.Scrollbar(contenedor, orient="vertical", command=tree.yview)
-        vsb.grid(row=0, column=1, sticky="ns")
+        total_label = tb.Label(frame, text="", font=("Segoe UI", 10))
+        total_label.pack(anchor="w", pady=(5,0))
 
-        tree.configure(yscrollcommand=vsb.set)
+        # Turnos de un rango distinto de hoy; con None se muestran los datos del día en vivo
+        rango = {'pacientes': None}
+        # El índice de filtros se arma con la primera búsqueda después de cada carga
+        indice = [None]
 
-        contenedor.grid_rowconfigure(0, weight=1)
-        contenedor.grid_columnconfigure(0, weight=1)
-
-        for col in columnas:
-            tree.heading(col, text=col)
-            tree.column(col, anchor="w", width=130)
-
-        def llenar_tabla(pacientes):
-            tree.delete(*tree.get_children())
+        def llenar_tabla():
+            pacientes = rango['pacientes'] if rango['pacientes'] is not None else self.datos.get('pacientes', [])
+            filas = []
+            claves = []
             for p in pacientes:
-                tree.insert("", "end", values=(
+                filas.append((
                     p.get("paciente_id", ""),
                     p.get("nombre", ""),
                     p.get("especialidad", ""),
@@ -413,45 +565,92 @@ class ModuloAdmision:
                     "Sí" if p.get("atendido") else "No",
                     p.get("fecha_atencion", "")
                 ))
+                # Un paciente puede tener dos turnos en el mismo consultorio
+                claves.append(p.get("turno_id"))
+            tabla.cargar(filas, claves)
+            indice[0] = None
+            filtrar_pacientes()
 
         def filtrar_pacientes():
-            self.datos = cargar_datos()  # Recarga datos actualizados
-            nombre_f = nombre_filtro_var.get().lower()
+            nombre_f = nombre_filtro_var.get().strip()
             esp_f = especialidad_filtro_var.get()
             cons_f = consultorio_filtro_var.get()
 
-            pacientes_filtrados = []
-            for p in self.datos.get('pacientes', []):
-                nombre_p = p.get('nombre', '').lower()
-                if nombre_f and nombre_f not in nombre_p:
-                    continue
-
-                esp_p = p.get('especialidad', '')
-                if esp_f and esp_f != esp_p:
-                    continue
-
-                cons_p = p.get('consultorio', '')
-                if cons_f and cons_f != cons_p:
-                    continue
-
-                pacientes_filtrados.append(p)
-            return pacientes_filtrados
-
-        nombre_filtro_var.trace_add("write", lambda *args: llenar_tabla(filtrar_pacientes()))
-        especialidad_filtro_var.trace_add("write", lambda *args: llenar_tabla(filtrar_pacientes()))
-        consultorio_filtro_var.trace_add("write", lambda *args: llenar_tabla(filtrar_pacientes()))
-
-        llenar_tabla(self.datos.get('pacientes', []))
+            if not (nombre_f or esp_f or cons_f):
+                tabla.filtrar(None)
+            else:
+                # Búsqueda sin tildes ni mayúsculas: "nunez" encuentra "Núñez"
+                if indice[0] is None:
+                    indice[0] = IndiceFiltro(tabla.datos[1], tabla.datos[2], tabla.datos[3])
+                tabla.filtrar(indice[0].filtrar(nombre_f, esp_f, cons_f))
+            total_label.config(text=f"{tabla.total_visibles()} turnos")
+
+        filtro_pendiente = [None]
+        def filtrar_al_terminar_de_escribir(*args):
+            # Se filtra una sola vez cuando se deja de escribir
+            if filtro_pendiente[0]:
+                reporte_win.after_cancel(filtro_pendiente[0])
+            filtro_pendiente[0] = reporte_win.after(150, filtrar_pacientes)
+
+        nombre_filtro_var.trace_add("write", filtrar_al_terminar_de_escribir)
+        especialidad_filtro_var.trace_add("write", filtrar_al_terminar_de_escribir)
+        consultorio_filtro_var.trace_add("write", filtrar_al_terminar_de_escribir)
+
+        def ver_rango():
+            try:
+                desde = datetime.strptime(desde_var.get().strip(), "%Y-%m-%d").date()
+                hasta = datetime.strptime(hasta_var.get().strip(), "%Y-%m-%d").date()
+            except ValueError:
+                messagebox.showerror("Error", "Fechas no válidas, use AAAA-MM-DD", parent=reporte_win)
+                return
+            if hasta < desde:
+                messagebox.showerror("Error", "La fecha final no puede ser anterior a la inicial", parent=reporte_win)
+                return
+            if desde == hasta == datetime.now().date():
+                rango['pacientes'] = None
+                llenar_tabla()
+                return
 
-    def editar_paciente_popup(self, tree):
-        seleccion = tree.selection()
-        if not seleccion:
+            def cargado(pacientes):
+                if not reporte_win.winfo_exists():
+                    return
+                btn_rango.config(state="normal")
+                rango['pacientes'] = pacientes
+                llenar_tabla()
+
+            def fallido(e):
+                if reporte_win.winfo_exists():
+                    btn_rango.config(state="normal")
+                    messagebox.showerror("Error", f"No se pudo cargar el rango: {e}", parent=reporte_win)
+
+            btn_rango.config(state="disabled")
+            total_label.config(text="Cargando...")
+            self.tareas.enviar(lambda: list(iterar_turnos_rango(desde, hasta)), clave='reporte_rango',
+                               al_terminar=cargado, al_fallar=fallido)
+
+        btn_rango = tb.Button(btn_frame, text="Ver Rango", bootstyle="secondary-outline", width=15, command=ver_rango)
+        btn_rango.pack(side="left", padx=5)
+
+        llenar_tabla()
+
+        # Con la ventana abierta, cada recarga de los datos del día refresca la tabla
+        def datos_actualizados():
+            if rango['pacientes'] is None:
+                llenar_tabla()
+        self.al_actualizar_datos = datos_actualizados
+        def cerrar_reporte():
+            self.al_actualizar_datos = None
+            reporte_win.destroy()
+        reporte_win.protocol("WM_DELETE_WINDOW", cerrar_reporte)
+
+    def editar_paciente_popup(self, tabla):
+        valores = tabla.valores_seleccionados()
+        if not valores:
             messagebox.showwarning("Aviso", "Seleccione un paciente para editar.", parent=self.app)
             return
-        
-        item = tree.item(seleccion[0])
-        valores = item['values']
+
         paciente_id = valores[0]
+        turno_id = tabla.seleccion
 
         nombre_actual = valores[1]
         especialidad_actual = valores[2]
@@ -493,44 +692,31 @@ class ModuloAdmision:
                 messagebox.showerror("Error", "Debe seleccionar un consultorio.", parent=popup)
                 return
 
-            try:
-                self.actualizar_paciente(paciente_id, nuevo_nombre, nueva_esp, nuevo_cons)
-                messagebox.showinfo("Éxito", "Paciente actualizado correctamente.", parent=popup)
-                popup.destroy()
-                self.datos = cargar_datos()
-            except Exception as e:
-                messagebox.showerror("Error", f"No se pudo actualizar el paciente: {e}", parent=popup)
+            def actualizado(_):
+                if popup.winfo_exists():
+                    messagebox.showinfo("Éxito", "Paciente actualizado correctamente.", parent=popup)
+                    popup.destroy()
+                self.recargar_datos()
+
+            def fallido(e):
+                if popup.winfo_exists():
+                    btn_guardar.config(state="normal")
+                    messagebox.showerror("Error", f"No se pudo actualizar el paciente: {e}", parent=popup)
+
+            btn_guardar.config(state="disabled")
+            self.tareas.enviar(
+                self.actualizar_paciente, paciente_id, nuevo_nombre, nueva_esp, nuevo_cons, turno_id,
+                clave=('editar', turno_id),
+                al_terminar=actualizado,
+                al_fallar=fallido
+            )
 
         btn_guardar = tb.Button(popup, text="Guardar Cambios", bootstyle="success", command=guardar_cambios)
         btn_guardar.pack(pady=20)
 
-    def actualizar_paciente(self, paciente_id, nuevo_nombre, nueva_especialidad, nuevo_consultorio):
-        conexion = None
-        try:
-            conexion = obtener_conexion()
-            with conexion.cursor() as cursor:
-                cursor.execute("UPDATE pacientes SET nombre = %s WHERE id = %s", (nuevo_nombre, paciente_id))
-
-                cursor.execute("SELECT id FROM especialidades WHERE nombre = %s", (nueva_especialidad,))
-                esp_id = cursor.fetchone()
-                if not esp_id:
-                    raise Exception("Especialidad no encontrada")
-                esp_id = esp_id[0]
-
-                cursor.execute("""
-                    UPDATE pacientes_especialidades 
-                    SET especialidad_id = %s, consultorio = %s 
-                    WHERE paciente_id = %s
-                """, (esp_id, nuevo_consultorio, paciente_id))
-
-                conexion.commit()
-        except Exception as e:
-            if conexion:
-                conexion.rollback()
-            raise e
-        finally:
-            if conexion:
-                liberar_conexion(conexion)
+    def actualizar_paciente(self, paciente_id, nuevo_nombre, nueva_especialidad, nuevo_consultorio, turno_id=None):
+        # La actualización vive en hospital_lib para poder hacerse también a través del hub
+        actualizar_paciente(paciente_id, nuevo_nombre, nueva_especialidad, nuevo_consultorio, turno_id)
 
     def run(self):
         self.app.mainloop()
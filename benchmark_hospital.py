@@ -0,0 +1,451 @@
+import argparse
+import contextlib
+import json
+import math
+import random
+import string
+import sys
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+import hospital_lib
+from hospital_lib import (
+    DB_CONFIG,
+    POOL_CONFIG,
+    CANAL_CAMBIOS,
+    SENTENCIAS_PREPARADAS,
+    SQL_COLA_CONSULTORIO,
+    SQL_COLA_CONSULTORIO_DELTA,
+    SQL_HISTORIAL_PAGINA,
+    SQL_PACIENTES_DELTA,
+    SQL_ESTADO_DIA,
+    SQL_LLAMAR_SIGUIENTE,
+    SQL_REGISTRAR_PACIENTE,
+    registrar_sentencia,
+    asegurar_preparada,
+    sentencia_execute,
+    PoolConexiones,
+    SnapshotDia,
+    EstadoConsultorio,
+    parametros_conexion,
+    estadisticas_pool,
+    cargar_datos,
+    llamar_siguiente_paciente,
+    guardar_paciente_multiple_especialidades,
+)
+from migraciones import aplicar_migraciones
+
+# La base de producción configurada; el benchmark se niega a sembrar sobre ella
+BASE_PRODUCCION = DB_CONFIG['dbname']
+
+ESPECIALIDADES = [
+    "Medicina General", "Pediatría", "Ginecología", "Odontología", "Cardiología", "Traumatología",
+    "Dermatología", "Oftalmología", "Psicología", "Nutrición", "Obstetricia", "Neumología"
+]
+
+# Sentencias ejecutadas por el hilo actual, para contar consultas por operación
+_contador = threading.local()
+_cursores_contados = {}
+
+def consultas_hilo():
+    return getattr(_contador, 'total', 0)
+
+def _sumar_consulta():
+    _contador.total = consultas_hilo() + 1
+
+def _cursor_contado(base):
+    if base not in _cursores_contados:
+        def execute(self, *args, **kwargs):
+            _sumar_consulta()
+            return base.execute(self, *args, **kwargs)
+
+        def executemany(self, *args, **kwargs):
+            _sumar_consulta()
+            return base.executemany(self, *args, **kwargs)
+
+        def copy_expert(self, *args, **kwargs):
+            _sumar_consulta()
+            return base.copy_expert(self, *args, **kwargs)
+
+        _cursores_contados[base] = type(f"{base.__name__}Contado", (base,), {
+            'execute': execute,
+            'executemany': executemany,
+            'copy_expert': copy_expert
+        })
+    return _cursores_contados[base]
+
+class ConexionContada(psycopg2.extensions.connection):
+    # Envuelve la fábrica de cursores que pida cada función (RealDictCursor, DictCursor...)
+    def cursor(self, *args, **kwargs):
+        fabrica = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _cursor_contado(fabrica)
+        return super().cursor(*args, **kwargs)
+
+def preparar_base(base):
+    # Crea la base del benchmark si no existe (conectando a la base de mantenimiento)
+    conexion = psycopg2.connect(**{**DB_CONFIG, 'dbname': 'postgres'})
+    try:
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (base,))
+            if not cursor.fetchone():
+                cursor.execute(f'CREATE DATABASE "{base}"')
+                print(f"Base {base} creada", file=sys.stderr)
+    finally:
+        conexion.close()
+
+def sembrar(pacientes_dia, dias_historia, pacientes_historia, consultorios):
+    # Vacía las tablas y siembra la historia más la cola de hoy (un tercio ya atendido)
+    conexion = psycopg2.connect(**parametros_conexion())
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("""
+                TRUNCATE ultimos_llamados, pacientes_especialidades, pacientes, especialidades, resumen_colas
+                RESTART IDENTITY CASCADE
+            """)
+            cursor.execute("INSERT INTO especialidades (nombre) SELECT unnest(%s::text[])", (ESPECIALIDADES,))
+            cursor.execute("""
+                INSERT INTO pacientes (id, nombre, fecha_registro, atendido)
+                SELECT g, 'Paciente ' || g,
+                       CASE WHEN g <= %(historia)s
+                            THEN CURRENT_DATE - (1 + (g - 1) / %(por_dia_historia)s) * INTERVAL '1 day'
+                                 + ((g - 1) %% %(por_dia_historia)s) * INTERVAL '20 seconds'
+                            ELSE CURRENT_DATE + (g - %(historia)s) * INTERVAL '1 second'
+                       END,
+                       FALSE
+                FROM generate_series(1, %(historia)s + %(hoy)s) g
+            """, {
+                'historia': dias_historia * pacientes_historia,
+                'por_dia_historia': max(pacientes_historia, 1),
+                'hoy': pacientes_dia
+            })
+            cursor.execute("""
+                INSERT INTO pacientes_especialidades
+                    (paciente_id, especialidad_id, consultorio, fecha_registro, atendido, fecha_atencion)
+                SELECT p.id, 1 + p.id %% %(especialidades)s, 'Consultorio ' || (1 + p.id %% %(consultorios)s),
+                       p.fecha_registro, a.atendido,
+                       CASE WHEN a.atendido THEN p.fecha_registro + INTERVAL '30 minutes' END
+                FROM pacientes p,
+                     LATERAL (SELECT p.fecha_registro < CURRENT_DATE OR p.id %% 3 = 0 AS atendido) a
+                ORDER BY p.id
+            """, {'especialidades': len(ESPECIALIDADES), 'consultorios': consultorios})
+            cursor.execute("SELECT setval(pg_get_serial_sequence('pacientes', 'id'), (SELECT max(id) FROM pacientes))")
+            for tabla in ("especialidades", "pacientes", "pacientes_especialidades", "ultimos_llamados"):
+                cursor.execute(f"ANALYZE {tabla}")
+        conexion.commit()
+    finally:
+        conexion.close()
+
+def percentil(ordenados, p):
+    # Rango más cercano: el valor bajo el cual queda el p% de las muestras
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p * len(ordenados) / 100) - 1))
+    return ordenados[indice]
+
+class Medicion:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.registrando = False
+        self.muestras = {}
+
+    def medir(self, operacion, funcion, *args):
+        consultas = consultas_hilo()
+        inicio = time.perf_counter()
+        error = None
+        try:
+            resultado = funcion(*args)
+        except Exception as e:
+            resultado = None
+            error = e
+        duracion = time.perf_counter() - inicio
+        if self.registrando:
+            with self._lock:
+                datos = self.muestras.setdefault(operacion, {'tiempos': [], 'consultas': 0, 'errores': 0, 'vacias': 0})
+                datos['tiempos'].append(duracion)
+                datos['consultas'] += consultas_hilo() - consultas
+                if error is not None:
+                    datos['errores'] += 1
+                elif resultado is None:
+                    datos['vacias'] += 1
+        if error is not None and self.registrando:
+            print(f"Error en {operacion}: {error}", file=sys.stderr)
+        return resultado
+
+    def resumen(self, segundos):
+        operaciones = {}
+        for operacion, datos in sorted(self.muestras.items()):
+            tiempos = sorted(datos['tiempos'])
+            total = len(tiempos)
+            operaciones[operacion] = {
+                'total': total,
+                'errores': datos['errores'],
+                'sin_resultado': datos['vacias'],
+                'por_segundo': round(total / segundos, 1),
+                'promedio_ms': round(1000 * sum(tiempos) / total, 3),
+                'p50_ms': round(1000 * percentil(tiempos, 50), 3),
+                'p95_ms': round(1000 * percentil(tiempos, 95), 3),
+                'p99_ms': round(1000 * percentil(tiempos, 99), 3),
+                'max_ms': round(1000 * tiempos[-1], 3),
+                'consultas_por_op': round(datos['consultas'] / total, 2)
+            }
+        return operaciones
+
+def cliente_consultorio(medicion, consultorio, hasta, pausa):
+    # Lo que hace un consultorio en hora punta: llama al siguiente y refresca sus listas
+    estado = EstadoConsultorio(consultorio)
+    while time.monotonic() < hasta:
+        medicion.medir('llamar_siguiente', llamar_siguiente_paciente, consultorio)
+        medicion.medir('cola_consultorio', estado.actualizar)
+        time.sleep(pausa)
+
+def cliente_admision(medicion, consultorios, hasta, pausa, semilla):
+    azar = random.Random(semilla)
+    while time.monotonic() < hasta:
+        nombre = "".join(azar.choice(string.ascii_letters) for _ in range(12))
+        cantidad = azar.choice((1, 1, 1, 2))
+        especialidades = azar.sample(ESPECIALIDADES, cantidad)
+        lista_consultorios = [f"Consultorio {azar.randint(1, consultorios)}" for _ in range(cantidad)]
+        medicion.medir('registrar_paciente', guardar_paciente_multiple_especialidades,
+                       nombre, especialidades, lista_consultorios)
+        # La carga completa del día, sin caché: lo que crece con la cola
+        medicion.medir('cargar_datos', cargar_datos, False)
+        time.sleep(pausa)
+
+def cliente_pantalla(medicion, hasta, pausa):
+    # Una sala de espera: carga incremental sobre su propio snapshot
+    snapshot = SnapshotDia()
+    while time.monotonic() < hasta:
+        medicion.medir('carga_incremental', snapshot.actualizar)
+        time.sleep(pausa)
+
+def ejemplos_sentencias(cursor):
+    # Parámetros típicos de cada sentencia frecuente, tomados de la base sembrada
+    cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) - 50 AS watermark, now() AS ahora")
+    base = cursor.fetchone()
+    return {
+        'cola_consultorio': (SQL_COLA_CONSULTORIO, {
+            'consultorio': 'Consultorio 1', 'limite_espera': 100, 'limite_historial': 30}),
+        'cola_consultorio_delta': (SQL_COLA_CONSULTORIO_DELTA, {
+            'consultorio': 'Consultorio 1', 'watermark': base['watermark'], 'conocidos': [1, 2, 3]}),
+        'historial_pagina': (SQL_HISTORIAL_PAGINA, {
+            'consultorio': 'Consultorio 1', 'fecha_atencion': base['ahora'], 'turno_id': 2 ** 62, 'limite': 30}),
+        'pacientes_delta': (SQL_PACIENTES_DELTA, (base['watermark'],)),
+        'estado_dia': (SQL_ESTADO_DIA, None),
+        'llamar_siguiente': (SQL_LLAMAR_SIGUIENTE, {'consultorio': 'Consultorio 1', 'canal': CANAL_CAMBIOS}),
+        'registrar_paciente': (SQL_REGISTRAR_PACIENTE, {
+            'nombre': 'Paciente Benchmark', 'especialidades': [1], 'consultorios': ['Consultorio 1'],
+            'canal': CANAL_CAMBIOS})
+    }
+
+def _tiempo_planificacion(cursor, texto, valores):
+    cursor.execute("EXPLAIN (ANALYZE, TIMING OFF, FORMAT JSON) " + texto, valores)
+    return cursor.fetchone()['QUERY PLAN'][0]['Planning Time']
+
+def medir_sentencias(repeticiones):
+    # Cada sentencia frecuente como texto (PostgreSQL la analiza y planifica cada vez)
+    # y como sentencia preparada, en la misma conexión. Cada ejecución se deshace
+    # con rollback, así que las escrituras no cambian la cola sembrada. Las que
+    # hospital_lib no registra se registran solo mientras se miden.
+    conexion = psycopg2.connect(**parametros_conexion())
+    resultados = {}
+    try:
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejemplos = ejemplos_sentencias(cursor)
+            conexion.rollback()
+            for nombre, (sql, parametros) in ejemplos.items():
+                registrada = sql in SENTENCIAS_PREPARADAS
+                if not registrada:
+                    registrar_sentencia(f"bench_{nombre}", sql)
+                try:
+                    asegurar_preparada(cursor, sql)
+                    texto_preparada, valores = sentencia_execute(sql, parametros)
+                finally:
+                    if not registrada:
+                        del SENTENCIAS_PREPARADAS[sql]
+                variantes = {'texto': (sql, parametros), 'preparada': (texto_preparada, valores)}
+                datos = {'registrada': registrada}
+                for variante, (texto, valores_texto) in variantes.items():
+                    tiempos = []
+                    planificacion = []
+                    for _ in range(repeticiones):
+                        inicio = time.perf_counter()
+                        cursor.execute(texto, valores_texto)
+                        cursor.fetchall()
+                        tiempos.append(time.perf_counter() - inicio)
+                        conexion.rollback()
+                        planificacion.append(_tiempo_planificacion(cursor, texto, valores_texto))
+                        conexion.rollback()
+                    tiempos.sort()
+                    planificacion.sort()
+                    datos[variante] = {
+                        'p50_ms': round(1000 * percentil(tiempos, 50), 3),
+                        'p95_ms': round(1000 * percentil(tiempos, 95), 3),
+                        'planificacion_p50_ms': round(percentil(planificacion, 50), 3)
+                    }
+                resultados[nombre] = datos
+    finally:
+        conexion.close()
+    return resultados
+
+def ejecutar(args, pacientes_dia):
+    sembrar(pacientes_dia, args.dias_historia, args.pacientes_historia, args.consultorios)
+
+    # Pool nuevo por escalón, con conexiones que cuentan sus sentencias
+    hilos_totales = args.consultorios_concurrentes + args.admisiones + args.pantallas
+    if hospital_lib.connection_pool is not None:
+        hospital_lib.connection_pool.closeall()
+    hospital_lib.connection_pool = PoolConexiones(
+        POOL_CONFIG['minimo'],
+        args.pool_maximo or hilos_totales + 2,
+        POOL_CONFIG['espera'],
+        {**parametros_conexion(), 'connection_factory': ConexionContada}
+    )
+    hospital_lib.mapa_especialidades(recargar=True)
+
+    medicion = Medicion()
+    inicio = time.monotonic()
+    hasta = inicio + args.calentamiento + args.duracion
+    pausa = args.pausa_ms / 1000
+    hilos = []
+    for i in range(args.consultorios_concurrentes):
+        consultorio = str(1 + i % args.consultorios)
+        hilos.append(threading.Thread(target=cliente_consultorio, args=(medicion, consultorio, hasta, pausa)))
+    for i in range(args.admisiones):
+        hilos.append(threading.Thread(target=cliente_admision, args=(medicion, args.consultorios, hasta, pausa, args.semilla + i)))
+    for _ in range(args.pantallas):
+        hilos.append(threading.Thread(target=cliente_pantalla, args=(medicion, hasta, max(pausa, 0.5))))
+
+    for hilo in hilos:
+        hilo.start()
+    # Lo que ocurre durante el calentamiento (conexiones nuevas, cachés frías) no se cuenta
+    time.sleep(args.calentamiento)
+    medicion.registrando = True
+    inicio_medicion = time.monotonic()
+    for hilo in hilos:
+        hilo.join()
+    medicion.registrando = False
+    segundos = time.monotonic() - inicio_medicion
+
+    resultado = {
+        'pacientes_dia': pacientes_dia,
+        'duracion_s': round(segundos, 2),
+        'operaciones': medicion.resumen(segundos),
+        'pool': estadisticas_pool()
+    }
+    if args.sentencias:
+        resultado['sentencias'] = medir_sentencias(args.sentencias)
+    return resultado
+
+def comparar(resultados, referencia, tolerancia):
+    # Regresión: p95 más lento que la referencia en más de la tolerancia, o más consultas por operación
+    regresiones = []
+    anteriores = {r['pacientes_dia']: r for r in referencia['resultados']}
+    for resultado in resultados:
+        anterior = anteriores.get(resultado['pacientes_dia'])
+        if not anterior:
+            continue
+        for operacion, datos in resultado['operaciones'].items():
+            previo = anterior['operaciones'].get(operacion)
+            if not previo:
+                continue
+            if datos['p95_ms'] > previo['p95_ms'] * (1 + tolerancia):
+                regresiones.append(f"{operacion} ({resultado['pacientes_dia']}/día): p95 {previo['p95_ms']} -> {datos['p95_ms']} ms")
+            if datos['consultas_por_op'] > previo['consultas_por_op']:
+                regresiones.append(f"{operacion} ({resultado['pacientes_dia']}/día): consultas por operación "
+                                   f"{previo['consultas_por_op']} -> {datos['consultas_por_op']}")
+    return regresiones
+
+def imprimir(resultado):
+    print(f"== {resultado['pacientes_dia']} pacientes en la cola de hoy, {resultado['duracion_s']} s ==", file=sys.stderr)
+    print(f"{'operación':<24}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}{'errores':>9}", file=sys.stderr)
+    for operacion, datos in resultado['operaciones'].items():
+        print(f"{operacion:<24}{datos['por_segundo']:>9}{datos['p50_ms']:>10}{datos['p95_ms']:>10}"
+              f"{datos['p99_ms']:>10}{datos['consultas_por_op']:>11}{datos['errores']:>9}", file=sys.stderr)
+    if 'sentencias' in resultado:
+        print(f"{'sentencia':<24}{'texto p50':>11}{'prep. p50':>11}{'plan texto':>12}{'plan prep.':>12}  (ms)",
+              file=sys.stderr)
+        for nombre, datos in resultado['sentencias'].items():
+            texto, preparada = datos['texto'], datos['preparada']
+            print(f"{nombre:<24}{texto['p50_ms']:>11}{preparada['p50_ms']:>11}"
+                  f"{texto['planificacion_p50_ms']:>12}{preparada['planificacion_p50_ms']:>12}"
+                  f"{'' if datos['registrada'] else '  (no registrada)'}", file=sys.stderr)
+
+def _lista_enteros(texto):
+    try:
+        return [int(valor) for valor in texto.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Lista no válida: {texto} (use por ejemplo 200,1000,5000)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark de las operaciones de la cola contra una base PostgreSQL de pruebas. "
+                    "El resumen sale por stderr y el resultado JSON por stdout (o --salida)."
+    )
+    parser.add_argument("--base", default="hospital_bench", help="Base de pruebas (se vacía y se siembra)")
+    parser.add_argument("--pacientes-dia", type=_lista_enteros, default=[200, 1000, 5000],
+                        help="Tamaños de la cola de hoy a medir, separados por comas")
+    parser.add_argument("--dias-historia", type=int, default=90)
+    parser.add_argument("--pacientes-historia", type=int, default=400, help="Pacientes por día de historia")
+    parser.add_argument("--consultorios", type=int, default=14)
+    parser.add_argument("--consultorios-concurrentes", type=int, default=8, help="Clientes de consultorio simultáneos")
+    parser.add_argument("--admisiones", type=int, default=2, help="Clientes de admisión simultáneos")
+    parser.add_argument("--pantallas", type=int, default=1, help="Salas de espera con carga incremental")
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos medidos por escalón")
+    parser.add_argument("--calentamiento", type=float, default=1.0)
+    parser.add_argument("--pausa-ms", type=float, default=0.0, help="Pausa de cada cliente entre iteraciones")
+    parser.add_argument("--pool-maximo", type=int, help="Por defecto, un lugar por cliente más dos")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior: falla si hay regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Aumento de p95 tolerado al comparar")
+    parser.add_argument("--sin-preparar", action="store_true",
+                        help="Ejecuta las sentencias frecuentes como texto, sin prepararlas (para comparar)")
+    parser.add_argument("--sentencias", type=int, default=0, metavar="N",
+                        help="Mide además N ejecuciones de cada sentencia frecuente, como texto y preparada")
+    args = parser.parse_args()
+
+    if hospital_lib.HUB_DIRECCION:
+        print("El benchmark necesita acceso directo a la base: quite la variable HOSPITAL_HUB", file=sys.stderr)
+        sys.exit(1)
+    if args.base == BASE_PRODUCCION:
+        print(f"La base {args.base} es la configurada para producción; use otra con --base", file=sys.stderr)
+        sys.exit(1)
+
+    POOL_CONFIG['preparar'] = not args.sin_preparar
+    # Sin --salida, stdout es solo el JSON: los avisos de hospital_lib van a stderr
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            preparar_base(args.base)
+            DB_CONFIG['dbname'] = args.base
+            aplicar_migraciones()
+            resultados = []
+            for pacientes_dia in args.pacientes_dia:
+                resultado = ejecutar(args, pacientes_dia)
+                imprimir(resultado)
+                resultados.append(resultado)
+    except psycopg2.Error as e:
+        print(f"Error de base de datos: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    informe = {
+        'fecha': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'configuracion': {clave: valor for clave, valor in vars(args).items() if clave not in ('salida', 'comparar')},
+        'resultados': resultados
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False, default=str)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar(resultados, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"Regresión: {regresion}", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
@@ -3,36 +3,36 @@ import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from tkinter import messagebox, ttk
 from datetime import datetime
-import threading
-import time
+import sys
 from hospital_lib import (
-    cargar_datos,
-    cargar_logo,
     llamar_siguiente_paciente,
-    obtener_pacientes_espera_consultorio,
-    obtener_historial_atencion_consultorio,
     guardar_ultimo_llamado,
-    marcar_paciente_atendido,
+    suscribir_cambios,
+    EstadoConsultorio,
+    EsquemaDesactualizado,
+    marcar_hito,
+    reportar_arranque,
 )
+from widgets import EjecutorTareas, ListaConClaves, cargar_logo
 
 class ModuloConsultorio:
     def __init__(self, consultorio_id):
-        print("Iniciando módulo consultorio...")  # Diagnóstico
         self.consultorio_id = str(consultorio_id)
-        self.datos = cargar_datos()
-        print(f"Datos cargados: {len(self.datos.get('pacientes', []))} pacientes")  # Diagnóstico
+        # Solo la cola de este consultorio: la primera carga en el ejecutor, una vez que
+        # la ventana está a la vista, y después solo los turnos que cambian
+        self.estado = EstadoConsultorio(self.consultorio_id)
+        self.listas = None  # Lo último que se mostró, para usarlo desde la ventana
+        self.cargando = True
         self.app = tb.Window(themename="flatly")
         self.app.title(f"Consultorio {self.consultorio_id} - Hospital de Apoyo Palpa")
         self.app.geometry("1000x700")
+        self.tareas = EjecutorTareas(self.app)
 
         self.setup_ui()
-        print("Interfaz configurada")  # Diagnóstico
         self.setup_hotkeys()
         self.refresh_data_thread()
-        print("Hilo de refresco iniciado")  # Diagnóstico
 
     def setup_ui(self):
-        print("Configurando UI...")  # Diagnóstico
         header = tb.Frame(self.app, padding=10)
         header.pack(fill="x")
 
@@ -78,6 +78,7 @@ class ModuloConsultorio:
         scrollbar_wait = tb.Scrollbar(espera_frame, command=self.wait_tree.yview, bootstyle="secondary")
         scrollbar_wait.pack(side="right", fill="y")
         self.wait_tree.configure(yscrollcommand=scrollbar_wait.set)
+        self.lista_espera = ListaConClaves(self.wait_tree)
 
         hist_frame = tb.Labelframe(lists_frame, text="Historial de Hoy", bootstyle="secondary")
         hist_frame.pack(side="left", fill="both", expand=True, padx=5)
@@ -93,117 +94,142 @@ class ModuloConsultorio:
 
         scrollbar_hist = tb.Scrollbar(hist_frame, command=self.hist_tree.yview, bootstyle="secondary")
         scrollbar_hist.pack(side="right", fill="y")
+        self.btn_mas_historial = tb.Button(hist_frame, text="Ver más", bootstyle="secondary-link", command=self.ver_mas_historial)
         self.hist_tree.configure(yscrollcommand=scrollbar_hist.set)
-        print("UI configurada completamente")  # Diagnóstico
+        self.lista_historial = ListaConClaves(self.hist_tree)
+        self.lista_espera.actualizar([("cargando", ("", "Cargando...", ""))])
+        marcar_hito('ventana creada')
+        self.app.after_idle(marcar_hito, 'ventana visible')
 
     def setup_hotkeys(self):
-        print("Configurando hotkeys...")  # Diagnóstico
         self.app.bind('<F2>', lambda e: self.llamar_siguiente())
         self.app.bind('<F4>', lambda e: self.re_llamar_paciente())
-        print("Hotkeys configuradas")  # Diagnóstico
 
     def llamar_siguiente(self):
-        print("Intentando llamar siguiente paciente...")  # Diagnóstico
-        try:
-            paciente = llamar_siguiente_paciente(self.consultorio_id)
-            if not paciente:
-               messagebox.showinfo("Info", "No hay pacientes en espera para este consultorio", parent=self.app)
-               self.status_label.config(text="LIBRE", bootstyle="success")
-               self.paciente_label.config(text="")
-               print("No hay pacientes en espera")  # Diagnóstico
-               return
-
-            self.status_label.config(text="OCUPADO", bootstyle="danger")
-            nombre = paciente.get('nombre', '')
-            consultorio = paciente.get('consultorio', f"Consultorio {self.consultorio_id}")
-            self.paciente_label.config(text=f"Paciente: {nombre} ({consultorio})")
-            mensaje = f"Paciente {nombre}, favor pasar al {consultorio}"
-            guardar_ultimo_llamado(mensaje)
-
-            # USAR paciente['paciente_id'] SIEMPRE
-            marcar_paciente_atendido(paciente['paciente_id'], consultorio)
-
-            self.datos = cargar_datos()
-            self.actualizar_listas()
-            print(f"Llamado a paciente {nombre}")  # Diagnóstico
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo llamar al paciente: {e}", parent=self.app)
-            print(f"Error en llamar_siguiente: {e}")  # Diagnóstico
+        # La consulta corre fuera de la ventana; un F2 repetido no encola otra llamada
+        # Un solo viaje: marca el turno, guarda el anuncio y avisa a las pantallas
+        self.tareas.enviar(
+            llamar_siguiente_paciente,
+            self.consultorio_id,
+            clave='llamar_siguiente',
+            al_terminar=self._mostrar_llamado,
+            al_fallar=lambda e: self._mostrar_error("No se pudo llamar al paciente", e)
+        )
+
+    def _mostrar_llamado(self, paciente):
+        if not paciente:
+            messagebox.showinfo("Info", "No hay pacientes en espera para este consultorio", parent=self.app)
+            self.status_label.config(text="LIBRE", bootstyle="success")
+            self.paciente_label.config(text="")
+            print("No hay pacientes en espera")  # Diagnóstico
+            return
+
+        self.status_label.config(text="OCUPADO", bootstyle="danger")
+        nombre = paciente.get('nombre', '')
+        consultorio = paciente.get('consultorio', f"Consultorio {self.consultorio_id}")
+        self.paciente_label.config(text=f"Paciente: {nombre} ({consultorio})")
+        self.refrescar_listas()
+        print(f"Llamado a paciente {nombre}")  # Diagnóstico
+
+    def _mostrar_error(self, titulo, error):
+        messagebox.showerror("Error", f"{titulo}: {error}", parent=self.app)
+        print(f"{titulo}: {error}")  # Diagnóstico
 
     def re_llamar_paciente(self):
-        import datetime
-        print("Intentando re-llamar paciente...")  # Diagnóstico
-        try:
-            selected = self.hist_tree.selection()
-            if selected:
-               item = self.hist_tree.item(selected[0])
-               vals = item['values']
-               paciente_nombre = vals[1]
-               consultorio = self.consultorio_id
-               # Puedes personalizar el mensaje aquí:
-               ts = datetime.datetime.now().strftime("%H:%M:%S")
-               mensaje = f"{ts} Paciente {paciente_nombre}, favor pasar al consultorio {consultorio}"
-               messagebox.showinfo("Re-llamar Paciente", f"Paciente: {paciente_nombre}\nConsultorio: {consultorio}", parent=self.app)
-               guardar_ultimo_llamado(mensaje)
-               self.datos = cargar_datos()
-               self.actualizar_listas()
-               print(f"Re-llamado a paciente {paciente_nombre}")  # Diagnóstico
-            else:
-                # Si no hay selección, puedes seguir usando el último del historial como antes:
-                hist = obtener_historial_atencion_consultorio(self.consultorio_id)
-                if not hist:
-                    messagebox.showinfo("Info", "No hay historial de atenciones para re-llamar", parent=self.app)
-                    print("No hay historial para re-llamar")  # Diagnóstico
-                    return
-                ultimo = sorted(hist, key=lambda x: x.get('fecha_atencion', ''), reverse=True)[0]
-                ts = datetime.datetime.now().strftime("%H:%M:%S")
-                mensaje = f"{ts} Paciente {ultimo['nombre']}, favor pasar al consultorio {self.consultorio_id}"
-                messagebox.showinfo("Re-llamar Paciente", f"Paciente: {ultimo['nombre']}\nConsultorio: {self.consultorio_id}", parent=self.app)
-                guardar_ultimo_llamado(mensaje)
-                self.datos = cargar_datos()
-                self.actualizar_listas()
-                print(f"Re-llamado a paciente {ultimo['nombre']}")  # Diagnóstico
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo re-llamar al paciente: {e}", parent=self.app)
-            print(f"Error en re_llamar_paciente: {e}")  # Diagnóstico
-
-    def actualizar_listas(self):
-        print("Actualizando listas...")  # Diagnóstico
-        self.wait_tree.delete(*self.wait_tree.get_children())
-        self.hist_tree.delete(*self.hist_tree.get_children())
-
-        try:
-            espera = obtener_pacientes_espera_consultorio(self.consultorio_id)
-            if espera:
-               for p in espera:
-                   especialidad = p.get('especialidad', '')
-                   consultorio = p.get('consultorio', '')
-                   self.wait_tree.insert("", "end", values=(
-                      p['paciente_id'], p['nombre'], f"{especialidad} - {consultorio}"
-                ))
-            else:
-                self.wait_tree.insert("", "end", values=("", "Sin pacientes en espera", ""))
-
-            hist = obtener_historial_atencion_consultorio(self.consultorio_id)
-            if hist:
-               print("Historial recibido ordenado por fecha_atencion DESC:")
-               for p in hist:
-                   print(f"{p['paciente_id']} - {p['nombre']} - {p['fecha_atencion']}")  # Debug
-
-                # Insertar los pacientes tal cual vienen en la lista (debería ser descendente)
-               for p in hist:
-                   especialidad = p.get('especialidad', '')
-                   consultorio = p.get('consultorio', '')
-                   self.hist_tree.insert("", "end", values=(
-                       p['paciente_id'], p['nombre'], f"{especialidad} - {consultorio}"
-                ))
-            else:
-                self.hist_tree.insert("", "end", values=("", "Sin historial de hoy", ""))
-
-            print("Listas actualizadas correctamente")  # Diagnóstico
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al actualizar listas: {e}", parent=self.app)
-            print(f"Error en actualizar_listas: {e}")  # Diagnóstico
+        selected = self.hist_tree.selection()
+        if selected:
+            item = self.hist_tree.item(selected[0])
+            vals = item['values']
+            self._re_llamar(vals[1])
+        else:
+            # Sin selección se re-llama al último atendido, que ya está en el estado local
+            historial = self.listas['historial'] if self.listas else []
+            if not historial:
+                messagebox.showinfo("Info", "No hay historial de atenciones para re-llamar", parent=self.app)
+                print("No hay historial para re-llamar")  # Diagnóstico
+                return
+            self._re_llamar(historial[0]['nombre'])
+
+    def _re_llamar(self, paciente_nombre):
+        consultorio = self.consultorio_id
+        # Puedes personalizar el mensaje aquí:
+        ts = datetime.now().strftime("%H:%M:%S")
+        mensaje = f"{ts} Paciente {paciente_nombre}, favor pasar al consultorio {consultorio}"
+        messagebox.showinfo("Re-llamar Paciente", f"Paciente: {paciente_nombre}\nConsultorio: {consultorio}", parent=self.app)
+        self.tareas.enviar(
+            guardar_ultimo_llamado,
+            mensaje,
+            clave='re_llamar',
+            al_terminar=lambda _: print(f"Re-llamado a paciente {paciente_nombre}"),  # Diagnóstico
+            al_fallar=lambda e: self._mostrar_error("No se pudo re-llamar al paciente", e)
+        )
+
+    def refrescar_listas(self):
+        # Se puede llamar desde el hilo de avisos; si ya hay una consulta en curso se
+        # repite una vez al terminar en vez de encolar otra.
+        self.tareas.enviar(
+            self.estado.actualizar,
+            clave='listas',
+            repetir=True,
+            al_terminar=self.actualizar_listas,
+            al_fallar=self._error_listas
+        )
+
+    def _error_listas(self, e):
+        print(f"Error al refrescar datos: {e}")
+        if self.cargando:
+            # Se reintenta con el próximo aviso o con el de respaldo; con la base sin
+            # migrar no sirve reintentar y se muestra qué hacer
+            aviso = str(e) if isinstance(e, EsquemaDesactualizado) else "Sin conexión, reintentando..."
+            self.lista_espera.actualizar([("cargando", ("", aviso, ""))])
+
+    def ver_mas_historial(self):
+        self.tareas.enviar(
+            self.estado.mas_historial,
+            clave='mas_historial',
+            al_terminar=self.actualizar_listas,
+            al_fallar=self._error_listas
+        )
+
+    def actualizar_listas(self, listas):
+        self.listas = listas
+        espera = listas['espera']
+        hist = listas['historial']
+        if self.cargando:
+            self.cargando = False
+            marcar_hito('primeros datos')
+            reportar_arranque('consultoria')
+
+        # Solo se tocan las filas que cambiaron, por turno
+        filas = []
+        for p in espera:
+            especialidad = p.get('especialidad', '')
+            consultorio = p.get('consultorio', '')
+            filas.append((p['turno_id'], (
+                p['paciente_id'], p['nombre'], f"{especialidad} - {consultorio}"
+            )))
+        if not filas:
+            filas.append(("vacio", ("", "Sin pacientes en espera", "")))
+        elif listas['total_espera'] > len(espera):
+            filas.append(("mas", ("", f"... y {listas['total_espera'] - len(espera)} más", "")))
+        self.lista_espera.actualizar(filas)
+
+        # El historial viene de la atención más reciente a la más antigua
+        filas = []
+        for p in hist:
+            especialidad = p.get('especialidad', '')
+            consultorio = p.get('consultorio', '')
+            filas.append((p['turno_id'], (
+                p['paciente_id'], p['nombre'], f"{especialidad} - {consultorio}"
+            )))
+        if not filas:
+            filas.append(("vacio", ("", "Sin historial de hoy", "")))
+        self.lista_historial.actualizar(filas)
+
+        if listas['total_historial'] > len(hist):
+            self.btn_mas_historial.pack(side="bottom", before=self.hist_tree)
+        else:
+            self.btn_mas_historial.pack_forget()
 
 
     def _formatear_hora(self, fecha):
@@ -216,19 +242,12 @@ class ModuloConsultorio:
         return ""
 
     def refresh_data_thread(self):
-        print("Iniciando hilo de refresco de datos...")  # Diagnóstico
-        def refrescar():
-            while True:
-                try:
-                    self.datos = cargar_datos()
-                    self.actualizar_listas()
-                except Exception as e:
-                    print(f"Error al refrescar datos: {e}")
-                time.sleep(3)
-        threading.Thread(target=refrescar, daemon=True).start()
+        # Cada aviso de cambio (o el de respaldo) pide una consulta al ejecutor;
+        # los widgets solo se tocan desde el hilo de la ventana.
+        suscribir_cambios(lambda evento: self.refrescar_listas())
+        self.refrescar_listas()
 
     def run(self):
-        print("Ejecutando mainloop...")  # Diagnóstico
         self.app.protocol("WM_DELETE_WINDOW", self.app.destroy)
         self.app.mainloop()
 
@@ -272,27 +291,17 @@ class SelectorConsultorioDialog:
 
 
 if __name__ == "__main__":
-    selector = SelectorConsultorioDialog()
-
-    if selector.result is None:
-        print("No se seleccionó consultorio. Saliendo...")
-        exit()
-
-    print(f"Consultorio seleccionado: {selector.result}")
-    app = ModuloConsultorio(selector.result)
+    # En los quioscos el consultorio puede venir como argumento y se omite el diálogo
+    if len(sys.argv) > 1:
+        consultorio = sys.argv[1]
+    else:
+        selector = SelectorConsultorioDialog()
+
+        if selector.result is None:
+            print("No se seleccionó consultorio. Saliendo...")
+            exit()
+        consultorio = selector.result
+
+    print(f"Consultorio seleccionado: {consultorio}")
+    app = ModuloConsultorio(consultorio)
     app.run()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
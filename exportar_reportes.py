@@ -0,0 +1,130 @@
+import argparse
+import csv
+import sys
+from datetime import date, datetime
+from hospital_lib import iterar_turnos_rango
+
+ENCABEZADOS = ["ID", "Nombre", "Especialidad", "Consultorio", "Fecha Registro", "Atendido", "Fecha Atención"]
+
+# Filas por tabla del PDF: cada tabla se parte sola entre páginas repitiendo el encabezado
+FILAS_POR_TABLA = 500
+
+def _formato_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    return valor or ""
+
+def fila_reporte(p):
+    return [
+        p.get("paciente_id", ""),
+        p.get("nombre", ""),
+        p.get("especialidad", ""),
+        p.get("consultorio", ""),
+        _formato_fecha(p.get("fecha_registro")),
+        "Sí" if p.get("atendido") else "No",
+        _formato_fecha(p.get("fecha_atencion"))
+    ]
+
+def escribir_csv(ruta, pacientes):
+    total = 0
+    with open(ruta, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(ENCABEZADOS)
+        for p in pacientes:
+            writer.writerow(fila_reporte(p))
+            total += 1
+    return total
+
+class _TablasPendientes(list):
+    # reportlab consume los flowables con len(), [0] y del [0]; esta lista se va
+    # rellenando desde un generador para no tener todas las tablas a la vez en memoria.
+    def __init__(self, generador):
+        super().__init__()
+        self._generador = generador
+
+    def _rellenar(self, cantidad):
+        while self._generador is not None and list.__len__(self) < cantidad:
+            try:
+                self.append(next(self._generador))
+            except StopIteration:
+                self._generador = None
+
+    def __len__(self):
+        self._rellenar(2)
+        return list.__len__(self)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, int) and indice >= 0:
+            self._rellenar(indice + 1)
+        return list.__getitem__(self, indice)
+
+def escribir_pdf(ruta, pacientes, titulo=None, filas_por_tabla=FILAS_POR_TABLA):
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib import colors
+
+    style = TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.lightblue),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,0), 12),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+    ])
+    total = [0]
+
+    def tablas():
+        if titulo:
+            yield Paragraph(titulo, getSampleStyleSheet()['Title'])
+        data = [ENCABEZADOS]
+        for p in pacientes:
+            data.append([str(valor) for valor in fila_reporte(p)])
+            total[0] += 1
+            if len(data) > filas_por_tabla:
+                yield Table(data, style=style, repeatRows=1)
+                data = [ENCABEZADOS]
+        if len(data) > 1 or not total[0]:
+            yield Table(data, style=style, repeatRows=1)
+
+    doc = SimpleDocTemplate(ruta, pagesize=landscape(letter))
+    doc.build(_TablasPendientes(tablas()))
+    return total[0]
+
+def exportar_reporte(ruta, formato, desde, hasta, nombre=None, especialidad=None, consultorio=None):
+    pacientes = iterar_turnos_rango(desde, hasta, nombre, especialidad, consultorio)
+    if formato == 'pdf':
+        titulo = f"Reporte de Pacientes {desde}" if desde == hasta else f"Reporte de Pacientes {desde} a {hasta}"
+        return escribir_pdf(ruta, pacientes, titulo)
+    return escribir_csv(ruta, pacientes)
+
+def _fecha(texto):
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha no válida: {texto} (use AAAA-MM-DD)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el reporte de pacientes de un rango de fechas")
+    parser.add_argument("salida", help="Archivo a generar (.csv o .pdf)")
+    parser.add_argument("--desde", type=_fecha, default=date.today())
+    parser.add_argument("--hasta", type=_fecha)
+    parser.add_argument("--formato", choices=["csv", "pdf"])
+    parser.add_argument("--nombre")
+    parser.add_argument("--especialidad")
+    parser.add_argument("--consultorio")
+    args = parser.parse_args()
+
+    hasta = args.hasta or args.desde
+    if hasta < args.desde:
+        print("La fecha final no puede ser anterior a la inicial")
+        sys.exit(1)
+    formato = args.formato or ('pdf' if args.salida.lower().endswith('.pdf') else 'csv')
+
+    try:
+        total = exportar_reporte(args.salida, formato, args.desde, hasta,
+                                 args.nombre, args.especialidad, args.consultorio)
+    except Exception as e:
+        print(f"Error al exportar el reporte: {e}")
+        sys.exit(1)
+    print(f"Reporte {formato.upper()} generado en {args.salida}: {total} turnos")
@@ -1,11 +1,58 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor, DictCursor
-from psycopg2.pool import SimpleConnectionPool
-import tkinter as tk
-from datetime import datetime
-from PIL import Image, ImageTk
+import psycopg2.pool
+import psycopg2.extensions
+import psycopg2.errors
+import weakref
+from datetime import datetime, date, timedelta
 import os
+import configparser
 import sys
+import re
+import csv
+import json
+import tempfile
+import unicodedata
+import queue
+import select
+import socket
+import functools
+import inspect
+import atexit
+import collections
+import collections.abc
+import copy
+import bisect
+from array import array
+import threading
+import time
+
+# Hitos del arranque (segundos desde la importación de este módulo). Con
+# HOSPITAL_PERFIL_ARRANQUE=<archivo> cada programa añade ahí una línea JSON con
+# sus hitos al recibir los primeros datos; perfil_arranque.py la recoge.
+PERFIL_ARRANQUE = os.environ.get('HOSPITAL_PERFIL_ARRANQUE')
+_hitos_arranque = [('importar hospital_lib', time.time())]
+
+def marcar_hito(nombre):
+    _hitos_arranque.append((nombre, time.time()))
+
+def hitos_arranque():
+    inicio = _hitos_arranque[0][1]
+    return [(nombre, round(momento - inicio, 3)) for nombre, momento in _hitos_arranque]
+
+def reportar_arranque(programa):
+    hitos = hitos_arranque()
+    print(f"Arranque de {programa}: " + ", ".join(f"{nombre} {segundos:.3f}s" for nombre, segundos in hitos))
+    if PERFIL_ARRANQUE:
+        try:
+            with open(PERFIL_ARRANQUE, 'a', encoding='utf-8') as archivo:
+                archivo.write(json.dumps({
+                    'programa': programa,
+                    'inicio': _hitos_arranque[0][1],
+                    'hitos': hitos
+                }) + "\n")
+        except OSError as e:
+            print(f"Error al guardar el perfil de arranque: {e}")
 
 DB_CONFIG = {
     'dbname': 'hospital',
@@ -15,71 +62,958 @@ DB_CONFIG = {
     'port': '5432'
 }
 
-connection_pool = SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    **DB_CONFIG
-)
+# Tamaño del pool y segundos máximos de espera por una conexión libre
+POOL_CONFIG = {
+    'minimo': 1,
+    'maximo': 10,
+    'espera': 10.0,
+    # Sentencias frecuentes preparadas una vez por conexión (ver registrar_sentencia)
+    'preparar': True
+}
+
+# Conexiones ociosas por más de estos segundos se verifican antes de entregarse
+VERIFICAR_CONEXION_TRAS = 60
+
+# Keepalives de TCP: una conexión cortada por la red se detecta en lugar de colgarse
+KEEPALIVES = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3
+}
+
+# Archivos que cada puesto genera por su cuenta (frases de voz, imágenes, trazas)
+CARPETA_CACHE = os.path.join(tempfile.gettempdir(), 'hospital_cache')
+
+# Trazas de las funciones de base de datos: las llamadas que superan 'lenta_ms'
+# van al registro de consultas lentas y cada 'intervalo_resumen' segundos se
+# añade un resumen a 'carpeta' (trazas_hospital.py los muestra). Vienen apagadas:
+# se activan con HOSPITAL_TRAZAS_ACTIVAS=1 o 'activas = si' en la sección [trazas]
+# de hospital.ini, y solo entonces se arranca el hilo que vuelca los resúmenes.
+TRAZAS_CONFIG = {
+    'activas': False,
+    'lenta_ms': 250.0,
+    'intervalo_resumen': 60.0,
+    'capacidad': 2000,
+    'carpeta': os.path.join(CARPETA_CACHE, 'trazas'),
+    # Los valores de los argumentos y los mensajes de error pueden incluir nombres de
+    # pacientes: por defecto el registro de llamadas lentas guarda solo su tipo
+    'argumentos': False
+}
+
+def _convertir(actual, valor):
+    if isinstance(actual, bool):
+        return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+    return type(actual)(valor)
+
+def _cargar_configuracion():
+    # hospital.ini (o el archivo de HOSPITAL_CONFIG), secciones [base_datos], [pool] y
+    # [trazas]; luego las variables HOSPITAL_DB_<CLAVE>, HOSPITAL_POOL_<CLAVE> y
+    # HOSPITAL_TRAZAS_<CLAVE> tienen prioridad.
+    ruta = os.environ.get('HOSPITAL_CONFIG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hospital.ini')
+    if os.path.exists(ruta):
+        config = configparser.ConfigParser()
+        config.read(ruta, encoding='utf-8')
+        if config.has_section('base_datos'):
+            DB_CONFIG.update(config['base_datos'])
+        for seccion, valores in (('pool', POOL_CONFIG), ('trazas', TRAZAS_CONFIG)):
+            if config.has_section(seccion):
+                for clave in valores:
+                    if clave in config[seccion]:
+                        valores[clave] = _convertir(valores[clave], config[seccion][clave])
+
+    for clave in ('dbname', 'user', 'password', 'host', 'port'):
+        valor = os.environ.get(f'HOSPITAL_DB_{clave.upper()}')
+        if valor:
+            DB_CONFIG[clave] = valor
+    for prefijo, valores in (('POOL', POOL_CONFIG), ('TRAZAS', TRAZAS_CONFIG)):
+        for clave in valores:
+            valor = os.environ.get(f'HOSPITAL_{prefijo}_{clave.upper()}')
+            if valor:
+                valores[clave] = _convertir(valores[clave], valor)
+
+_cargar_configuracion()
+
+def parametros_conexion():
+    return {**DB_CONFIG, **KEEPALIVES}
+
+# El pool se crea recién en la primera consulta: un cliente que trabaja a través
+# del hub de colas nunca abre conexiones a PostgreSQL.
+connection_pool = None
+_pool_lock = threading.Lock()
+
+# Si está definida (host:puerto), los módulos trabajan contra hub_colas.py
+# en lugar de conectarse directamente a la base de datos.
+HUB_DIRECCION = os.environ.get('HOSPITAL_HUB')
+# Secreto compartido entre el hub y sus clientes; sin él el hub no atiende
+HUB_TOKEN = os.environ.get('HOSPITAL_HUB_TOKEN')
+HUB_PUERTO = 8765
+HUB_TIMEOUT = 15
+
+# Canal de PostgreSQL por el que se avisan los cambios de la cola
+CANAL_CAMBIOS = 'hospital_cambios'
+# Si no llega ningún aviso en este tiempo se fuerza una recarga de respaldo
+INTERVALO_RESPALDO = 30
+
+# Sentencias preparadas: texto SQL (con %s o %(nombre)s, como en cursor.execute) ->
+# nombre en el servidor, texto con $1..$n y orden de los parámetros. Una consulta
+# frecuente se suma con registrar_sentencia y se ejecuta con ejecutar_preparada.
+# Solo conviene si PostgreSQL termina usando el plan genérico: las que filtran por
+# un rango que cambia en cada llamada (watermark, página de historial) se
+# replanifican siempre y no se registran (benchmark_hospital.py --sentencias).
+SENTENCIAS_PREPARADAS = {}
+_PATRON_PARAMETRO = re.compile(r"%\((\w+)\)s|%s|%%")
+# Conexión -> nombres ya preparados en su sesión; una conexión nueva empieza vacía
+_preparadas_por_conexion = weakref.WeakKeyDictionary()
+_preparadas_lock = threading.Lock()
+_estadisticas_sentencias = {'preparaciones': 0, 'ejecuciones': 0, 'repreparaciones': 0}
+
+def registrar_sentencia(nombre, sql):
+    nombres = []
+    posicionales = 0
+
+    def reemplazar(marca):
+        nonlocal posicionales
+        if marca.group(0) == '%%':
+            return '%'
+        if marca.group(1):
+            if marca.group(1) not in nombres:
+                nombres.append(marca.group(1))
+            return f"${nombres.index(marca.group(1)) + 1}"
+        posicionales += 1
+        return f"${posicionales}"
+
+    texto = _PATRON_PARAMETRO.sub(reemplazar, sql)
+    if nombres and posicionales:
+        raise ValueError(f"La sentencia {nombre} mezcla parámetros %s y %(nombre)s")
+    SENTENCIAS_PREPARADAS[sql] = {
+        'nombre': f"hospital_{nombre}",
+        'texto': texto,
+        'parametros': nombres or posicionales
+    }
+    return sql
+
+def sentencia_execute(sql, parametros=None):
+    # EXECUTE con los valores en el orden de $1..$n; psycopg2 los adapta como siempre
+    sentencia = SENTENCIAS_PREPARADAS[sql]
+    if isinstance(sentencia['parametros'], list):
+        valores = [parametros[nombre] for nombre in sentencia['parametros']]
+    else:
+        valores = list(parametros or ())
+    if not valores:
+        return f"EXECUTE {sentencia['nombre']}", None
+    return f"EXECUTE {sentencia['nombre']}({', '.join(['%s'] * len(valores))})", valores
+
+def _olvidar_preparadas(conexion):
+    with _preparadas_lock:
+        _preparadas_por_conexion.pop(conexion, None)
+
+def asegurar_preparada(cursor, sql):
+    # PREPARE no se deshace con un rollback, así que basta con hacerlo una vez por sesión
+    sentencia = SENTENCIAS_PREPARADAS[sql]
+    conexion = cursor.connection
+    with _preparadas_lock:
+        preparadas = _preparadas_por_conexion.setdefault(conexion, set())
+        if sentencia['nombre'] in preparadas:
+            return
+    cursor.execute(f"PREPARE {sentencia['nombre']} AS {sentencia['texto']}")
+    with _preparadas_lock:
+        preparadas.add(sentencia['nombre'])
+        _estadisticas_sentencias['preparaciones'] += 1
+
+def ejecutar_preparada(cursor, sql, parametros=None):
+    # Las sentencias registradas se analizan una vez por conexión y, tras unas
+    # ejecuciones, PostgreSQL reutiliza su plan. El resto va por cursor.execute.
+    if sql not in SENTENCIAS_PREPARADAS or not POOL_CONFIG['preparar']:
+        cursor.execute(sql, parametros)
+        return
+    conexion = cursor.connection
+    al_inicio = conexion.autocommit or \
+        conexion.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    asegurar_preparada(cursor, sql)
+    texto, valores = sentencia_execute(sql, parametros)
+    try:
+        cursor.execute(texto, valores)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # La sesión perdió sus sentencias (DISCARD ALL, un pooler en el medio...)
+        _olvidar_preparadas(conexion)
+        if not al_inicio:
+            raise
+        conexion.rollback()
+        asegurar_preparada(cursor, sql)
+        cursor.execute(texto, valores)
+        with _preparadas_lock:
+            _estadisticas_sentencias['repreparaciones'] += 1
+    with _preparadas_lock:
+        _estadisticas_sentencias['ejecuciones'] += 1
+
+def estadisticas_sentencias():
+    with _preparadas_lock:
+        estadisticas = dict(_estadisticas_sentencias)
+        estadisticas['conexiones'] = len(_preparadas_por_conexion)
+    estadisticas['registradas'] = len(SENTENCIAS_PREPARADAS)
+    return estadisticas
+
+# Consultas de la cola del día. Filtran fecha_registro por rango semiabierto
+# (y no con ::date) para que PostgreSQL pueda usar los índices de migraciones.py.
+SQL_PACIENTES_ESPERA = """
+    SELECT 
+        pe.paciente_id, 
+        p.nombre, 
+        e.nombre as especialidad, 
+        pe.consultorio, 
+        pe.atendido, 
+        pe.fecha_registro
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+    WHERE pe.consultorio = %s
+      AND pe.atendido = FALSE
+      AND pe.fecha_registro >= CURRENT_DATE
+      AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+    ORDER BY pe.fecha_registro ASC
+"""
+registrar_sentencia('pacientes_espera', SQL_PACIENTES_ESPERA)
+
+SQL_HISTORIAL_ATENCION = """
+    SELECT 
+        pe.paciente_id, 
+        p.nombre, 
+        e.nombre AS especialidad,
+        pe.consultorio, 
+        pe.fecha_registro, 
+        pe.atendido, 
+        pe.fecha_atencion
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+    WHERE pe.consultorio = %s
+      AND pe.atendido = TRUE
+      AND pe.fecha_registro >= CURRENT_DATE
+      AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+      -- Implícito (se atiende después de registrarse) pero permite usar idx_pe_historial
+      AND pe.fecha_atencion >= CURRENT_DATE
+    ORDER BY pe.fecha_atencion DESC
+"""
+registrar_sentencia('historial_atencion', SQL_HISTORIAL_ATENCION)
+
+SQL_PACIENTES_DIA = """
+    SELECT 
+        pe.id AS turno_id,
+        pe.paciente_id,
+        p.nombre,
+        e.nombre AS especialidad,
+        pe.consultorio,
+        pe.fecha_registro,
+        pe.atendido,
+        pe.fecha_atencion
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+    WHERE pe.fecha_registro >= CURRENT_DATE
+      AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+    ORDER BY pe.fecha_registro
+"""
+
+SQL_PACIENTES_DELTA = """
+    SELECT
+        pe.id AS turno_id,
+        pe.paciente_id,
+        p.nombre,
+        e.nombre AS especialidad,
+        pe.consultorio,
+        pe.fecha_registro,
+        pe.atendido,
+        pe.fecha_atencion
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+    WHERE pe.txid_cambio >= %s
+      AND pe.fecha_registro >= CURRENT_DATE
+      AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+    ORDER BY pe.fecha_registro
+"""
+
+SQL_ESTADO_DIA = """
+    SELECT
+        txid_snapshot_xmin(txid_current_snapshot()) AS watermark,
+        CURRENT_DATE AS fecha,
+        (SELECT mensaje FROM ultimos_llamados ORDER BY fecha DESC LIMIT 1) AS ultimo_llamado
+"""
+registrar_sentencia('estado_dia', SQL_ESTADO_DIA)
+
+SQL_LLAMAR_SIGUIENTE = """
+    WITH siguiente AS (
+        SELECT pe.id, pe.fecha_registro
+        FROM pacientes_especialidades pe
+        WHERE pe.consultorio = %(consultorio)s
+          AND pe.atendido = FALSE
+          AND pe.fecha_registro >= CURRENT_DATE
+          AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+        ORDER BY pe.fecha_registro, pe.id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ),
+    atendido AS (
+        -- Se marca solo el turno elegido; fecha_registro permite podar particiones
+        UPDATE pacientes_especialidades pe
+        SET atendido = TRUE,
+            fecha_atencion = CURRENT_TIMESTAMP
+        FROM siguiente
+        WHERE pe.id = siguiente.id
+          AND pe.fecha_registro = siguiente.fecha_registro
+        RETURNING pe.id AS turno_id, pe.paciente_id, pe.especialidad_id, pe.consultorio
+    ),
+    llamado AS (
+        INSERT INTO ultimos_llamados (mensaje)
+        SELECT 'Paciente ' || p.nombre || ', favor pasar al ' || a.consultorio
+        FROM atendido a
+        JOIN pacientes p ON p.id = a.paciente_id
+        RETURNING mensaje
+    ),
+    aviso AS (
+        SELECT pg_notify(%(canal)s, json_build_object(
+            'tipo', 'atencion',
+            'paciente_id', a.paciente_id,
+            'consultorio', a.consultorio
+        )::text)
+        FROM atendido a
+    )
+    SELECT a.turno_id, a.paciente_id, p.nombre, e.nombre AS especialidad, a.consultorio, l.mensaje
+    FROM atendido a
+    JOIN pacientes p ON p.id = a.paciente_id
+    JOIN especialidades e ON e.id = a.especialidad_id
+    CROSS JOIN llamado l
+    CROSS JOIN aviso
+"""
+registrar_sentencia('llamar_siguiente', SQL_LLAMAR_SIGUIENTE)
+
+class PoolConexiones:
+    # Pool seguro entre hilos: quien no encuentra conexión libre espera hasta
+    # 'espera' segundos en lugar de fallar, las conexiones caídas o viejas se
+    # descartan al entregarlas y se lleva la cuenta de esperas y agotamientos.
+    def __init__(self, minimo, maximo, espera, parametros):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.espera = espera
+        self.parametros = parametros
+        self._libres = []
+        self._ocupadas = set()
+        self._abiertas = 0
+        self._condicion = threading.Condition()
+        self._estadisticas = {
+            'adquisiciones': 0,
+            'esperas': 0,
+            'tiempo_espera_total': 0.0,
+            'tiempo_espera_max': 0.0,
+            'tiempo_adquisicion_total': 0.0,
+            'agotamientos': 0,
+            'creadas': 0,
+            'descartadas': 0
+        }
+        for _ in range(minimo):
+            self._libres.append((self._conectar(), time.monotonic()))
+            self._abiertas += 1
+
+    def _conectar(self):
+        conexion = psycopg2.connect(**self.parametros)
+        with self._condicion:
+            self._estadisticas['creadas'] += 1
+        return conexion
+
+    def _sana(self, conexion, libre_desde):
+        if conexion.closed:
+            return False
+        if time.monotonic() - libre_desde < VERIFICAR_CONEXION_TRAS:
+            return True
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conexion.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        inicio = time.monotonic()
+        limite = inicio + self.espera
+        espero = False
+        with self._condicion:
+            while True:
+                if self._libres:
+                    conexion, libre_desde = self._libres.pop()
+                    break
+                if self._abiertas < self.maximo:
+                    # Se reserva el lugar y se conecta fuera del lock
+                    self._abiertas += 1
+                    conexion = None
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._estadisticas['agotamientos'] += 1
+                    raise psycopg2.pool.PoolError(
+                        f"Pool agotado: {self.maximo} conexiones ocupadas por más de {self.espera:g} s"
+                    )
+                espero = True
+                self._condicion.wait(restante)
+
+        try:
+            if conexion is not None and not self._sana(conexion, libre_desde):
+                with self._condicion:
+                    self._estadisticas['descartadas'] += 1
+                try:
+                    conexion.close()
+                except psycopg2.Error:
+                    pass
+                conexion = None
+            if conexion is None:
+                conexion = self._conectar()
+        except Exception:
+            with self._condicion:
+                self._abiertas -= 1
+                self._condicion.notify()
+            raise
+
+        fin = time.monotonic()
+        with self._condicion:
+            self._ocupadas.add(id(conexion))
+            self._estadisticas['adquisiciones'] += 1
+            self._estadisticas['tiempo_adquisicion_total'] += fin - inicio
+            if espero:
+                self._estadisticas['esperas'] += 1
+                self._estadisticas['tiempo_espera_total'] += fin - inicio
+                self._estadisticas['tiempo_espera_max'] = max(self._estadisticas['tiempo_espera_max'], fin - inicio)
+        return conexion
+
+    def putconn(self, conexion):
+        reutilizable = not conexion.closed
+        if reutilizable:
+            try:
+                # Solo se hace rollback si quedó una transacción abierta
+                if conexion.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conexion.rollback()
+                # Las consultas de una sola sentencia usan autocommit: la conexión
+                # vuelve al pool como la espera el resto del código
+                if conexion.autocommit:
+                    conexion.autocommit = False
+            except psycopg2.Error:
+                reutilizable = False
+        with self._condicion:
+            self._ocupadas.discard(id(conexion))
+            if reutilizable and len(self._libres) < self.maximo:
+                self._libres.append((conexion, time.monotonic()))
+            else:
+                self._abiertas -= 1
+                if not conexion.closed:
+                    conexion.close()
+            self._condicion.notify()
+
+    def estadisticas(self):
+        with self._condicion:
+            datos = dict(self._estadisticas)
+            datos['abiertas'] = self._abiertas
+            datos['ocupadas'] = len(self._ocupadas)
+            datos['libres'] = len(self._libres)
+            datos['maximo'] = self.maximo
+        if datos['adquisiciones']:
+            datos['adquisicion_promedio_ms'] = round(1000 * datos['tiempo_adquisicion_total'] / datos['adquisiciones'], 3)
+        if datos['esperas']:
+            datos['espera_promedio_ms'] = round(1000 * datos['tiempo_espera_total'] / datos['esperas'], 3)
+        return datos
+
+    def closeall(self):
+        with self._condicion:
+            for conexion, _ in self._libres:
+                conexion.close()
+            self._abiertas -= len(self._libres)
+            self._libres = []
+
+def _obtener_pool():
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is None:
+            connection_pool = PoolConexiones(
+                POOL_CONFIG['minimo'],
+                POOL_CONFIG['maximo'],
+                POOL_CONFIG['espera'],
+                parametros_conexion()
+            )
+        return connection_pool
 
 def obtener_conexion():
+    inicio = time.perf_counter()
     try:
-        return connection_pool.getconn()
+        return _obtener_pool().getconn()
     except psycopg2.Error as e:
         print(f"Error al obtener conexión del pool: {e}")
         raise
+    finally:
+        _sumar_adquisicion(time.perf_counter() - inicio)
 
 def liberar_conexion(conexion):
     try:
         if conexion:
-            if not conexion.closed:
-                conexion.rollback()
-            connection_pool.putconn(conexion)
+            _obtener_pool().putconn(conexion)
     except Exception as e:
         print(f"Error al liberar conexión: {e}")
         if conexion and not conexion.closed:
             conexion.close()
 
-def marcar_paciente_atendido(paciente_id, consultorio):
+def estadisticas_pool():
+    if connection_pool is None:
+        return None
+    return connection_pool.estadisticas()
+
+# Última migración de migraciones.py que necesita este código (txid_cambio,
+# resumen_colas, especialidad_consultorios)
+VERSION_ESQUEMA = 5
+
+class EsquemaDesactualizado(Exception):
+    pass
+
+_esquema_verificado = False
+
+def verificar_esquema():
+    # Contra una base sin migrar las pantallas fallarían con columnas inexistentes;
+    # se revisa una vez por proceso, antes de la primera carga
+    global _esquema_verificado
+    if _esquema_verificado:
+        return
     conexion = None
     try:
         conexion = obtener_conexion()
         with conexion.cursor() as cursor:
-            cursor.execute("""
-                UPDATE pacientes_especialidades
-                SET atendido = TRUE, fecha_atencion = NOW()
-                WHERE paciente_id = %s AND consultorio = %s
-            """, (paciente_id, consultorio))
-            conexion.commit()
-    except Exception as e:
-        if conexion:
-            conexion.rollback()
-        raise e
+            cursor.execute("SELECT to_regclass('schema_migraciones') IS NOT NULL")
+            version = 0
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT COALESCE(max(version), 0) FROM schema_migraciones")
+                version = cursor.fetchone()[0]
+        conexion.commit()
     finally:
         if conexion:
             liberar_conexion(conexion)
+    if version < VERSION_ESQUEMA:
+        raise EsquemaDesactualizado(
+            f"La base de datos está en la versión {version} del esquema y este programa necesita "
+            f"la {VERSION_ESQUEMA}: ejecute migraciones.py"
+        )
+    _esquema_verificado = True
+
+# Límites (ms) del histograma de duraciones: con él se estiman percentiles aun
+# sumando los resúmenes de varios procesos
+CUBETAS_TRAZA = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+PROGRAMA = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else ''))[0] or 'python'
+
+_trazas = collections.deque(maxlen=TRAZAS_CONFIG['capacidad'])
+_trazas_lock = threading.Lock()
+_resumen_periodo = {}  # Desde el último volcado al archivo
+_resumen_total = {}  # Desde que arrancó el proceso
+_inicio_periodo = time.time()
+_traza_hilo = threading.local()
+_volcado_iniciado = False
+_fin_volcado = threading.Event()
+
+def _pila_trazas():
+    # Trazas en curso del hilo: una función trazada puede llamar a otra
+    pila = getattr(_traza_hilo, 'pila', None)
+    if pila is None:
+        pila = _traza_hilo.pila = []
+    return pila
+
+def _sumar_adquisicion(segundos):
+    pila = getattr(_traza_hilo, 'pila', None)
+    if pila:
+        pila[-1]['adquisicion'] += segundos
+
+def _contar_filas(resultado):
+    # Filas devueltas según la forma del resultado; None si no se puede saber
+    if resultado is None:
+        return 0
+    if isinstance(resultado, dict):
+        for clave in ('turnos', 'pacientes'):
+            valor = resultado.get(clave)
+            if isinstance(valor, int) and not isinstance(valor, bool):
+                return valor
+            if hasattr(valor, '__len__'):
+                return len(valor)
+        return 1
+    if hasattr(resultado, '__len__') and not isinstance(resultado, str):
+        return len(resultado)
+    return None
+
+def resumen_vacio():
+    return {
+        'llamadas': 0,
+        'errores': 0,
+        'filas': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'adquisicion_ms': 0.0,
+        'cubetas': [0] * (len(CUBETAS_TRAZA) + 1),
+        'modulos': {}
+    }
+
+def sumar_resumen(destino, origen):
+    for clave in ('llamadas', 'errores', 'filas', 'total_ms', 'adquisicion_ms'):
+        destino[clave] += origen[clave]
+    destino['max_ms'] = max(destino['max_ms'], origen['max_ms'])
+    destino['cubetas'] = [a + b for a, b in zip(destino['cubetas'], origen['cubetas'])]
+    for modulo, llamadas in origen['modulos'].items():
+        destino['modulos'][modulo] = destino['modulos'].get(modulo, 0) + llamadas
+
+def percentil_resumen(resumen, fraccion):
+    # Límite superior de la cubeta donde cae el percentil, acotado por el máximo
+    objetivo = fraccion * resumen['llamadas']
+    acumulado = 0
+    for indice, cantidad in enumerate(resumen['cubetas']):
+        acumulado += cantidad
+        if cantidad and acumulado >= objetivo:
+            if indice < len(CUBETAS_TRAZA):
+                return min(CUBETAS_TRAZA[indice], resumen['max_ms'])
+            break
+    return resumen['max_ms']
+
+def _acumular(resumen, registro, total_ms):
+    resumen['llamadas'] += 1
+    resumen['errores'] += registro['error'] is not None
+    resumen['filas'] += registro['filas'] or 0
+    resumen['total_ms'] += total_ms
+    resumen['max_ms'] = max(resumen['max_ms'], total_ms)
+    resumen['adquisicion_ms'] += registro['adquisicion_ms']
+    resumen['cubetas'][bisect.bisect_left(CUBETAS_TRAZA, total_ms)] += 1
+    resumen['modulos'][registro['modulo']] = resumen['modulos'].get(registro['modulo'], 0) + 1
+
+def _anadir_linea_traza(prefijo, datos):
+    ruta = os.path.join(TRAZAS_CONFIG['carpeta'], f"{prefijo}-{date.today():%Y%m%d}.jsonl")
+    try:
+        os.makedirs(TRAZAS_CONFIG['carpeta'], exist_ok=True)
+        # Una línea por escritura: varios programas pueden añadir al mismo archivo
+        with open(ruta, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(datos, default=str, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Error al guardar trazas en {ruta}: {e}")
+
+# Marcos que no dicen quién pidió la consulta: se sigue subiendo por la pila
+_MODULOS_INTERMEDIOS = (__name__, 'threading', 'concurrent.futures.thread')
+
+def _modulo_llamador(marco):
+    while marco is not None:
+        modulo = marco.f_globals.get('__name__', '?')
+        if modulo not in _MODULOS_INTERMEDIOS:
+            return modulo
+        marco = marco.f_back
+    # Tarea enviada directamente a un ejecutor
+    return f"hilo {threading.current_thread().name}"
+
+def _nueva_traza(nombre, llamador):
+    return {
+        'funcion': nombre,
+        'modulo': _modulo_llamador(llamador),
+        'momento': time.time(),
+        'adquisicion': 0.0,
+        'segundos': 0.0,
+        'filas': 0
+    }
+
+def _describir_argumento(valor):
+    if TRAZAS_CONFIG['argumentos']:
+        return repr(valor)
+    if isinstance(valor, (str, bytes, list, tuple, dict, set)):
+        return f"{type(valor).__name__}[{len(valor)}]"
+    return type(valor).__name__
+
+def _describir_error(error):
+    if error is None:
+        return None
+    if TRAZAS_CONFIG['argumentos']:
+        return str(error)
+    return type(error).__name__
+
+def _registrar_traza(traza, error, args, kwargs):
+    total_ms = traza['segundos'] * 1000
+    adquisicion_ms = traza['adquisicion'] * 1000
+    registro = {
+        'momento': traza['momento'],
+        'funcion': traza['funcion'],
+        'modulo': traza['modulo'],
+        'filas': traza['filas'],
+        'adquisicion_ms': round(adquisicion_ms, 3),
+        'ejecucion_ms': round(total_ms - adquisicion_ms, 3),
+        'error': _describir_error(error)
+    }
+    with _trazas_lock:
+        _trazas.append(registro)
+        for resumen in (_resumen_periodo, _resumen_total):
+            if traza['funcion'] not in resumen:
+                resumen[traza['funcion']] = resumen_vacio()
+            _acumular(resumen[traza['funcion']], registro, total_ms)
+
+    if total_ms >= TRAZAS_CONFIG['lenta_ms']:
+        argumentos = ", ".join([_describir_argumento(a) for a in args] +
+                               [f"{k}={_describir_argumento(v)}" for k, v in kwargs.items()])
+        _anadir_linea_traza('lentas', dict(
+            registro,
+            programa=PROGRAMA,
+            pid=os.getpid(),
+            total_ms=round(total_ms, 3),
+            argumentos=argumentos[:300]
+        ))
+    if not _volcado_iniciado:
+        _iniciar_volcado()
+
+def _trazar(funcion):
+    # Registra cada llamada: filas devueltas, espera por la conexión del pool,
+    # tiempo de ejecución y el módulo que la hizo
+    nombre = funcion.__name__
+
+    if inspect.isgeneratorfunction(funcion):
+        # Solo cuenta el tiempo dentro del generador, no el de quien consume las filas
+        @functools.wraps(funcion)
+        def generador(*args, **kwargs):
+            if not TRAZAS_CONFIG['activas']:
+                yield from funcion(*args, **kwargs)
+                return
+            traza = _nueva_traza(nombre, sys._getframe(1))
+            pila = _pila_trazas()
+            iterador = funcion(*args, **kwargs)
+            error = None
+            try:
+                while True:
+                    pila.append(traza)
+                    inicio = time.perf_counter()
+                    try:
+                        fila = next(iterador)
+                    except StopIteration:
+                        return
+                    finally:
+                        traza['segundos'] += time.perf_counter() - inicio
+                        pila.pop()
+                    traza['filas'] += 1
+                    yield fila
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                iterador.close()
+                _registrar_traza(traza, error, args, kwargs)
+        return generador
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not TRAZAS_CONFIG['activas']:
+            return funcion(*args, **kwargs)
+        traza = _nueva_traza(nombre, sys._getframe(1))
+        pila = _pila_trazas()
+        pila.append(traza)
+        inicio = time.perf_counter()
+        error = None
+        try:
+            resultado = funcion(*args, **kwargs)
+            traza['filas'] = _contar_filas(resultado)
+            return resultado
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            traza['segundos'] = time.perf_counter() - inicio
+            pila.pop()
+            _registrar_traza(traza, error, args, kwargs)
+    return envoltura
+
+def trazas_recientes(cantidad=None):
+    with _trazas_lock:
+        trazas = list(_trazas)
+    return trazas[-cantidad:] if cantidad else trazas
+
+def resumen_trazas():
+    # Acumulado por función desde el arranque, con promedio y percentiles estimados
+    with _trazas_lock:
+        resumen = {nombre: dict(datos, modulos=dict(datos['modulos'])) for nombre, datos in _resumen_total.items()}
+    for datos in resumen.values():
+        datos['promedio_ms'] = round(datos['total_ms'] / datos['llamadas'], 3)
+        datos['p50_ms'] = percentil_resumen(datos, 0.50)
+        datos['p95_ms'] = percentil_resumen(datos, 0.95)
+    return resumen
+
+def volcar_trazas():
+    # Añade al archivo del día lo acumulado desde el volcado anterior
+    global _resumen_periodo, _inicio_periodo
+    with _trazas_lock:
+        if not _resumen_periodo:
+            return None
+        funciones, _resumen_periodo = _resumen_periodo, {}
+        desde, _inicio_periodo = _inicio_periodo, time.time()
+    for datos in funciones.values():
+        for clave in ('total_ms', 'max_ms', 'adquisicion_ms'):
+            datos[clave] = round(datos[clave], 3)
+    linea = {
+        'momento': datetime.now().isoformat(timespec='seconds'),
+        'programa': PROGRAMA,
+        'pid': os.getpid(),
+        'segundos': round(_inicio_periodo - desde, 1),
+        'funciones': funciones
+    }
+    _anadir_linea_traza('resumen', linea)
+    return linea
+
+def _volcar_periodicamente():
+    while not _fin_volcado.wait(TRAZAS_CONFIG['intervalo_resumen']):
+        volcar_trazas()
+
+def _terminar_volcado():
+    _fin_volcado.set()
+    volcar_trazas()
 
+def _iniciar_volcado():
+    global _volcado_iniciado
+    with _trazas_lock:
+        if _volcado_iniciado:
+            return
+        _volcado_iniciado = True
+    threading.Thread(target=_volcar_periodicamente, name='volcado_trazas', daemon=True).start()
+    atexit.register(_terminar_volcado)
+
+def notificar_cambio(cursor, tipo, **datos):
+    # El aviso se entrega a los clientes recién cuando la transacción hace commit
+    datos['tipo'] = tipo
+    cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_CAMBIOS, json.dumps(datos)))
+
+def _a_json(valor):
+    if isinstance(valor, datetime):
+        return {'__fecha__': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'__dia__': valor.isoformat()}
+    if hasattr(valor, 'keys'):
+        # RealDictRow y DictRow viajan como diccionarios
+        return {clave: _a_json(valor[clave]) for clave in valor.keys()}
+    if isinstance(valor, (list, tuple)):
+        return [_a_json(v) for v in valor]
+    return valor
+
+def _desde_json(objeto):
+    if len(objeto) == 1:
+        if '__fecha__' in objeto:
+            return datetime.fromisoformat(objeto['__fecha__'])
+        if '__dia__' in objeto:
+            return date.fromisoformat(objeto['__dia__'])
+    return objeto
+
+def codificar_mensaje(mensaje):
+    # Protocolo del hub: un objeto JSON por línea
+    return (json.dumps(_a_json(mensaje)) + '\n').encode('utf-8')
+
+def decodificar_mensaje(linea):
+    return json.loads(linea, object_hook=_desde_json)
+
+# Funciones que un cliente puede invocar a través del hub (nombre -> es escritura)
+FUNCIONES_HUB = {}
+
+def _via_hub(escritura=False):
+    def decorador(funcion):
+        FUNCIONES_HUB[funcion.__name__] = escritura
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if HUB_DIRECCION:
+                return _escucha_cambios.llamar(funcion.__name__, *args, **kwargs)
+            return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+class EscuchaCambios:
+    def __init__(self):
+        self._suscriptores = {}
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._detener = threading.Event()
+
+    def suscribir(self, callback):
+        with self._lock:
+            self._siguiente_id += 1
+            suscripcion_id = self._siguiente_id
+            self._suscriptores[suscripcion_id] = callback
+        self._iniciar()
+        return suscripcion_id
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._escuchar, daemon=True)
+                self._hilo.start()
+
+    def cancelar(self, suscripcion_id):
+        with self._lock:
+            self._suscriptores.pop(suscripcion_id, None)
+            if not self._suscriptores:
+                self._detener.set()
+
+    def _emitir(self, evento):
+        with self._lock:
+            callbacks = list(self._suscriptores.values())
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"Error en suscriptor de cambios: {e}")
+
+    def _escuchar(self):
+        primera_conexion = True
+        while not self._detener.is_set():
+            conexion = None
+            try:
+                # Conexión dedicada fuera del pool: queda abierta esperando avisos
+                conexion = psycopg2.connect(**parametros_conexion())
+                conexion.autocommit = True
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL_CAMBIOS}")
+
+                # Tras una reconexión pudimos perder avisos, así que se pide recargar
+                if not primera_conexion:
+                    self._emitir({'tipo': 'reconexion'})
+                primera_conexion = False
+
+                while not self._detener.is_set():
+                    if select.select([conexion], [], [], INTERVALO_RESPALDO) == ([], [], []):
+                        self._emitir({'tipo': 'respaldo'})
+                        continue
+
+                    conexion.poll()
+                    eventos = []
+                    while conexion.notifies:
+                        aviso = conexion.notifies.pop(0)
+                        try:
+                            eventos.append(json.loads(aviso.payload))
+                        except ValueError:
+                            eventos.append({'tipo': aviso.payload})
+                    for evento in eventos:
+                        self._emitir(evento)
+            except Exception as e:
+                print(f"Error en escucha de cambios: {e}")
+                self._detener.wait(5)
+            finally:
+                if conexion and not conexion.closed:
+                    conexion.close()
+
+def suscribir_cambios(callback):
+    # La invalidación de la caché se suscribe primero para que, cuando el cliente
+    # reaccione al aviso, cargar_datos() ya no devuelva la copia vieja.
+    _suscribir_invalidacion_cache()
+    return _escucha_cambios.suscribir(callback)
+
+def cancelar_suscripcion(suscripcion_id):
+    _escucha_cambios.cancelar(suscripcion_id)
+
+@_trazar
+@_via_hub(escritura=False)
 def obtener_pacientes_espera_consultorio(consultorio_id):
     consultorio = f"Consultorio {consultorio_id}"
     conexion = None
     try:
         conexion = obtener_conexion()
         with conexion.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute("""
-                SELECT 
-                    pe.paciente_id, 
-                    p.nombre, 
-                    e.nombre as especialidad, 
-                    pe.consultorio, 
-                    pe.atendido, 
-                    pe.fecha_registro
-                FROM pacientes_especialidades pe
-                JOIN pacientes p ON p.id = pe.paciente_id
-                JOIN especialidades e ON pe.especialidad_id = e.id
-                WHERE pe.consultorio = %s
-                  AND pe.atendido = FALSE
-                  AND pe.fecha_registro::date = CURRENT_DATE
-                ORDER BY pe.fecha_registro ASC
-            """, (consultorio,))
+            ejecutar_preparada(cursor, SQL_PACIENTES_ESPERA, (consultorio,))
             return cursor.fetchall()
     except Exception as e:
         raise e
@@ -87,29 +1021,15 @@ def obtener_pacientes_espera_consultorio(consultorio_id):
         if conexion:
             liberar_conexion(conexion)
 
+@_trazar
+@_via_hub(escritura=False)
 def obtener_historial_atencion_consultorio(consultorio_id):
     consultorio = f"Consultorio {consultorio_id}"
     conexion = None
     try:
         conexion = obtener_conexion()
         with conexion.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute("""
-                SELECT 
-                    pe.paciente_id, 
-                    p.nombre, 
-                    e.nombre AS especialidad,
-                    pe.consultorio, 
-                    pe.fecha_registro, 
-                    pe.atendido, 
-                    pe.fecha_atencion
-                FROM pacientes_especialidades pe
-                JOIN pacientes p ON p.id = pe.paciente_id
-                JOIN especialidades e ON pe.especialidad_id = e.id
-                WHERE pe.consultorio = %s
-                  AND pe.atendido = TRUE
-                  AND pe.fecha_registro::date = CURRENT_DATE
-                ORDER BY pe.fecha_atencion DESC
-            """, (consultorio,))
+            ejecutar_preparada(cursor, SQL_HISTORIAL_ATENCION, (consultorio,))
             return cursor.fetchall()
     except Exception as e:
         raise e
@@ -117,7 +1037,493 @@ def obtener_historial_atencion_consultorio(consultorio_id):
         if conexion:
             liberar_conexion(conexion)
 
-def cargar_datos():
+# Cola de un consultorio en un solo viaje: espera e historial del día (limitados),
+# los totales y el watermark para pedir después solo lo que cambió.
+LIMITE_ESPERA_CONSULTORIO = 100
+LIMITE_HISTORIAL_CONSULTORIO = 30
+
+_SQL_ESTADO_CONSULTORIO = """
+    estado AS (
+        SELECT
+            txid_snapshot_xmin(txid_current_snapshot()) AS watermark,
+            CURRENT_DATE AS fecha,
+            (SELECT count(*) FROM pacientes_especialidades
+             WHERE consultorio = %(consultorio)s AND atendido = FALSE
+               AND fecha_registro >= CURRENT_DATE
+               AND fecha_registro < CURRENT_DATE + INTERVAL '1 day') AS total_espera,
+            (SELECT count(*) FROM pacientes_especialidades
+             WHERE consultorio = %(consultorio)s AND atendido = TRUE
+               AND fecha_registro >= CURRENT_DATE
+               AND fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+               AND fecha_atencion >= CURRENT_DATE) AS total_historial
+    )
+"""
+
+_SQL_COLUMNAS_TURNO = """
+        pe.id AS turno_id,
+        pe.paciente_id,
+        p.nombre,
+        e.nombre AS especialidad,
+        pe.consultorio,
+        pe.fecha_registro,
+        pe.atendido,
+        pe.fecha_atencion
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+"""
+
+SQL_COLA_CONSULTORIO = "WITH " + _SQL_ESTADO_CONSULTORIO + """,
+    espera AS (
+        SELECT """ + _SQL_COLUMNAS_TURNO + """
+        WHERE pe.consultorio = %(consultorio)s
+          AND pe.atendido = FALSE
+          AND pe.fecha_registro >= CURRENT_DATE
+          AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+        ORDER BY pe.fecha_registro, pe.id
+        LIMIT %(limite_espera)s
+    ),
+    historial AS (
+        SELECT """ + _SQL_COLUMNAS_TURNO + """
+        WHERE pe.consultorio = %(consultorio)s
+          AND pe.atendido = TRUE
+          AND pe.fecha_registro >= CURRENT_DATE
+          AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+          AND pe.fecha_atencion >= CURRENT_DATE
+        ORDER BY pe.fecha_atencion DESC, pe.id DESC
+        LIMIT %(limite_historial)s
+    )
+    SELECT estado.*, t.*
+    FROM estado
+    LEFT JOIN (SELECT * FROM espera UNION ALL SELECT * FROM historial) t ON TRUE
+"""
+registrar_sentencia('cola_consultorio', SQL_COLA_CONSULTORIO)
+
+# Turnos cambiados desde el watermark que son de este consultorio o que lo eran
+# (conocidos): así un turno movido a otro consultorio también sale de la lista
+SQL_COLA_CONSULTORIO_DELTA = "WITH " + _SQL_ESTADO_CONSULTORIO + """,
+    cambios AS (
+        SELECT """ + _SQL_COLUMNAS_TURNO + """
+        WHERE pe.txid_cambio >= %(watermark)s
+          AND pe.fecha_registro >= CURRENT_DATE
+          AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+          AND (pe.consultorio = %(consultorio)s OR pe.id = ANY(%(conocidos)s::bigint[]))
+    )
+    SELECT estado.*, t.*
+    FROM estado
+    LEFT JOIN cambios t ON TRUE
+"""
+
+SQL_HISTORIAL_PAGINA = """
+    SELECT """ + _SQL_COLUMNAS_TURNO + """
+    WHERE pe.consultorio = %(consultorio)s
+      AND pe.atendido = TRUE
+      AND pe.fecha_registro >= CURRENT_DATE
+      AND pe.fecha_registro < CURRENT_DATE + INTERVAL '1 day'
+      AND pe.fecha_atencion >= CURRENT_DATE
+      AND (pe.fecha_atencion, pe.id) < (%(fecha_atencion)s, %(turno_id)s)
+    ORDER BY pe.fecha_atencion DESC, pe.id DESC
+    LIMIT %(limite)s
+"""
+
+@_trazar
+@_via_hub(escritura=False)
+def consultar_cola_consultorio(consultorio_id, watermark=None, conocidos=(),
+                               limite_espera=LIMITE_ESPERA_CONSULTORIO,
+                               limite_historial=LIMITE_HISTORIAL_CONSULTORIO):
+    # Sin watermark trae la espera y el historial limitados; con watermark, solo los
+    # turnos que cambiaron. Los totales vienen siempre.
+    parametros = {
+        'consultorio': f"Consultorio {consultorio_id}",
+        'watermark': watermark,
+        'conocidos': list(conocidos),
+        'limite_espera': limite_espera,
+        'limite_historial': limite_historial
+    }
+    verificar_esquema()
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        conexion.autocommit = True
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_COLA_CONSULTORIO if watermark is None else SQL_COLA_CONSULTORIO_DELTA, parametros)
+            filas = cursor.fetchall()
+        estado = filas[0]
+        return {
+            'completo': watermark is None,
+            'watermark': estado['watermark'],
+            'fecha': estado['fecha'],
+            'total_espera': estado['total_espera'],
+            'total_historial': estado['total_historial'],
+            'turnos': [
+                {campo: fila[campo] for campo in CAMPOS_TURNO}
+                for fila in filas if fila['turno_id'] is not None
+            ]
+        }
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+@_trazar
+@_via_hub(escritura=False)
+def obtener_historial_pagina(consultorio_id, fecha_atencion, turno_id, limite=LIMITE_HISTORIAL_CONSULTORIO):
+    # Atenciones de hoy anteriores a (fecha_atencion, turno_id), las más recientes primero
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_HISTORIAL_PAGINA, {
+                'consultorio': f"Consultorio {consultorio_id}",
+                'fecha_atencion': fecha_atencion,
+                'turno_id': turno_id,
+                'limite': limite
+            })
+            return [dict(fila) for fila in cursor.fetchall()]
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+class EstadoConsultorio:
+    # Lo que ve un consultorio: sus turnos del día, no los de todo el hospital. La
+    # primera carga trae la espera y el historial limitados; las siguientes solo
+    # los turnos que cambiaron. Se usa desde hilos de trabajo.
+    def __init__(self, consultorio_id, limite_espera=LIMITE_ESPERA_CONSULTORIO,
+                 limite_historial=LIMITE_HISTORIAL_CONSULTORIO):
+        self.consultorio_id = str(consultorio_id)
+        self.consultorio = f"Consultorio {self.consultorio_id}"
+        self.limite_espera = limite_espera
+        self.limite_historial = limite_historial
+        self.historial_visible = limite_historial
+        self.turnos = {}
+        self.watermark = None
+        self.fecha = None
+        self.total_espera = 0
+        self.total_historial = 0
+        self.corte = None
+        self._lock = threading.Lock()
+
+    def actualizar(self, completo=False):
+        with self._lock:
+            if completo or self.watermark is None:
+                self._cargar_completo()
+            else:
+                resultado = consultar_cola_consultorio(self.consultorio_id, self.watermark, list(self.turnos))
+                if resultado['fecha'] != self.fecha:
+                    # Cambió el día: la cola empieza de nuevo
+                    self._cargar_completo()
+                else:
+                    self._aplicar_delta(resultado)
+            return self._listas()
+
+    def mas_historial(self):
+        # Página siguiente del historial, anterior a la atención más vieja que se tiene
+        with self._lock:
+            atendidos = self._atendidos()
+            if atendidos:
+                ultimo = atendidos[-1]
+                pagina = obtener_historial_pagina(self.consultorio_id, ultimo['fecha_atencion'],
+                                                  ultimo['turno_id'], self.limite_historial)
+                for turno in pagina:
+                    self.turnos[turno['turno_id']] = turno
+            self.historial_visible += self.limite_historial
+            return self._listas()
+
+    def _cargar_completo(self):
+        resultado = consultar_cola_consultorio(self.consultorio_id, None, (),
+                                               self.limite_espera, self.historial_visible)
+        self.turnos = {turno['turno_id']: turno for turno in resultado['turnos']}
+        self._guardar_estado(resultado)
+        # Si la espera no entró completa, se recuerda el último pendiente traído: lo que
+        # llegue después va detrás de los que faltan y no se guarda hasta la próxima carga
+        pendientes = self._pendientes()
+        self.corte = self._orden_espera(pendientes[-1]) if self.total_espera > len(pendientes) else None
+
+    def _aplicar_delta(self, resultado):
+        for turno in resultado['turnos']:
+            self.turnos.pop(turno['turno_id'], None)
+            if turno['consultorio'] != self.consultorio:
+                continue
+            if not turno['atendido'] and self.corte is not None and self._orden_espera(turno) > self.corte:
+                continue
+            self.turnos[turno['turno_id']] = turno
+        self._guardar_estado(resultado)
+
+        # Quedan pocos de los pendientes traídos y hay más en la base: se trae otra tanda
+        if self.corte is not None and len(self._pendientes()) < self.limite_espera // 2:
+            self._cargar_completo()
+            return
+
+        # Del historial solo se conserva lo que se muestra
+        for turno in self._atendidos()[self.historial_visible:]:
+            del self.turnos[turno['turno_id']]
+
+    def _guardar_estado(self, resultado):
+        self.watermark = resultado['watermark']
+        self.fecha = resultado['fecha']
+        self.total_espera = resultado['total_espera']
+        self.total_historial = resultado['total_historial']
+
+    @staticmethod
+    def _orden_espera(turno):
+        return (turno['fecha_registro'] or datetime.min, turno['turno_id'])
+
+    def _pendientes(self):
+        return sorted((turno for turno in self.turnos.values() if not turno['atendido']), key=self._orden_espera)
+
+    def _atendidos(self):
+        return sorted(
+            (turno for turno in self.turnos.values() if turno['atendido']),
+            key=lambda turno: (turno['fecha_atencion'] or datetime.min, turno['turno_id']),
+            reverse=True
+        )
+
+    def _listas(self):
+        espera = self._pendientes()[:self.limite_espera]
+        historial = self._atendidos()[:self.historial_visible]
+        return {
+            'espera': espera,
+            'historial': historial,
+            'total_espera': self.total_espera,
+            'total_historial': self.total_historial
+        }
+
+# Contadores de hoy por consultorio y especialidad; la tabla la mantienen los
+# triggers de la migración 4, así que la consulta no toca la cola
+SQL_RESUMEN_COLAS = """
+    SELECT
+        r.consultorio,
+        e.nombre AS especialidad,
+        r.pendientes,
+        r.atendidos,
+        r.primer_pendiente,
+        r.esperas,
+        CASE WHEN r.esperas > 0 THEN r.espera_total / r.esperas END AS espera_promedio
+    FROM resumen_colas r
+    JOIN especialidades e ON e.id = r.especialidad_id
+    WHERE r.fecha = CURRENT_DATE
+      AND (r.pendientes > 0 OR r.atendidos > 0)
+    ORDER BY r.consultorio, e.nombre
+"""
+registrar_sentencia('resumen_colas', SQL_RESUMEN_COLAS)
+
+@_trazar
+@_via_hub(escritura=False)
+def obtener_resumen_colas():
+    # Una fila por consultorio y especialidad con turnos hoy; espera_promedio en segundos
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        conexion.autocommit = True
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_RESUMEN_COLAS)
+            return [dict(fila) for fila in cursor.fetchall()]
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def resumen_por_consultorio(filas):
+    # Junta las filas de obtener_resumen_colas por consultorio
+    resumen = {}
+    for fila in filas:
+        total = resumen.setdefault(fila['consultorio'], {
+            'pendientes': 0,
+            'atendidos': 0,
+            'primer_pendiente': None,
+            'esperas': 0,
+            'espera_promedio': None
+        })
+        total['pendientes'] += fila['pendientes']
+        total['atendidos'] += fila['atendidos']
+        if fila['primer_pendiente'] and (total['primer_pendiente'] is None or fila['primer_pendiente'] < total['primer_pendiente']):
+            total['primer_pendiente'] = fila['primer_pendiente']
+        if fila['esperas']:
+            # Promedio ponderado por la cantidad de atendidos con hora de atención
+            acumulado = (total['espera_promedio'] or 0) * total['esperas'] + fila['espera_promedio'] * fila['esperas']
+            total['esperas'] += fila['esperas']
+            total['espera_promedio'] = acumulado / total['esperas']
+    return resumen
+
+# Minutos hacia atrás con que se mide cuántos pacientes atiende cada consultorio
+VENTANA_ATENCION_MIN = 60
+# El ritmo reciente se mezcla con el histórico como si este aportara tantos minutos
+# de observación: al empezar el turno manda el historial y luego el día
+PESO_RITMO_HISTORICO_MIN = 30
+DIAS_RITMO_HISTORICO = 14
+# Atendidos por hora cuando no hay historial de ningún consultorio
+RITMO_POR_DEFECTO = 4.0
+
+# Cola y atendidos de hoy (del resumen) y atendidos recientes (idx_pe_historial)
+# de cada consultorio asignado a alguna especialidad o con turnos hoy
+SQL_CARGA_CONSULTORIOS = """
+    SELECT
+        c.consultorio,
+        COALESCE(r.pendientes, 0)::integer AS pendientes,
+        COALESCE(r.atendidos, 0)::integer AS atendidos_hoy,
+        (
+            SELECT count(*)
+            FROM pacientes_especialidades pe
+            WHERE pe.consultorio = c.consultorio
+              AND pe.atendido = TRUE
+              AND pe.fecha_atencion >= LOCALTIMESTAMP - make_interval(mins => %(ventana)s)
+        )::integer AS atendidos_recientes
+    FROM (
+        SELECT consultorio FROM especialidad_consultorios
+        UNION
+        SELECT consultorio FROM resumen_colas WHERE fecha = CURRENT_DATE
+    ) c
+    LEFT JOIN (
+        SELECT consultorio, sum(pendientes) AS pendientes, sum(atendidos) AS atendidos
+        FROM resumen_colas
+        WHERE fecha = CURRENT_DATE
+        GROUP BY consultorio
+    ) r ON r.consultorio = c.consultorio
+    ORDER BY c.consultorio
+"""
+registrar_sentencia('carga_consultorios', SQL_CARGA_CONSULTORIOS)
+
+SQL_ESPECIALIDAD_CONSULTORIOS = """
+    SELECT e.nombre AS especialidad, m.consultorio
+    FROM especialidad_consultorios m
+    JOIN especialidades e ON e.id = m.especialidad_id
+    ORDER BY e.nombre, m.consultorio
+"""
+registrar_sentencia('especialidad_consultorios', SQL_ESPECIALIDAD_CONSULTORIOS)
+
+# Atendidos por hora de trabajo en los días anteriores; la hora de trabajo de
+# un día va de la primera a la última atención (al menos una hora)
+SQL_RITMO_HISTORICO = """
+    SELECT consultorio, sum(atendidos)::double precision / sum(horas) AS por_hora
+    FROM (
+        SELECT
+            consultorio,
+            fecha_atencion::date AS dia,
+            count(*) AS atendidos,
+            GREATEST(EXTRACT(EPOCH FROM max(fecha_atencion) - min(fecha_atencion)) / 3600, 1) AS horas
+        FROM pacientes_especialidades
+        WHERE atendido = TRUE
+          AND fecha_registro >= CURRENT_DATE - %(dias)s - 1
+          AND fecha_atencion >= CURRENT_DATE - %(dias)s
+          AND fecha_atencion < CURRENT_DATE
+        GROUP BY 1, 2
+    ) d
+    GROUP BY consultorio
+"""
+
+# Se calcula una vez por día y por proceso: no cambia durante la jornada
+_ritmo_historico = {'fecha': None, 'valores': {}}
+_ritmo_lock = threading.Lock()
+
+def _leer_ritmo_historico(cursor):
+    hoy = date.today()
+    with _ritmo_lock:
+        if _ritmo_historico['fecha'] == hoy:
+            return _ritmo_historico['valores']
+    cursor.execute(SQL_RITMO_HISTORICO, {'dias': DIAS_RITMO_HISTORICO})
+    valores = {fila['consultorio']: fila['por_hora'] for fila in cursor.fetchall()}
+    with _ritmo_lock:
+        _ritmo_historico['fecha'] = hoy
+        _ritmo_historico['valores'] = valores
+    return valores
+
+@_trazar
+@_via_hub(escritura=False)
+def obtener_carga_consultorios(ventana=VENTANA_ATENCION_MIN):
+    # Lo que necesita sugerir_consultorios: carga por consultorio y consultorios por especialidad
+    verificar_esquema()
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        conexion.autocommit = True
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ritmos = _leer_ritmo_historico(cursor)
+            ejecutar_preparada(cursor, SQL_CARGA_CONSULTORIOS, {'ventana': ventana})
+            consultorios = {fila['consultorio']: {
+                'pendientes': fila['pendientes'],
+                'atendidos_hoy': fila['atendidos_hoy'],
+                'atendidos_recientes': fila['atendidos_recientes'],
+                'ritmo_historico': ritmos.get(fila['consultorio'])
+            } for fila in cursor.fetchall()}
+            ejecutar_preparada(cursor, SQL_ESPECIALIDAD_CONSULTORIOS)
+            especialidades = {}
+            for fila in cursor.fetchall():
+                especialidades.setdefault(fila['especialidad'], []).append(fila['consultorio'])
+        return {
+            'ventana': ventana,
+            # Para los consultorios sin historial propio
+            'ritmo_general': sum(ritmos.values()) / len(ritmos) if ritmos else RITMO_POR_DEFECTO,
+            'consultorios': consultorios,
+            'especialidades': especialidades
+        }
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def espera_estimada(carga, consultorio, extra=0):
+    # Minutos hasta atender a uno más: la cola dividida por el ritmo, que mezcla
+    # los atendidos de la última ventana con el ritmo histórico del consultorio
+    datos = carga['consultorios'].get(consultorio, {})
+    historico = datos.get('ritmo_historico') or carga['ritmo_general']
+    por_minuto = ((datos.get('atendidos_recientes', 0) + historico / 60 * PESO_RITMO_HISTORICO_MIN)
+                  / (carga['ventana'] + PESO_RITMO_HISTORICO_MIN))
+    return (datos.get('pendientes', 0) + extra + 1) / por_minuto
+
+def consultorios_abiertos(carga, candidatos):
+    # Abierto es el que ya atendió a alguien hoy. Al empezar el turno, antes de la
+    # primera atención, valen los que tienen turnos hoy; si tampoco hay, todos.
+    datos = carga['consultorios']
+    return ([cons for cons in candidatos if datos.get(cons, {}).get('atendidos_hoy')]
+            or [cons for cons in candidatos if datos.get(cons, {}).get('pendientes')]
+            or list(candidatos))
+
+def sugerir_consultorios(carga, especialidades, consultorios):
+    # Un consultorio por especialidad, en el mismo orden. Solo mira la carga ya
+    # leída, así que no toca la base. Si una especialidad no tiene consultorios
+    # asignados se elige entre todos; los turnos que se van sugiriendo cuentan
+    # como cola para las especialidades siguientes del mismo paciente.
+    sugeridos = []
+    asignados = {}
+    for especialidad in especialidades:
+        candidatos = consultorios_abiertos(carga, carga['especialidades'].get(especialidad) or consultorios)
+        # Ante un empate queda el primero de la lista
+        elegido = min(candidatos, key=lambda cons: espera_estimada(carga, cons, asignados.get(cons, 0)))
+        sugeridos.append(elegido)
+        asignados[elegido] = asignados.get(elegido, 0) + 1
+    return sugeridos
+
+@_trazar
+def asignar_consultorios_especialidad(especialidad, consultorios):
+    # Reemplaza los consultorios de una especialidad; una lista vacía la deja libre
+    esp_id = obtener_ids_especialidades([especialidad])[0]
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("DELETE FROM especialidad_consultorios WHERE especialidad_id = %s", (esp_id,))
+            cursor.execute("""
+                INSERT INTO especialidad_consultorios (especialidad_id, consultorio)
+                SELECT %s, unnest(%s::text[])
+                ON CONFLICT DO NOTHING
+            """, (esp_id, list(consultorios)))
+            notificar_cambio(cursor, 'consultorios', especialidad=especialidad)
+            conexion.commit()
+    except Exception as e:
+        if conexion:
+            conexion.rollback()
+        raise e
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def datos_vacios():
+    # Lo que muestran las ventanas mientras llega el primer snapshot
+    return {'especialidades': [], 'pacientes': [], 'ultimo_llamado': None}
+
+@_trazar
+def cargar_datos(usar_cache=True):
+    if usar_cache or HUB_DIRECCION:
+        return snapshot_compartido().como_datos()
+
+    verificar_esquema()
     conexion = None
     try:
         conexion = obtener_conexion()
@@ -125,21 +1531,7 @@ def cargar_datos():
             cursor.execute("SELECT id, nombre FROM especialidades ORDER BY id")
             especialidades = cursor.fetchall()
 
-            cursor.execute("""
-                SELECT 
-                    pe.paciente_id,
-                    p.nombre,
-                    e.nombre AS especialidad,
-                    pe.consultorio,
-                    pe.fecha_registro,
-                    pe.atendido,
-                    pe.fecha_atencion
-                FROM pacientes_especialidades pe
-                JOIN pacientes p ON p.id = pe.paciente_id
-                JOIN especialidades e ON pe.especialidad_id = e.id
-                WHERE pe.fecha_registro::date = CURRENT_DATE
-                ORDER BY pe.fecha_registro
-            """)
+            cursor.execute(SQL_PACIENTES_DIA)
             pacientes = cursor.fetchall()
 
             cursor.execute("SELECT mensaje FROM ultimos_llamados ORDER BY fecha DESC LIMIT 1")
@@ -157,13 +1549,531 @@ def cargar_datos():
         if conexion:
             liberar_conexion(conexion)
 
+@_trazar
+def cargar_datos_incremental(watermark=None, fecha=None):
+    # El watermark es el xmin del snapshot de la consulta anterior: toda transacción
+    # con txid menor ya terminó, así que basta releer los turnos con txid_cambio >= watermark.
+    verificar_esquema()
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_ESTADO_DIA)
+            estado = cursor.fetchone()
+
+            # Sin watermark o con cambio de día se recarga el día completo
+            completo = watermark is None or fecha != estado['fecha']
+            especialidades = None
+            if completo:
+                cursor.execute("SELECT id, nombre FROM especialidades ORDER BY id")
+                especialidades = cursor.fetchall()
+                watermark = 0
+
+            ejecutar_preparada(cursor, SQL_PACIENTES_DELTA, (watermark,))
+            pacientes = cursor.fetchall()
+
+        return {
+            'completo': completo,
+            'watermark': estado['watermark'],
+            'fecha': estado['fecha'],
+            'especialidades': especialidades,
+            'pacientes': pacientes,
+            'ultimo_llamado': estado['ultimo_llamado']
+        }
+    except Exception as e:
+        raise e
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+TAMANO_LOTE_EXPORTACION = 2000
+
+SQL_TURNOS_RANGO = """
+    SELECT
+        pe.id AS turno_id,
+        pe.paciente_id,
+        p.nombre,
+        e.nombre AS especialidad,
+        pe.consultorio,
+        pe.fecha_registro,
+        pe.atendido,
+        pe.fecha_atencion
+    FROM pacientes_especialidades pe
+    JOIN pacientes p ON p.id = pe.paciente_id
+    JOIN especialidades e ON pe.especialidad_id = e.id
+    WHERE pe.fecha_registro >= %(desde)s
+      AND pe.fecha_registro < %(hasta)s::date + INTERVAL '1 day'
+"""
+
+@_trazar
+def iterar_turnos_rango(desde, hasta, nombre=None, especialidad=None, consultorio=None, lote=TAMANO_LOTE_EXPORTACION):
+    # Recorre los turnos entre dos fechas (ambas incluidas) con un cursor del lado del
+    # servidor: solo hay un lote de filas en memoria, sea un día o un año de reportes.
+    filtros = []
+    if nombre:
+        filtros.append("AND p.nombre ILIKE %(nombre)s")
+    if especialidad:
+        filtros.append("AND e.nombre = %(especialidad)s")
+    if consultorio:
+        filtros.append("AND pe.consultorio = %(consultorio)s")
+    parametros = {
+        'desde': desde,
+        'hasta': hasta,
+        'nombre': f"%{nombre}%" if nombre else None,
+        'especialidad': especialidad,
+        'consultorio': consultorio
+    }
+
+    if HUB_DIRECCION:
+        # Sin acceso a la base solo se puede exportar el día que replica el hub
+        snapshot = snapshot_compartido()
+        if str(desde) != str(snapshot.fecha) or str(hasta) != str(snapshot.fecha):
+            raise Exception("Los reportes de otros días requieren conexión directa a la base de datos")
+        for p in snapshot.como_datos()['pacientes']:
+            if nombre and nombre.lower() not in p['nombre'].lower():
+                continue
+            if especialidad and p['especialidad'] != especialidad:
+                continue
+            if consultorio and p['consultorio'] != consultorio:
+                continue
+            yield p
+        return
+
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor(name='exportar_turnos', cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = lote
+            cursor.execute(
+                SQL_TURNOS_RANGO + "\n".join(filtros) + "\nORDER BY pe.fecha_registro, pe.id",
+                parametros
+            )
+            for fila in cursor:
+                yield fila
+        conexion.commit()
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+_EPOCA = datetime(1970, 1, 1)
+_SIN_FECHA = -2 ** 63
+
+def _a_microsegundos(fecha):
+    if fecha is None:
+        return _SIN_FECHA
+    return (fecha - _EPOCA) // timedelta(microseconds=1)
+
+def _desde_microsegundos(valor):
+    if valor == _SIN_FECHA:
+        return None
+    return _EPOCA + timedelta(microseconds=valor)
+
+CAMPOS_TURNO = ('turno_id', 'paciente_id', 'nombre', 'especialidad', 'consultorio',
+                'fecha_registro', 'atendido', 'fecha_atencion')
+
+class TurnosDia:
+    # Turnos del día guardados por columnas: enteros y fechas (en microsegundos) en
+    # arreglos, nombres internados y especialidad/consultorio como códigos de una
+    # tabla de textos. Una fila ocupa unas decenas de bytes en lugar de un dict.
+    __slots__ = ('filas', 'turno_id', 'paciente_id', 'nombre', 'especialidad', 'consultorio',
+                 'fecha_registro', 'atendido', 'fecha_atencion', 'textos', 'codigos', 'huella')
+
+    def __init__(self):
+        self.filas = {}
+        self.turno_id = array('q')
+        self.paciente_id = array('q')
+        self.nombre = []
+        self.especialidad = array('H')
+        self.consultorio = array('H')
+        self.fecha_registro = array('q')
+        self.atendido = array('b')
+        self.fecha_atencion = array('q')
+        self.textos = []
+        self.codigos = {}
+        # XOR del hash de cada fila: cambia con cualquier cambio de contenido y se
+        # mantiene en O(1) por fila guardada
+        self.huella = 0
+
+    def __len__(self):
+        return len(self.turno_id)
+
+    def copia(self):
+        # Las vistas ya entregadas leen estas columnas: los cambios van a una copia
+        nueva = TurnosDia.__new__(TurnosDia)
+        for campo in self.__slots__:
+            setattr(nueva, campo, copy.copy(getattr(self, campo)))
+        return nueva
+
+    def _codigo(self, texto):
+        codigo = self.codigos.get(texto)
+        if codigo is None:
+            codigo = self.codigos[texto] = len(self.textos)
+            self.textos.append(sys.intern(texto))
+        return codigo
+
+    def _clave(self, i):
+        return (self.turno_id[i], self.paciente_id[i], self.nombre[i], self.especialidad[i],
+                self.consultorio[i], self.fecha_registro[i], self.atendido[i], self.fecha_atencion[i])
+
+    def guardar(self, fila):
+        # Devuelve True si la fila es nueva o cambió algún valor
+        valores = (
+            fila['turno_id'],
+            fila['paciente_id'],
+            sys.intern(fila['nombre']),
+            self._codigo(fila['especialidad']),
+            self._codigo(fila['consultorio']),
+            _a_microsegundos(fila['fecha_registro']),
+            1 if fila['atendido'] else 0,
+            _a_microsegundos(fila['fecha_atencion'])
+        )
+        i = self.filas.get(valores[0])
+        if i is None:
+            i = self.filas[valores[0]] = len(self.turno_id)
+            self.turno_id.append(valores[0])
+            self.paciente_id.append(valores[1])
+            self.nombre.append(valores[2])
+            self.especialidad.append(valores[3])
+            self.consultorio.append(valores[4])
+            self.fecha_registro.append(valores[5])
+            self.atendido.append(valores[6])
+            self.fecha_atencion.append(valores[7])
+        else:
+            anterior = self._clave(i)
+            if anterior == valores:
+                return False
+            self.huella ^= hash(anterior)
+            (_, self.paciente_id[i], self.nombre[i], self.especialidad[i], self.consultorio[i],
+             self.fecha_registro[i], self.atendido[i], self.fecha_atencion[i]) = valores
+        self.huella ^= hash(valores)
+        return True
+
+    def valor(self, i, campo):
+        if campo == 'especialidad' or campo == 'consultorio':
+            return self.textos[getattr(self, campo)[i]]
+        if campo == 'fecha_registro' or campo == 'fecha_atencion':
+            return _desde_microsegundos(getattr(self, campo)[i])
+        if campo == 'atendido':
+            return bool(self.atendido[i])
+        return getattr(self, campo)[i]
+
+    def como_dict(self, i):
+        return {campo: self.valor(i, campo) for campo in CAMPOS_TURNO}
+
+class FilaTurno(collections.abc.Mapping):
+    # Vista de solo lectura de una fila de TurnosDia. Al ser un Mapping completo
+    # se comporta como el dict de cargar_datos(usar_cache=False): in, items(),
+    # values(), dict(fila) y la comparación con un dict de los mismos valores.
+    __slots__ = ('_turnos', '_i')
+
+    def __init__(self, turnos, i):
+        self._turnos = turnos
+        self._i = i
+
+    def __getitem__(self, campo):
+        if campo not in CAMPOS_TURNO:
+            raise KeyError(campo)
+        return self._turnos.valor(self._i, campo)
+
+    def get(self, campo, defecto=None):
+        if campo not in CAMPOS_TURNO:
+            return defecto
+        return self._turnos.valor(self._i, campo)
+
+    def __contains__(self, campo):
+        return campo in CAMPOS_TURNO
+
+    def __iter__(self):
+        return iter(CAMPOS_TURNO)
+
+    def __len__(self):
+        return len(CAMPOS_TURNO)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class VistaTurnos(collections.abc.Sequence):
+    # Secuencia ordenada de filas; las vistas se crean al recorrerla
+    __slots__ = ('_turnos', '_orden')
+
+    def __init__(self, turnos, orden):
+        self._turnos = turnos
+        self._orden = orden
+
+    def __len__(self):
+        return len(self._orden)
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            return [FilaTurno(self._turnos, i) for i in self._orden[posicion]]
+        return FilaTurno(self._turnos, self._orden[posicion])
+
+    def __iter__(self):
+        turnos = self._turnos
+        for i in self._orden:
+            yield FilaTurno(turnos, i)
+
+class SnapshotDia:
+    # Copia local de los turnos del día que se mantiene aplicando solo los cambios
+    def __init__(self):
+        self.turnos = TurnosDia()
+        self.especialidades = []
+        self.ultimo_llamado = None
+        self.watermark = None
+        self.fecha = None
+        self.version = 0
+        self._datos = None
+        # True cuando como_datos() ya entregó vistas sobre self.turnos
+        self._publicado = False
+        self._lock = threading.Lock()
+        self._lock_actualizar = threading.Lock()
+
+    def aplicar(self, delta):
+        # Devuelve lo que realmente cambió, con el mismo formato de
+        # cargar_datos_incremental(), o None si no cambió nada
+        with self._lock:
+            cambio = False
+            turnos = self.turnos
+            if delta['completo']:
+                turnos = TurnosDia()
+                self.especialidades = delta['especialidades']
+                cambio = True
+            elif delta['pacientes'] and self._publicado:
+                # Un snapshot ya entregado nunca cambia: su 'version' y su 'huella'
+                # siguen describiendo las filas que lo acompañan
+                turnos = turnos.copia()
+
+            cambiados = []
+            for fila in delta['pacientes']:
+                if turnos.guardar(fila):
+                    cambiados.append(fila)
+                    cambio = True
+            if cambio and turnos is not self.turnos:
+                self.turnos = turnos
+                self._publicado = False
+
+            if delta['ultimo_llamado'] != self.ultimo_llamado:
+                self.ultimo_llamado = delta['ultimo_llamado']
+                cambio = True
+
+            self.watermark = delta['watermark']
+            self.fecha = delta['fecha']
+            if not cambio:
+                return None
+            self.version += 1
+            self._datos = None
+            return {
+                'completo': delta['completo'],
+                'watermark': self.watermark,
+                'fecha': self.fecha,
+                'especialidades': delta['especialidades'],
+                'pacientes': cambiados,
+                'ultimo_llamado': self.ultimo_llamado
+            }
+
+    def delta_completo(self):
+        with self._lock:
+            return {
+                'completo': True,
+                'watermark': self.watermark,
+                'fecha': self.fecha,
+                'especialidades': self.especialidades,
+                'pacientes': [self.turnos.como_dict(i) for i in range(len(self.turnos))],
+                'ultimo_llamado': self.ultimo_llamado
+            }
+
+    def actualizar(self):
+        # Serializado para que un delta viejo nunca pise a uno más nuevo
+        with self._lock_actualizar:
+            return self.aplicar(cargar_datos_incremental(self.watermark, self.fecha))
+
+    def como_datos(self):
+        # Mismo formato que cargar_datos(); se reconstruye solo si hubo cambios. Las
+        # filas son vistas sobre las columnas: comparar 'version' (o la identidad del
+        # dict) basta para saber si algo cambió, sin recorrer los turnos.
+        with self._lock:
+            if self._datos is None:
+                turnos = self.turnos
+                orden = array('l', sorted(
+                    range(len(turnos)),
+                    key=lambda i: (turnos.fecha_registro[i], turnos.turno_id[i])
+                ))
+                self._datos = {
+                    'especialidades': self.especialidades,
+                    'pacientes': VistaTurnos(turnos, orden),
+                    'ultimo_llamado': self.ultimo_llamado,
+                    'version': self.version,
+                    'huella': turnos.huella
+                }
+                self._publicado = True
+            return self._datos
+
+class ClienteHub(EscuchaCambios):
+    # Una sola conexión con el hub: recibe el snapshot inicial, los deltas empujados
+    # y las respuestas a las llamadas, así los deltas de una escritura llegan antes
+    # que su respuesta.
+    def __init__(self, direccion):
+        super().__init__()
+        host, _, puerto = direccion.rpartition(':')
+        if not host:
+            host, puerto = direccion, HUB_PUERTO
+        self.direccion = (host, int(puerto))
+        self.snapshot = SnapshotDia()
+        self._listo = threading.Event()
+        self._socket = None
+        self._lock_envio = threading.Lock()
+        self._pendientes = {}
+        self._siguiente_peticion = 0
+        self._rechazo = None  # Motivo con que el hub cerró la conexión (token inválido)
+
+    def cancelar(self, suscripcion_id):
+        # La conexión sigue abierta aunque no queden suscriptores: la usan las llamadas
+        with self._lock:
+            self._suscriptores.pop(suscripcion_id, None)
+
+    def obtener_snapshot(self):
+        self._iniciar()
+        if not self._listo.wait(HUB_TIMEOUT):
+            raise Exception(self._rechazo or
+                            f"No se pudo conectar con el hub de colas en {self.direccion[0]}:{self.direccion[1]}")
+        return self.snapshot
+
+    def llamar(self, funcion, *args, **kwargs):
+        self.obtener_snapshot()
+        respuesta = queue.Queue(maxsize=1)
+        with self._lock_envio:
+            if self._socket is None:
+                raise Exception("Sin conexión con el hub de colas")
+            self._siguiente_peticion += 1
+            peticion_id = self._siguiente_peticion
+            self._pendientes[peticion_id] = respuesta
+            try:
+                self._socket.sendall(codificar_mensaje({
+                    'op': 'llamar',
+                    'id': peticion_id,
+                    'funcion': funcion,
+                    'args': list(args),
+                    'kwargs': kwargs
+                }))
+            except OSError:
+                self._pendientes.pop(peticion_id, None)
+                raise
+
+        try:
+            tipo, valor = respuesta.get(timeout=HUB_TIMEOUT)
+        except queue.Empty:
+            self._pendientes.pop(peticion_id, None)
+            raise Exception(f"El hub de colas no respondió a {funcion}")
+        if tipo == 'error':
+            raise Exception(valor)
+        return valor
+
+    def _escuchar(self):
+        while not self._detener.is_set():
+            conexion = None
+            try:
+                conexion = socket.create_connection(self.direccion, timeout=HUB_TIMEOUT)
+                conexion.settimeout(None)
+                lector = conexion.makefile('rb')
+                with self._lock_envio:
+                    self._socket = conexion
+                    conexion.sendall(codificar_mensaje({'op': 'suscribir', 'token': HUB_TOKEN or ''}))
+
+                for linea in lector:
+                    mensaje = decodificar_mensaje(linea)
+                    if mensaje['tipo'] == 'delta':
+                        reconexion = self._listo.is_set() and mensaje['delta']['completo']
+                        self.snapshot.aplicar(mensaje['delta'])
+                        self._listo.set()
+                        self._emitir({'tipo': 'reconexion' if reconexion else 'hub'})
+                    elif mensaje['tipo'] in ('respuesta', 'error'):
+                        pendiente = self._pendientes.pop(mensaje['id'], None)
+                        if pendiente:
+                            pendiente.put((mensaje['tipo'], mensaje.get('resultado', mensaje.get('mensaje'))))
+                        elif mensaje['tipo'] == 'error':
+                            self._rechazo = mensaje.get('mensaje')
+                            print(f"Hub de colas: {self._rechazo}")
+            except Exception as e:
+                print(f"Error en conexión con el hub de colas: {e}")
+            finally:
+                with self._lock_envio:
+                    self._socket = None
+                    pendientes = list(self._pendientes.values())
+                    self._pendientes.clear()
+                for pendiente in pendientes:
+                    pendiente.put(('error', "Se perdió la conexión con el hub de colas"))
+                if conexion:
+                    conexion.close()
+            self._detener.wait(2)
+
+_escucha_cambios = ClienteHub(HUB_DIRECCION) if HUB_DIRECCION else EscuchaCambios()
+
+# Caché del día compartida por todo el proceso. Se invalida con las escrituras
+# locales y con los avisos de cambio; fuera de eso vale TTL_CACHE_DATOS segundos.
+TTL_CACHE_DATOS = 2.0
+
+_snapshot_compartido = SnapshotDia()
+_cache_lock = threading.Lock()
+_cache_vigente_hasta = 0.0
+_cache_generacion = 0
+_cache_suscrita = False
+_estadisticas_cache = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+
+def snapshot_compartido():
+    global _cache_vigente_hasta
+    if HUB_DIRECCION:
+        # El hub empuja cada cambio, así que la copia local siempre está vigente
+        return _escucha_cambios.obtener_snapshot()
+
+    with _cache_lock:
+        if time.monotonic() < _cache_vigente_hasta:
+            _estadisticas_cache['aciertos'] += 1
+            return _snapshot_compartido
+        _estadisticas_cache['fallos'] += 1
+        generacion = _cache_generacion
+
+    _suscribir_invalidacion_cache()
+    inicio = time.monotonic()
+    _snapshot_compartido.actualizar()
+    with _cache_lock:
+        # Si llegó una invalidación mientras se consultaba, la copia ya no es vigente
+        if generacion == _cache_generacion:
+            _cache_vigente_hasta = inicio + TTL_CACHE_DATOS
+    return _snapshot_compartido
+
+def invalidar_cache(evento=None):
+    global _cache_vigente_hasta, _cache_generacion
+    with _cache_lock:
+        _cache_generacion += 1
+        _cache_vigente_hasta = 0.0
+        _estadisticas_cache['invalidaciones'] += 1
+
+def _suscribir_invalidacion_cache():
+    global _cache_suscrita
+    with _cache_lock:
+        if _cache_suscrita:
+            return
+        _cache_suscrita = True
+    _escucha_cambios.suscribir(invalidar_cache)
+
+def estadisticas_cache():
+    with _cache_lock:
+        estadisticas = dict(_estadisticas_cache)
+    consultas = estadisticas['aciertos'] + estadisticas['fallos']
+    estadisticas['tasa_aciertos'] = estadisticas['aciertos'] / consultas if consultas else 0.0
+    return estadisticas
+
+@_trazar
+@_via_hub(escritura=True)
 def guardar_ultimo_llamado(mensaje):
     conexion = None
     try:
         conexion = obtener_conexion()
         with conexion.cursor() as cursor:
             cursor.execute("INSERT INTO ultimos_llamados (mensaje) VALUES (%s)", (mensaje,))
+            notificar_cambio(cursor, 'llamado')
             conexion.commit()
+            invalidar_cache()
     except Exception as e:
         if conexion:
             conexion.rollback()
@@ -173,13 +2083,17 @@ def guardar_ultimo_llamado(mensaje):
         if conexion:
             liberar_conexion(conexion)
 
+@_trazar
+@_via_hub(escritura=True)
 def limpiar_ultimo_llamado():
     conexion = None
     try:
         conexion = obtener_conexion()
         with conexion.cursor() as cursor:
             cursor.execute("DELETE FROM ultimos_llamados")
+            notificar_cambio(cursor, 'llamado')
             conexion.commit()
+            invalidar_cache()
     except Exception as e:
         if conexion:
             conexion.rollback()
@@ -189,35 +2103,250 @@ def limpiar_ultimo_llamado():
         if conexion:
             liberar_conexion(conexion)
 
-def guardar_paciente_multiple_especialidades(nombre, lista_especialidades, lista_consultorios):
+# Nombre de especialidad -> id. Las especialidades casi nunca cambian, así que se
+# consultan una vez y solo se recargan cuando aparece un nombre desconocido.
+_especialidades_por_nombre = {}
+_especialidades_lock = threading.Lock()
+
+@_trazar
+def mapa_especialidades(recargar=False):
+    global _especialidades_por_nombre
+    with _especialidades_lock:
+        if _especialidades_por_nombre and not recargar:
+            return _especialidades_por_nombre
+
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT id, nombre FROM especialidades")
+            mapa = {nombre: esp_id for esp_id, nombre in cursor.fetchall()}
+        with _especialidades_lock:
+            _especialidades_por_nombre = mapa
+        return mapa
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def obtener_ids_especialidades(nombres):
+    with _especialidades_lock:
+        faltan = any(nombre not in _especialidades_por_nombre for nombre in nombres)
+    if faltan:
+        mapa_especialidades(recargar=True)
+
+    ids = []
+    with _especialidades_lock:
+        for nombre in nombres:
+            if nombre not in _especialidades_por_nombre:
+                raise Exception(f"Especialidad '{nombre}' no encontrada")
+            ids.append(_especialidades_por_nombre[nombre])
+    return ids
+
+# Paciente, todos sus turnos y el aviso de cambio en una sola sentencia
+SQL_REGISTRAR_PACIENTE = """
+    WITH nuevo AS (
+        INSERT INTO pacientes (nombre, fecha_registro, atendido)
+        VALUES (%(nombre)s, CURRENT_TIMESTAMP, FALSE)
+        RETURNING id
+    ),
+    turnos AS (
+        INSERT INTO pacientes_especialidades (paciente_id, especialidad_id, consultorio)
+        SELECT nuevo.id, t.especialidad_id, t.consultorio
+        FROM nuevo,
+             unnest(%(especialidades)s::int[], %(consultorios)s::text[])
+                 WITH ORDINALITY AS t(especialidad_id, consultorio, orden)
+        ORDER BY t.orden
+        RETURNING id AS turno_id, paciente_id, especialidad_id, consultorio, fecha_registro
+    ),
+    aviso AS (
+        SELECT pg_notify(%(canal)s, json_build_object(
+            'tipo', 'registro',
+            'paciente_id', (SELECT id FROM nuevo)
+        )::text)
+    )
+    SELECT turnos.* FROM turnos, aviso
+    ORDER BY turnos.turno_id
+"""
+registrar_sentencia('registrar_paciente', SQL_REGISTRAR_PACIENTE)
+
+@_trazar
+@_via_hub(escritura=True)
+def registrar_paciente_turnos(nombre, lista_especialidades, lista_consultorios):
     if len(lista_especialidades) != len(lista_consultorios):
         raise Exception("La cantidad de especialidades y consultorios debe coincidir")
+    if not lista_especialidades:
+        raise Exception("Debe indicar al menos una especialidad")
+
+    especialidad_ids = obtener_ids_especialidades(lista_especialidades)
 
     conexion = None
     try:
         conexion = obtener_conexion()
-        with conexion.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO pacientes (nombre, fecha_registro, atendido)
-                VALUES (%s, CURRENT_TIMESTAMP, FALSE)
-                RETURNING id
-            """, (nombre,))
-            paciente_id = cursor.fetchone()[0]
-
-            for esp_nombre, consultorio in zip(lista_especialidades, lista_consultorios):
-                cursor.execute("SELECT id FROM especialidades WHERE nombre = %s", (esp_nombre,))
-                res = cursor.fetchone()
-                if not res:
-                    raise Exception(f"Especialidad '{esp_nombre}' no encontrada")
-                especialidad_id = res[0]
+        # Una sola sentencia ya es atómica: en autocommit se evitan los viajes de BEGIN y COMMIT
+        conexion.autocommit = True
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_REGISTRAR_PACIENTE, {
+                'nombre': nombre,
+                'especialidades': especialidad_ids,
+                'consultorios': list(lista_consultorios),
+                'canal': CANAL_CAMBIOS
+            })
+            turnos = cursor.fetchall()
+        invalidar_cache()
+        return {'paciente_id': turnos[0]['paciente_id'], 'turnos': turnos}
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+@_via_hub(escritura=True)
+def guardar_paciente_multiple_especialidades(nombre, lista_especialidades, lista_consultorios):
+    return registrar_paciente_turnos(nombre, lista_especialidades, lista_consultorios)['paciente_id']
+
+def normalizar_texto(texto):
+    # Minúsculas y sin tildes, para comparar lo que se escribe a mano o viene de Excel
+    descompuesto = unicodedata.normalize('NFKD', texto.strip().lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+def normalizar_consultorio(valor):
+    # Acepta "3", "consultorio 3" o "Consultorio 3"
+    encontrado = re.fullmatch(r"(?:consultorio\s*)?(\d+)", valor.strip(), re.IGNORECASE)
+    if not encontrado or int(encontrado.group(1)) < 1:
+        return None
+    return f"Consultorio {int(encontrado.group(1))}"
+
+SQL_IMPORTAR_CITAS = """
+    WITH nombres AS (
+        SELECT nombre, min(fila) AS fila FROM staging_citas GROUP BY nombre
+    ),
+    nuevos AS (
+        INSERT INTO pacientes (nombre, fecha_registro, atendido)
+        SELECT nombre, COALESCE(%(fecha)s::timestamp, CURRENT_TIMESTAMP), FALSE
+        FROM nombres ORDER BY fila
+        RETURNING id, nombre
+    ),
+    turnos AS (
+        -- Un microsegundo por fila conserva el orden del archivo como orden de llamado
+        INSERT INTO pacientes_especialidades (paciente_id, especialidad_id, consultorio, fecha_registro)
+        SELECT n.id, s.especialidad_id, s.consultorio,
+               COALESCE(%(fecha)s::timestamp, CURRENT_TIMESTAMP) + s.fila * INTERVAL '1 microsecond'
+        FROM staging_citas s
+        JOIN nuevos n ON n.nombre = s.nombre
+        ORDER BY s.fila
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM nuevos), (SELECT count(*) FROM turnos)
+"""
+
+@_trazar
+def importar_citas_csv(ruta, fecha_cita=None):
+    # Carga masiva de citas (nombre, especialidad, consultorio). Las filas se validan
+    # mientras se lee el archivo, las válidas pasan por COPY a una tabla temporal y
+    # de ahí a pacientes y turnos con dos INSERT en bloque, todo en una transacción.
+    # Las filas con el mismo nombre se registran como un solo paciente con varios turnos.
+    if HUB_DIRECCION:
+        raise Exception("La importación masiva requiere conexión directa a la base de datos")
+
+    especialidades = {normalizar_texto(n): esp_id for n, esp_id in mapa_especialidades(recargar=True).items()}
+    errores = []
+    vistos = set()
+    validas = 0
+
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo, \
+            tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', newline='', encoding='utf-8') as buffer:
+        muestra = archivo.read(4096)
+        archivo.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(archivo, dialecto)
+        escritor = csv.writer(buffer)
+
+        for fila, valores in enumerate(lector, start=1):
+            if not any(v.strip() for v in valores):
+                continue
+            if fila == 1 and [v.strip().lower() for v in valores[:3]] == ['nombre', 'especialidad', 'consultorio']:
+                continue
+            if len(valores) < 3:
+                errores.append((fila, "Se esperaban 3 columnas: nombre, especialidad, consultorio"))
+                continue
+
+            nombre = " ".join(valores[0].split())
+            especialidad = valores[1].strip()
+            consultorio = normalizar_consultorio(valores[2])
 
+            valido, mensaje = validar_nombre_paciente(nombre)
+            if not valido:
+                errores.append((fila, mensaje))
+                continue
+            especialidad_id = especialidades.get(normalizar_texto(especialidad))
+            if especialidad_id is None:
+                errores.append((fila, f"Especialidad '{especialidad}' no encontrada"))
+                continue
+            if not consultorio:
+                errores.append((fila, f"Consultorio '{valores[2].strip()}' no válido"))
+                continue
+            if (nombre, especialidad_id) in vistos:
+                errores.append((fila, f"Turno duplicado de {nombre} en {especialidad}"))
+                continue
+            vistos.add((nombre, especialidad_id))
+
+            escritor.writerow([fila, nombre, especialidad_id, consultorio])
+            validas += 1
+
+        resultado = {'pacientes': 0, 'turnos': 0, 'errores': errores}
+        if not validas:
+            return resultado
+
+        buffer.seek(0)
+        conexion = None
+        try:
+            conexion = obtener_conexion()
+            with conexion.cursor() as cursor:
                 cursor.execute("""
-                    INSERT INTO pacientes_especialidades (paciente_id, especialidad_id, consultorio)
-                    VALUES (%s, %s, %s)
-                """, (paciente_id, especialidad_id, consultorio))
+                    CREATE TEMP TABLE staging_citas (
+                        fila INTEGER,
+                        nombre TEXT,
+                        especialidad_id INTEGER,
+                        consultorio TEXT
+                    ) ON COMMIT DROP
+                """)
+                cursor.copy_expert("COPY staging_citas FROM STDIN WITH (FORMAT csv)", buffer)
+                cursor.execute(SQL_IMPORTAR_CITAS, {'fecha': fecha_cita})
+                resultado['pacientes'], resultado['turnos'] = cursor.fetchone()
+                notificar_cambio(cursor, 'importacion', pacientes=resultado['pacientes'])
+                conexion.commit()
+                invalidar_cache()
+            return resultado
+        except Exception as e:
+            if conexion:
+                conexion.rollback()
+            raise e
+        finally:
+            if conexion:
+                liberar_conexion(conexion)
+
+@_trazar
+@_via_hub(escritura=True)
+def actualizar_paciente(paciente_id, nuevo_nombre, nueva_especialidad, nuevo_consultorio, turno_id=None):
+    # Con turno_id solo cambia ese turno; sin él, todos los del paciente
+    esp_id = obtener_ids_especialidades([nueva_especialidad])[0]
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("UPDATE pacientes SET nombre = %s WHERE id = %s", (nuevo_nombre, paciente_id))
+
+            cursor.execute("""
+                UPDATE pacientes_especialidades 
+                SET especialidad_id = %s, consultorio = %s 
+                WHERE paciente_id = %s
+                  AND (%s IS NULL OR id = %s)
+            """, (esp_id, nuevo_consultorio, paciente_id, turno_id, turno_id))
 
+            notificar_cambio(cursor, 'edicion', paciente_id=paciente_id)
             conexion.commit()
-            return paciente_id
+            invalidar_cache()
     except Exception as e:
         if conexion:
             conexion.rollback()
@@ -226,41 +2355,116 @@ def guardar_paciente_multiple_especialidades(nombre, lista_especialidades, lista
         if conexion:
             liberar_conexion(conexion)
 
+@_trazar
+@_via_hub(escritura=True)
 def llamar_siguiente_paciente(consultorio_id):
+    # Elegir el turno, marcarlo atendido, guardar el anuncio y avisar van en una sola
+    # sentencia: un viaje a la base y la pantalla ve el llamado y la cola a la vez
     consultorio = f"Consultorio {consultorio_id}"
     conexion = None
     try:
         conexion = obtener_conexion()
-        with conexion.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute("""
-                SELECT 
-                    pe.paciente_id, 
-                    p.nombre, 
-                    pe.consultorio
-                FROM pacientes_especialidades pe
-                JOIN pacientes p ON p.id = pe.paciente_id
-                WHERE pe.consultorio = %s
-                  AND pe.atendido = FALSE
-                  AND pe.fecha_registro::date = CURRENT_DATE
-                ORDER BY pe.fecha_registro ASC
-                LIMIT 1
-                FOR UPDATE SKIP LOCKED
-            """, (consultorio,))
-
+        conexion.autocommit = True
+        with conexion.cursor(cursor_factory=RealDictCursor) as cursor:
+            ejecutar_preparada(cursor, SQL_LLAMAR_SIGUIENTE, {'consultorio': consultorio, 'canal': CANAL_CAMBIOS})
             paciente = cursor.fetchone()
-            if not paciente:
+        if paciente:
+            invalidar_cache()
+        return paciente
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def _limites_periodo(fecha, granularidad):
+    if granularidad == 'diaria':
+        inicio = fecha
+        fin = fecha + timedelta(days=1)
+        return inicio, fin, inicio.strftime('%Y%m%d')
+    inicio = fecha.replace(day=1)
+    fin = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, fin, inicio.strftime('%Y%m')
+
+def crear_particiones(cursor, granularidad, desde, periodos):
+    # Las filas que hayan caído en la partición DEFAULT se mueven a la nueva antes de
+    # adjuntarla; si no, PostgreSQL rechaza el ATTACH.
+    creadas = []
+    fecha = desde
+    for _ in range(periodos):
+        inicio, fin, sufijo = _limites_periodo(fecha, granularidad)
+        nombre = f"pacientes_especialidades_p{sufijo}"
+        cursor.execute("SELECT to_regclass(%s)", (nombre,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"""
+                CREATE TABLE {nombre}
+                (LIKE pacientes_especialidades INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            """)
+            cursor.execute(f"""
+                WITH movidos AS (
+                    DELETE FROM pacientes_especialidades_default
+                    WHERE fecha_registro >= %s AND fecha_registro < %s
+                    RETURNING *
+                )
+                INSERT INTO {nombre} SELECT * FROM movidos
+            """, (inicio, fin))
+            cursor.execute(f"""
+                ALTER TABLE pacientes_especialidades ATTACH PARTITION {nombre}
+                FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fin.isoformat()}')
+            """)
+            creadas.append(nombre)
+        fecha = fin
+    return creadas
+
+@_trazar
+def mantener_particiones(periodos_adelante=None, retencion_dias=None):
+    # Crea por adelantado las particiones de los próximos días/meses y, si se indica
+    # una retención, separa las viejas moviéndolas al esquema "archivo".
+    if HUB_DIRECCION:
+        return None  # de eso se encarga el hub
+
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('particiones_config')")
+            if cursor.fetchone()[0] is None:
+                return None
+            cursor.execute("SELECT granularidad FROM particiones_config WHERE tabla = 'pacientes_especialidades'")
+            fila = cursor.fetchone()
+            if not fila:
                 return None
+            granularidad = fila[0]
 
-            cursor.execute("""
-                UPDATE pacientes_especialidades 
-                SET atendido = TRUE, 
-                    fecha_atencion = CURRENT_TIMESTAMP
-                WHERE paciente_id = %s AND consultorio = %s AND atendido = FALSE
-                RETURNING paciente_id
-            """, (paciente['paciente_id'], consultorio))
+            # Evita que dos clientes creen la misma partición a la vez
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('mantener_particiones'))")
+            cursor.execute("SELECT CURRENT_DATE")
+            hoy = cursor.fetchone()[0]
+
+            if periodos_adelante is None:
+                periodos_adelante = 14 if granularidad == 'diaria' else 3
+            creadas = crear_particiones(cursor, granularidad, hoy, periodos_adelante)
+
+            archivadas = []
+            if retencion_dias:
+                limite = hoy - timedelta(days=retencion_dias)
+                cursor.execute("""
+                    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'pacientes_especialidades'::regclass
+                """)
+                for nombre, limites in cursor.fetchall():
+                    encontrado = re.search(r"TO \('([^']+)'\)", limites)
+                    if not encontrado:
+                        continue
+                    fin = datetime.fromisoformat(encontrado.group(1)).date()
+                    if fin <= limite:
+                        cursor.execute("CREATE SCHEMA IF NOT EXISTS archivo")
+                        cursor.execute(f"ALTER TABLE pacientes_especialidades DETACH PARTITION {nombre}")
+                        cursor.execute(f"ALTER TABLE {nombre} SET SCHEMA archivo")
+                        archivadas.append(nombre)
 
             conexion.commit()
-            return paciente
+            return {'granularidad': granularidad, 'creadas': creadas, 'archivadas': archivadas}
     except Exception as e:
         if conexion:
             conexion.rollback()
@@ -269,34 +2473,89 @@ def llamar_siguiente_paciente(consultorio_id):
         if conexion:
             liberar_conexion(conexion)
 
-def cargar_logo(parent):
-    posibles = []
-    if getattr(sys, 'frozen', False):
-        posibles.append(sys._MEIPASS)
-        posibles.append(os.path.dirname(sys.executable))
-    posibles.append(os.path.dirname(os.path.abspath(__file__)))
-
-    image_path = None
-    for base in posibles:
-        ruta = os.path.join(base, 'logo_hospital.png')
-        if os.path.isfile(ruta):
-            image_path = ruta
-            break
+class IndiceFiltro:
+    # Índices en memoria para filtrar el reporte sin recorrer todas las filas:
+    # trigramas de los nombres normalizados (minúsculas y sin tildes, para buscar
+    # "Nuñez" o "Garcia" como se escriba) y listas de filas por especialidad y por
+    # consultorio. Se parte de la lista de candidatos más corta y se verifica el resto.
+    def __init__(self, nombres, especialidades, consultorios):
+        self.especialidades = especialidades
+        self.consultorios = consultorios
+        self.por_especialidad = {}
+        self.por_consultorio = {}
+        for fila, (especialidad, consultorio) in enumerate(zip(especialidades, consultorios)):
+            self.por_especialidad.setdefault(especialidad, []).append(fila)
+            self.por_consultorio.setdefault(consultorio, []).append(fila)
 
-    if not image_path:
-        print("Error al cargar logo: logo_hospital.png no encontrado en ninguna ruta conocida")
-        return tk.Label(parent, text="Logo no encontrado", bg='#f0f8ff')
+        # Un paciente con varios turnos repite el nombre: cada nombre distinto se indexa una vez
+        self.nombres = []
+        self.filas_nombre = []
+        self.nombre_fila = []
+        ids = {}
+        for fila, nombre in enumerate(nombres):
+            nombre_id = ids.get(nombre)
+            if nombre_id is None:
+                nombre_id = ids[nombre] = len(self.nombres)
+                self.nombres.append(" ".join(normalizar_texto(nombre).split()))
+                self.filas_nombre.append([])
+            self.filas_nombre[nombre_id].append(fila)
+            self.nombre_fila.append(nombre_id)
 
-    try:
-        img = Image.open(image_path)
-        img = img.resize((200, 200), Image.LANCZOS)
-        logo = ImageTk.PhotoImage(img)
-        lbl = tk.Label(parent, image=logo, bg='#f0f8ff')
-        lbl.image = logo
-        return lbl
-    except Exception as e:
-        print(f"Error al procesar logo: {e}")
-        return tk.Label(parent, text="Logo no cargado", bg='#f0f8ff')
+        self._ultima_busqueda = (None, None)
+        self.trigramas = {}
+        for nombre_id, nombre in enumerate(self.nombres):
+            for trigrama in {nombre[i:i + 3] for i in range(len(nombre) - 2)}:
+                self.trigramas.setdefault(trigrama, []).append(nombre_id)
+
+    def _buscar_nombres(self, texto):
+        anterior, encontrados = self._ultima_busqueda
+        if anterior and anterior in texto:
+            # Al seguir escribiendo solo se revisan los nombres que ya coincidían
+            candidatos = encontrados
+        elif len(texto) < 3:
+            candidatos = range(len(self.nombres))
+        else:
+            listas = []
+            for i in range(len(texto) - 2):
+                lista = self.trigramas.get(texto[i:i + 3])
+                if not lista:
+                    return []
+                listas.append(lista)
+            candidatos = min(listas, key=len)
+        nombres = self.nombres
+        encontrados = [i for i in candidatos if texto in nombres[i]]
+        self._ultima_busqueda = (texto, encontrados)
+        return encontrados
+
+    def filtrar(self, texto=None, especialidad=None, consultorio=None):
+        # Devuelve las filas que cumplen todos los filtros, en orden; None si no hay filtros
+        texto = " ".join(normalizar_texto(texto).split()) if texto else ""
+        if not (texto or especialidad or consultorio):
+            return None
+
+        candidatos = None
+        if especialidad:
+            candidatos = self.por_especialidad.get(especialidad, [])
+        if consultorio:
+            filas = self.por_consultorio.get(consultorio, [])
+            if candidatos is None or len(filas) < len(candidatos):
+                candidatos = filas
+
+        permitidos = None
+        if texto:
+            nombre_ids = self._buscar_nombres(texto)
+            if candidatos is None or sum(map(len, map(self.filas_nombre.__getitem__, nombre_ids))) < len(candidatos):
+                candidatos = sorted(fila for i in nombre_ids for fila in self.filas_nombre[i])
+                if not (especialidad or consultorio):
+                    return candidatos
+            permitidos = set(nombre_ids)
+
+        return [
+            fila for fila in candidatos
+            if (permitidos is None or self.nombre_fila[fila] in permitidos)
+            and (not especialidad or self.especialidades[fila] == especialidad)
+            and (not consultorio or self.consultorios[fila] == consultorio)
+        ]
 
 def validar_nombre_paciente(nombre):
     if not nombre or len(nombre.strip()) < 3:
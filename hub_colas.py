@@ -0,0 +1,170 @@
+import asyncio
+import argparse
+import hmac
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import hospital_lib
+from hospital_lib import (
+    SnapshotDia,
+    FUNCIONES_HUB,
+    HUB_PUERTO,
+    HUB_TOKEN,
+    codificar_mensaje,
+    decodificar_mensaje,
+    suscribir_cambios,
+    mantener_particiones,
+    marcar_hito,
+    reportar_arranque,
+    verificar_esquema,
+)
+
+# Un cliente que no lee lo que se le envía se desconecta al superar este búfer
+LIMITE_BUFER_CLIENTE = 4 * 1024 * 1024
+
+class HubColas:
+    # Único proceso con acceso a PostgreSQL: mantiene la cola del día en memoria y
+    # reparte el snapshot y sus deltas a consultorios, admisión y pantallas.
+    def __init__(self, token, max_consultas=8):
+        self.token = token.encode('utf-8')
+        self.snapshot = SnapshotDia()
+        self.clientes = set()
+        # Menos hilos que conexiones del pool, para no agotarlo
+        self.ejecutor = ThreadPoolExecutor(max_workers=max_consultas)
+        self.loop = None
+        self.lock_refresco = None
+        self.hay_cambios = None
+
+    async def iniciar(self, host, puerto):
+        self.loop = asyncio.get_running_loop()
+        self.lock_refresco = asyncio.Lock()
+        self.hay_cambios = asyncio.Event()
+
+        try:
+            await self.loop.run_in_executor(self.ejecutor, mantener_particiones)
+        except Exception as e:
+            print(f"Error al mantener particiones: {e}")
+
+        await self.loop.run_in_executor(self.ejecutor, self.snapshot.actualizar)
+        marcar_hito('primeros datos')
+        reportar_arranque('hub_colas')
+        suscribir_cambios(lambda evento: self.loop.call_soon_threadsafe(self.hay_cambios.set))
+
+        servidor = await asyncio.start_server(self.atender_cliente, host, puerto)
+        print(f"Hub de colas escuchando en {host}:{puerto}")
+        asyncio.create_task(self.vigilar_cambios())
+        async with servidor:
+            await servidor.serve_forever()
+
+    async def vigilar_cambios(self):
+        while True:
+            await self.hay_cambios.wait()
+            self.hay_cambios.clear()
+            try:
+                await self.refrescar()
+            except Exception as e:
+                print(f"Error al refrescar la cola: {e}")
+
+    async def refrescar(self):
+        async with self.lock_refresco:
+            delta = await self.loop.run_in_executor(self.ejecutor, self.snapshot.actualizar)
+            if delta:
+                mensaje = codificar_mensaje({'tipo': 'delta', 'delta': delta})
+                for escritor in list(self.clientes):
+                    self._enviar(escritor, mensaje)
+
+    def _enviar(self, escritor, mensaje):
+        if escritor.is_closing():
+            self.clientes.discard(escritor)
+            return
+        if escritor.transport.get_write_buffer_size() > LIMITE_BUFER_CLIENTE:
+            print("Cliente del hub desconectado: no consume los mensajes")
+            self.clientes.discard(escritor)
+            escritor.close()
+            return
+        escritor.write(mensaje)
+
+    def _token_valido(self, mensaje):
+        return hmac.compare_digest(str(mensaje.get('token', '')).encode('utf-8'), self.token)
+
+    async def atender_cliente(self, lector, escritor):
+        autenticado = False
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                mensaje = decodificar_mensaje(linea)
+                if not autenticado:
+                    # El primer mensaje trae el token; hasta entonces no se atiende nada
+                    if not self._token_valido(mensaje):
+                        print(f"Cliente del hub rechazado: token inválido ({escritor.get_extra_info('peername')})")
+                        self._enviar(escritor, codificar_mensaje({
+                            'tipo': 'error',
+                            'id': mensaje.get('id'),
+                            'mensaje': "Token del hub inválido: revise HOSPITAL_HUB_TOKEN"
+                        }))
+                        break
+                    autenticado = True
+                op = mensaje.get('op')
+                if op == 'suscribir':
+                    # Bajo el mismo lock que los deltas: el cliente no puede perderse ninguno
+                    async with self.lock_refresco:
+                        self._enviar(escritor, codificar_mensaje({
+                            'tipo': 'delta',
+                            'delta': self.snapshot.delta_completo()
+                        }))
+                        self.clientes.add(escritor)
+                elif op == 'llamar':
+                    asyncio.create_task(self.ejecutar(escritor, mensaje))
+                else:
+                    self._enviar(escritor, codificar_mensaje({
+                        'tipo': 'error',
+                        'id': mensaje.get('id'),
+                        'mensaje': f"Operación desconocida: {op}"
+                    }))
+        except (ConnectionError, ValueError) as e:
+            print(f"Cliente del hub desconectado: {e}")
+        finally:
+            self.clientes.discard(escritor)
+            escritor.close()
+
+    async def ejecutar(self, escritor, mensaje):
+        nombre = mensaje.get('funcion')
+        try:
+            if nombre not in FUNCIONES_HUB:
+                raise Exception(f"Función no permitida a través del hub: {nombre}")
+            funcion = getattr(hospital_lib, nombre)
+            args = mensaje.get('args', [])
+            kwargs = mensaje.get('kwargs', {})
+            resultado = await self.loop.run_in_executor(self.ejecutor, lambda: funcion(*args, **kwargs))
+            if FUNCIONES_HUB[nombre]:
+                # El delta de la escritura sale antes que la respuesta por la misma conexión
+                await self.refrescar()
+            respuesta = {'tipo': 'respuesta', 'id': mensaje.get('id'), 'resultado': resultado}
+        except Exception as e:
+            respuesta = {'tipo': 'error', 'id': mensaje.get('id'), 'mensaje': str(e)}
+        self._enviar(escritor, codificar_mensaje(respuesta))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hub de colas del hospital")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interfaz donde escuchar; 0.0.0.0 para atender a otras máquinas")
+    parser.add_argument("--puerto", type=int, default=HUB_PUERTO)
+    args = parser.parse_args()
+
+    if hospital_lib.HUB_DIRECCION:
+        print("El hub necesita acceso directo a la base: quite la variable HOSPITAL_HUB")
+        sys.exit(1)
+    if not HUB_TOKEN:
+        print("Defina HOSPITAL_HUB_TOKEN (el mismo en el hub y en los clientes) antes de iniciar el hub")
+        sys.exit(1)
+    try:
+        verificar_esquema()
+    except Exception as e:
+        print(f"Error al verificar la base de datos: {e}")
+        sys.exit(1)
+
+    try:
+        asyncio.run(HubColas(HUB_TOKEN).iniciar(args.host, args.puerto))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,44 @@
+import argparse
+import csv
+import sys
+from datetime import datetime
+from hospital_lib import importar_citas_csv
+
+# Importación masiva de citas programadas desde un CSV con columnas
+# nombre, especialidad, consultorio (separador coma, punto y coma o tabulador).
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa citas programadas desde un archivo CSV")
+    parser.add_argument("archivo")
+    parser.add_argument("--fecha", help="Fecha de las citas (AAAA-MM-DD); por defecto, hoy")
+    parser.add_argument("--reporte", help="Archivo CSV donde guardar las filas rechazadas")
+    args = parser.parse_args()
+
+    if args.fecha:
+        try:
+            datetime.strptime(args.fecha, "%Y-%m-%d")
+        except ValueError:
+            print("Fecha no válida, use AAAA-MM-DD")
+            sys.exit(1)
+
+    try:
+        resultado = importar_citas_csv(args.archivo, args.fecha)
+    except Exception as e:
+        print(f"Error al importar citas: {e}")
+        sys.exit(1)
+
+    errores = resultado['errores']
+    print(f"Pacientes registrados: {resultado['pacientes']}")
+    print(f"Turnos registrados: {resultado['turnos']}")
+    print(f"Filas rechazadas: {len(errores)}")
+
+    if errores and args.reporte:
+        with open(args.reporte, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Fila", "Error"])
+            writer.writerows(errores)
+        print(f"Reporte de errores guardado en {args.reporte}")
+    else:
+        for fila, mensaje in errores[:20]:
+            print(f"  Fila {fila}: {mensaje}")
+        if len(errores) > 20:
+            print(f"  ... y {len(errores) - 20} más (use --reporte para verlas todas)")
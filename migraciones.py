@@ -0,0 +1,562 @@
+import sys
+import json
+import argparse
+from datetime import datetime
+from hospital_lib import (
+    obtener_conexion,
+    liberar_conexion,
+    crear_particiones,
+    mantener_particiones,
+    asignar_consultorios_especialidad,
+    SQL_PACIENTES_ESPERA,
+    SQL_HISTORIAL_ATENCION,
+    SQL_PACIENTES_DIA,
+    SQL_PACIENTES_DELTA,
+    SQL_LLAMAR_SIGUIENTE,
+    SQL_COLA_CONSULTORIO,
+    SQL_COLA_CONSULTORIO_DELTA,
+    SQL_HISTORIAL_PAGINA,
+    SQL_RESUMEN_COLAS,
+    SQL_CARGA_CONSULTORIOS,
+    CANAL_CAMBIOS,
+)
+
+# Cada migración se aplica una sola vez y queda registrada en schema_migraciones.
+# Las sentencias son idempotentes para poder correr sobre bases ya existentes.
+MIGRACIONES = [
+    (1, "esquema base", """
+        CREATE TABLE IF NOT EXISTS especialidades (
+            id SERIAL PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS pacientes (
+            id SERIAL PRIMARY KEY,
+            nombre VARCHAR(200) NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atendido BOOLEAN DEFAULT FALSE
+        );
+        CREATE TABLE IF NOT EXISTS pacientes_especialidades (
+            paciente_id INTEGER NOT NULL REFERENCES pacientes(id),
+            especialidad_id INTEGER NOT NULL REFERENCES especialidades(id),
+            consultorio VARCHAR(50) NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atendido BOOLEAN DEFAULT FALSE,
+            fecha_atencion TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS ultimos_llamados (
+            id SERIAL PRIMARY KEY,
+            mensaje TEXT NOT NULL,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (2, "marca de cambio por turno", """
+        ALTER TABLE pacientes_especialidades ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+        ALTER TABLE pacientes_especialidades
+            ADD COLUMN IF NOT EXISTS txid_cambio BIGINT NOT NULL DEFAULT txid_current();
+
+        CREATE OR REPLACE FUNCTION marcar_cambio_turno() RETURNS trigger AS $$
+        BEGIN
+            NEW.txid_cambio := txid_current();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_marcar_cambio_turno ON pacientes_especialidades;
+        CREATE TRIGGER trg_marcar_cambio_turno
+            BEFORE INSERT OR UPDATE ON pacientes_especialidades
+            FOR EACH ROW EXECUTE FUNCTION marcar_cambio_turno();
+
+        -- Un cambio de nombre también debe viajar en la carga incremental
+        CREATE OR REPLACE FUNCTION marcar_cambio_paciente() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.nombre IS DISTINCT FROM OLD.nombre THEN
+                UPDATE pacientes_especialidades SET txid_cambio = txid_current()
+                WHERE paciente_id = NEW.id;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_marcar_cambio_paciente ON pacientes;
+        CREATE TRIGGER trg_marcar_cambio_paciente
+            AFTER UPDATE ON pacientes
+            FOR EACH ROW EXECUTE FUNCTION marcar_cambio_paciente();
+
+        CREATE INDEX IF NOT EXISTS idx_pe_txid_cambio ON pacientes_especialidades (txid_cambio);
+    """),
+    (3, "indices de la cola del dia", """
+        -- Carga del día completo (cargar_datos, carga incremental)
+        CREATE INDEX IF NOT EXISTS idx_pe_fecha_registro
+            ON pacientes_especialidades (fecha_registro);
+        -- Espera e historial por consultorio
+        CREATE INDEX IF NOT EXISTS idx_pe_consultorio_atendido_fecha
+            ON pacientes_especialidades (consultorio, atendido, fecha_registro);
+        -- Siguiente paciente: solo los pendientes, ya ordenados por llegada
+        CREATE INDEX IF NOT EXISTS idx_pe_pendientes
+            ON pacientes_especialidades (consultorio, fecha_registro)
+            WHERE atendido = FALSE;
+        CREATE INDEX IF NOT EXISTS idx_pe_historial
+            ON pacientes_especialidades (consultorio, fecha_atencion DESC)
+            WHERE atendido = TRUE;
+        -- Trigger de cambio de nombre y edición de pacientes
+        CREATE INDEX IF NOT EXISTS idx_pe_paciente
+            ON pacientes_especialidades (paciente_id);
+        CREATE INDEX IF NOT EXISTS idx_ultimos_llamados_fecha
+            ON ultimos_llamados (fecha DESC);
+    """),
+    (4, "resumen de colas por consultorio", """
+        -- Contadores por día, consultorio y especialidad: los tableros y admisión leen
+        -- unas decenas de filas en lugar de recorrer la cola del día
+        CREATE TABLE IF NOT EXISTS resumen_colas (
+            fecha DATE NOT NULL,
+            consultorio VARCHAR(50) NOT NULL,
+            especialidad_id INTEGER NOT NULL,
+            pendientes INTEGER NOT NULL DEFAULT 0,
+            atendidos INTEGER NOT NULL DEFAULT 0,
+            -- Suma en segundos de fecha_atencion - fecha_registro y cuántos atendidos la tienen
+            espera_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+            esperas INTEGER NOT NULL DEFAULT 0,
+            primer_pendiente TIMESTAMP,
+            PRIMARY KEY (fecha, consultorio, especialidad_id)
+        );
+
+        -- Suma (o resta) a los contadores de una fila; si cambió la cantidad de
+        -- pendientes se relee el más antiguo, que al llamar al siguiente casi
+        -- siempre es justamente el que salió (idx_pe_pendientes)
+        CREATE OR REPLACE FUNCTION sumar_resumen_colas(
+            p_fecha DATE, p_consultorio VARCHAR, p_especialidad_id INTEGER,
+            p_pendientes INTEGER, p_atendidos INTEGER, p_espera DOUBLE PRECISION, p_esperas INTEGER
+        ) RETURNS void AS $$
+        BEGIN
+            INSERT INTO resumen_colas AS r
+                (fecha, consultorio, especialidad_id, pendientes, atendidos, espera_total, esperas)
+            VALUES (p_fecha, p_consultorio, p_especialidad_id, p_pendientes, p_atendidos, p_espera, p_esperas)
+            ON CONFLICT (fecha, consultorio, especialidad_id) DO UPDATE SET
+                pendientes = r.pendientes + EXCLUDED.pendientes,
+                atendidos = r.atendidos + EXCLUDED.atendidos,
+                espera_total = r.espera_total + EXCLUDED.espera_total,
+                esperas = r.esperas + EXCLUDED.esperas;
+            -- Va en una sentencia aparte, ya con la fila bloqueada: su snapshot
+            -- incluye lo que confirmó quien tenía el bloqueo antes
+            IF p_pendientes <> 0 THEN
+                UPDATE resumen_colas SET primer_pendiente = (
+                    SELECT min(pe.fecha_registro)
+                    FROM pacientes_especialidades pe
+                    WHERE pe.consultorio = p_consultorio
+                      AND pe.especialidad_id = p_especialidad_id
+                      AND pe.atendido = FALSE
+                      AND pe.fecha_registro >= p_fecha
+                      AND pe.fecha_registro < p_fecha + 1
+                )
+                WHERE fecha = p_fecha
+                  AND consultorio = p_consultorio
+                  AND especialidad_id = p_especialidad_id;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION sumar_turno_resumen_colas(
+            p_fecha_registro TIMESTAMP, p_consultorio VARCHAR, p_especialidad_id INTEGER,
+            p_atendido BOOLEAN, p_fecha_atencion TIMESTAMP, p_signo INTEGER
+        ) RETURNS void AS $$
+        BEGIN
+            IF p_fecha_registro IS NULL THEN
+                RETURN;
+            END IF;
+            IF COALESCE(p_atendido, FALSE) THEN
+                PERFORM sumar_resumen_colas(p_fecha_registro::date, p_consultorio, p_especialidad_id, 0, p_signo,
+                    COALESCE(p_signo * EXTRACT(EPOCH FROM p_fecha_atencion - p_fecha_registro), 0),
+                    CASE WHEN p_fecha_atencion IS NOT NULL THEN p_signo ELSE 0 END);
+            ELSE
+                PERFORM sumar_resumen_colas(p_fecha_registro::date, p_consultorio, p_especialidad_id, p_signo, 0, 0, 0);
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Llamar al siguiente, editar o borrar toca uno o pocos turnos: trigger por fila
+        CREATE OR REPLACE FUNCTION actualizar_resumen_colas_turno() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM sumar_turno_resumen_colas(OLD.fecha_registro, OLD.consultorio, OLD.especialidad_id,
+                                                  OLD.atendido, OLD.fecha_atencion, -1);
+            -- Las dos filas del resumen se tocan en el mismo orden que en la importación,
+            -- así dos traslados cruzados simultáneos no se bloquean mutuamente
+            ELSIF (OLD.fecha_registro::date, OLD.consultorio, OLD.especialidad_id)
+                    <= (NEW.fecha_registro::date, NEW.consultorio, NEW.especialidad_id) THEN
+                PERFORM sumar_turno_resumen_colas(OLD.fecha_registro, OLD.consultorio, OLD.especialidad_id,
+                                                  OLD.atendido, OLD.fecha_atencion, -1);
+                PERFORM sumar_turno_resumen_colas(NEW.fecha_registro, NEW.consultorio, NEW.especialidad_id,
+                                                  NEW.atendido, NEW.fecha_atencion, 1);
+            ELSE
+                PERFORM sumar_turno_resumen_colas(NEW.fecha_registro, NEW.consultorio, NEW.especialidad_id,
+                                                  NEW.atendido, NEW.fecha_atencion, 1);
+                PERFORM sumar_turno_resumen_colas(OLD.fecha_registro, OLD.consultorio, OLD.especialidad_id,
+                                                  OLD.atendido, OLD.fecha_atencion, -1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Registrar o importar inserta muchos turnos de una vez: un trigger por sentencia
+        -- los agrupa y actualiza cada fila del resumen una sola vez, en orden de clave
+        CREATE OR REPLACE FUNCTION actualizar_resumen_colas_registro() RETURNS trigger AS $$
+        DECLARE
+            d RECORD;
+        BEGIN
+            FOR d IN
+                SELECT fecha_registro::date AS fecha, consultorio, especialidad_id,
+                       count(*) FILTER (WHERE NOT COALESCE(atendido, FALSE))::integer AS pendientes,
+                       count(*) FILTER (WHERE atendido)::integer AS atendidos,
+                       COALESCE(sum(EXTRACT(EPOCH FROM fecha_atencion - fecha_registro))
+                                FILTER (WHERE atendido AND fecha_atencion IS NOT NULL), 0)::double precision AS espera_total,
+                       count(*) FILTER (WHERE atendido AND fecha_atencion IS NOT NULL)::integer AS esperas
+                FROM nuevos
+                WHERE fecha_registro IS NOT NULL
+                GROUP BY 1, 2, 3
+                ORDER BY 1, 2, 3
+            LOOP
+                PERFORM sumar_resumen_colas(d.fecha, d.consultorio, d.especialidad_id,
+                                            d.pendientes, d.atendidos, d.espera_total, d.esperas);
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Los triggers van antes del recuento: bloquean las escrituras hasta el commit
+        DROP TRIGGER IF EXISTS trg_resumen_colas_insert ON pacientes_especialidades;
+        CREATE TRIGGER trg_resumen_colas_insert
+            AFTER INSERT ON pacientes_especialidades
+            REFERENCING NEW TABLE AS nuevos
+            FOR EACH STATEMENT EXECUTE FUNCTION actualizar_resumen_colas_registro();
+        -- Un UPDATE que no toca la cola (txid_cambio por un cambio de nombre) no llega a la función
+        DROP TRIGGER IF EXISTS trg_resumen_colas_update ON pacientes_especialidades;
+        CREATE TRIGGER trg_resumen_colas_update
+            AFTER UPDATE ON pacientes_especialidades
+            FOR EACH ROW
+            WHEN (OLD.atendido IS DISTINCT FROM NEW.atendido
+                  OR OLD.consultorio IS DISTINCT FROM NEW.consultorio
+                  OR OLD.especialidad_id IS DISTINCT FROM NEW.especialidad_id
+                  OR OLD.fecha_registro IS DISTINCT FROM NEW.fecha_registro
+                  OR OLD.fecha_atencion IS DISTINCT FROM NEW.fecha_atencion)
+            EXECUTE FUNCTION actualizar_resumen_colas_turno();
+        DROP TRIGGER IF EXISTS trg_resumen_colas_delete ON pacientes_especialidades;
+        CREATE TRIGGER trg_resumen_colas_delete
+            AFTER DELETE ON pacientes_especialidades
+            FOR EACH ROW EXECUTE FUNCTION actualizar_resumen_colas_turno();
+
+        TRUNCATE resumen_colas;
+        INSERT INTO resumen_colas
+            (fecha, consultorio, especialidad_id, pendientes, atendidos, espera_total, esperas, primer_pendiente)
+        SELECT fecha_registro::date, consultorio, especialidad_id,
+               count(*) FILTER (WHERE NOT COALESCE(atendido, FALSE)),
+               count(*) FILTER (WHERE atendido),
+               COALESCE(sum(EXTRACT(EPOCH FROM fecha_atencion - fecha_registro))
+                        FILTER (WHERE atendido AND fecha_atencion IS NOT NULL), 0),
+               count(*) FILTER (WHERE atendido AND fecha_atencion IS NOT NULL),
+               min(fecha_registro) FILTER (WHERE NOT COALESCE(atendido, FALSE))
+        FROM pacientes_especialidades
+        WHERE fecha_registro IS NOT NULL
+        GROUP BY 1, 2, 3;
+    """),
+    (5, "consultorios por especialidad", """
+        -- Dónde puede atenderse cada especialidad; admisión sugiere entre estos
+        -- consultorios el de menor espera. Una especialidad sin filas se reparte
+        -- entre todos.
+        CREATE TABLE IF NOT EXISTS especialidad_consultorios (
+            especialidad_id INTEGER NOT NULL REFERENCES especialidades(id) ON DELETE CASCADE,
+            consultorio VARCHAR(50) NOT NULL,
+            PRIMARY KEY (especialidad_id, consultorio)
+        );
+        -- Punto de partida: donde se atendió cada especialidad en los últimos 90 días,
+        -- sin los consultorios elegidos alguna vez por error
+        INSERT INTO especialidad_consultorios (especialidad_id, consultorio)
+        SELECT especialidad_id, consultorio
+        FROM pacientes_especialidades
+        WHERE fecha_registro >= CURRENT_DATE - 90
+        GROUP BY especialidad_id, consultorio
+        HAVING count(*) >= 5
+        ON CONFLICT DO NOTHING;
+    """),
+]
+
+# Consultas calientes que no deben degradarse a Seq Scan sobre tablas grandes
+CONSULTAS_CALIENTES = [
+    ("pacientes en espera", SQL_PACIENTES_ESPERA, ("Consultorio 1",)),
+    ("historial de atencion", SQL_HISTORIAL_ATENCION, ("Consultorio 1",)),
+    ("pacientes del dia", SQL_PACIENTES_DIA, None),
+    ("carga incremental", SQL_PACIENTES_DELTA, (0,)),
+    ("llamar siguiente", SQL_LLAMAR_SIGUIENTE, {'consultorio': "Consultorio 1", 'canal': CANAL_CAMBIOS}),
+    ("cola del consultorio", SQL_COLA_CONSULTORIO,
+     {'consultorio': "Consultorio 1", 'limite_espera': 100, 'limite_historial': 30}),
+    ("cola del consultorio (cambios)", SQL_COLA_CONSULTORIO_DELTA,
+     {'consultorio': "Consultorio 1", 'watermark': 0, 'conocidos': [1, 2, 3]}),
+    ("pagina de historial", SQL_HISTORIAL_PAGINA,
+     {'consultorio': "Consultorio 1", 'fecha_atencion': datetime.now(), 'turno_id': 0, 'limite': 30}),
+    ("resumen de colas", SQL_RESUMEN_COLAS, None),
+    ("carga de consultorios", SQL_CARGA_CONSULTORIOS, {'ventana': 60}),
+]
+TABLAS_GRANDES = ("pacientes", "pacientes_especialidades")
+
+def aplicar_migraciones():
+    conexion = None
+    aplicadas = []
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migraciones (
+                    version INTEGER PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    fecha_aplicada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conexion.commit()
+
+            cursor.execute("SELECT version FROM schema_migraciones")
+            existentes = {fila[0] for fila in cursor.fetchall()}
+
+            for version, nombre, sql in MIGRACIONES:
+                if version in existentes:
+                    continue
+                cursor.execute(sql)
+                cursor.execute(
+                    "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                    (version, nombre)
+                )
+                conexion.commit()
+                aplicadas.append((version, nombre))
+        return aplicadas
+    except Exception as e:
+        if conexion:
+            conexion.rollback()
+        raise e
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+def _buscar_seq_scans(nodo, encontrados):
+    if nodo.get('Node Type') == 'Seq Scan' and nodo.get('Relation Name') in TABLAS_GRANDES:
+        encontrados.append(nodo['Relation Name'])
+    for hijo in nodo.get('Plans', []):
+        _buscar_seq_scans(hijo, encontrados)
+    return encontrados
+
+def verificar_planes(dias=180, pacientes_por_dia=400, consultorios=14):
+    # Se siembran tablas temporales con el mismo esquema e índices (pg_temp tiene
+    # prioridad en el search_path) y todo se descarta con rollback al terminar.
+    conexion = None
+    fallas = []
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            for tabla in ("especialidades", "pacientes", "pacientes_especialidades", "ultimos_llamados"):
+                cursor.execute(f"CREATE TEMP TABLE {tabla} (LIKE public.{tabla} INCLUDING ALL)")
+
+            total = dias * pacientes_por_dia
+            cursor.execute("""
+                INSERT INTO especialidades (id, nombre)
+                SELECT g, 'Especialidad ' || g FROM generate_series(1, 12) g
+            """)
+            cursor.execute("""
+                INSERT INTO pacientes (id, nombre, fecha_registro, atendido)
+                SELECT g, 'Paciente ' || g,
+                       CURRENT_DATE - (g / %(por_dia)s) * INTERVAL '1 day' + (g %% %(por_dia)s) * INTERVAL '20 seconds',
+                       FALSE
+                FROM generate_series(0, %(total)s - 1) g
+            """, {'por_dia': pacientes_por_dia, 'total': total})
+            cursor.execute("""
+                INSERT INTO pacientes_especialidades
+                    (id, paciente_id, especialidad_id, consultorio, fecha_registro, atendido, fecha_atencion, txid_cambio)
+                SELECT p.id, p.id, 1 + p.id %% 12, 'Consultorio ' || (1 + p.id %% %(consultorios)s),
+                       p.fecha_registro, a.atendido, CASE WHEN a.atendido THEN p.fecha_registro + INTERVAL '30 minutes' END,
+                       p.id
+                FROM pacientes p,
+                     LATERAL (SELECT p.fecha_registro < CURRENT_DATE OR p.id %% 3 = 0 AS atendido) a
+            """, {'consultorios': consultorios})
+            cursor.execute("""
+                INSERT INTO ultimos_llamados (id, mensaje, fecha)
+                SELECT g, 'Llamado ' || g, CURRENT_DATE - g * INTERVAL '1 minute'
+                FROM generate_series(1, 10000) g
+            """)
+            for tabla in ("especialidades", "pacientes", "pacientes_especialidades", "ultimos_llamados"):
+                cursor.execute(f"ANALYZE {tabla}")
+            # Sin Seq Scan como opción el planificador solo lo usa si ningún índice
+            # sirve, así el resultado no depende de cuántas filas se sembraron
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for nombre, sql, parametros in CONSULTAS_CALIENTES:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, parametros)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                tablas = _buscar_seq_scans(plan[0]['Plan'], [])
+                if tablas:
+                    fallas.append((nombre, tablas))
+        return fallas
+    finally:
+        if conexion:
+            conexion.rollback()
+            liberar_conexion(conexion)
+
+def convertir_a_particionado(granularidad='mensual', periodos_adelante=3):
+    # Convierte pacientes_especialidades en tabla particionada por rango de
+    # fecha_registro. La tabla actual queda adjunta como partición histórica
+    # (MINVALUE hasta el inicio del período actual) para no copiar años de datos;
+    # solo se mueven las filas del período en curso.
+    if granularidad not in ('diaria', 'mensual'):
+        raise ValueError("La granularidad debe ser 'diaria' o 'mensual'")
+
+    conexion = None
+    try:
+        conexion = obtener_conexion()
+        with conexion.cursor() as cursor:
+            cursor.execute("""
+                SELECT 1 FROM pg_partitioned_table
+                WHERE partrelid = to_regclass('pacientes_especialidades')
+            """)
+            if cursor.fetchone():
+                raise Exception("pacientes_especialidades ya está particionada")
+
+            cursor.execute("SELECT CURRENT_DATE")
+            hoy = cursor.fetchone()[0]
+            inicio = hoy if granularidad == 'diaria' else hoy.replace(day=1)
+
+            cursor.execute("""
+                SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger
+                WHERE tgrelid = 'pacientes_especialidades'::regclass AND NOT tgisinternal
+            """)
+            triggers = cursor.fetchall()
+            cursor.execute("""
+                SELECT i.relname, pg_get_indexdef(i.oid), x.indisunique
+                FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = 'pacientes_especialidades'::regclass
+            """)
+            indices = cursor.fetchall()
+            cursor.execute("SELECT pg_get_serial_sequence('pacientes_especialidades', 'id')")
+            secuencia = cursor.fetchone()[0]
+
+            cursor.execute("ALTER TABLE pacientes_especialidades RENAME TO pacientes_especialidades_historico")
+            for nombre, _, _ in indices:
+                cursor.execute(f"ALTER INDEX {nombre} RENAME TO {nombre[:50]}_historico")
+            for nombre, _ in triggers:
+                cursor.execute(f"DROP TRIGGER {nombre} ON pacientes_especialidades_historico")
+            cursor.execute("ALTER TABLE pacientes_especialidades_historico ALTER COLUMN fecha_registro SET NOT NULL")
+
+            cursor.execute("""
+                CREATE TABLE pacientes_especialidades
+                (LIKE pacientes_especialidades_historico INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (fecha_registro)
+            """)
+            cursor.execute("""
+                ALTER TABLE pacientes_especialidades
+                    ADD FOREIGN KEY (paciente_id) REFERENCES pacientes(id),
+                    ADD FOREIGN KEY (especialidad_id) REFERENCES especialidades(id)
+            """)
+            if secuencia:
+                cursor.execute(f"ALTER SEQUENCE {secuencia} OWNED BY pacientes_especialidades.id")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS particiones_config (
+                    tabla TEXT PRIMARY KEY,
+                    granularidad TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO particiones_config (tabla, granularidad) VALUES ('pacientes_especialidades', %s)
+                ON CONFLICT (tabla) DO UPDATE SET granularidad = EXCLUDED.granularidad
+            """, (granularidad,))
+
+            cursor.execute("CREATE TABLE pacientes_especialidades_default PARTITION OF pacientes_especialidades DEFAULT")
+            crear_particiones(cursor, granularidad, inicio, periodos_adelante)
+
+            # Las definiciones se leyeron antes del RENAME, así que apuntan a la tabla nueva.
+            # Los índices únicos tendrían que incluir fecha_registro; el esquema no usa ninguno.
+            for nombre, definicion, unico in indices:
+                if unico:
+                    print(f"Índice único {nombre} omitido en la tabla particionada")
+                    continue
+                cursor.execute(definicion)
+
+            cursor.execute("""
+                INSERT INTO pacientes_especialidades
+                SELECT * FROM pacientes_especialidades_historico WHERE fecha_registro >= %s
+            """, (inicio,))
+            cursor.execute("DELETE FROM pacientes_especialidades_historico WHERE fecha_registro >= %s", (inicio,))
+            cursor.execute(f"""
+                ALTER TABLE pacientes_especialidades ATTACH PARTITION pacientes_especialidades_historico
+                FOR VALUES FROM (MINVALUE) TO ('{inicio.isoformat()}')
+            """)
+
+            for _, definicion in triggers:
+                cursor.execute(definicion)
+
+            conexion.commit()
+    except Exception as e:
+        if conexion:
+            conexion.rollback()
+        raise e
+    finally:
+        if conexion:
+            liberar_conexion(conexion)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones del esquema del hospital")
+    parser.add_argument("--verificar-planes", action="store_true",
+                        help="Falla si alguna consulta caliente no puede usar un índice sobre una tabla grande "
+                             "(lo mismo que tests/test_planes.py)")
+    parser.add_argument("--dias", type=int, default=180)
+    parser.add_argument("--pacientes-por-dia", type=int, default=400)
+    parser.add_argument("--particionar", choices=["diaria", "mensual"],
+                        help="Convierte pacientes_especialidades en tabla particionada por fecha_registro")
+    parser.add_argument("--mantener-particiones", action="store_true",
+                        help="Crea las particiones próximas y archiva las viejas (para una tarea programada)")
+    parser.add_argument("--retencion-dias", type=int, default=None,
+                        help="Antigüedad a partir de la cual se archivan particiones")
+    parser.add_argument("--asignar", nargs="+", action="append", metavar=("ESPECIALIDAD", "CONSULTORIO"),
+                        help="Consultorios donde se atiende una especialidad (sin consultorios la deja libre); repetible")
+    args = parser.parse_args()
+
+    try:
+        aplicadas = aplicar_migraciones()
+    except Exception as e:
+        print(f"Error al aplicar migraciones: {e}")
+        sys.exit(1)
+
+    if not aplicadas:
+        print("La base de datos ya está al día")
+    for version, nombre in aplicadas:
+        print(f"Migración {version} aplicada: {nombre}")
+
+    if args.particionar:
+        try:
+            convertir_a_particionado(args.particionar)
+            print(f"pacientes_especialidades particionada ({args.particionar})")
+        except Exception as e:
+            print(f"Error al particionar: {e}")
+            sys.exit(1)
+
+    for especialidad, *consultorios in args.asignar or []:
+        try:
+            asignar_consultorios_especialidad(especialidad, consultorios)
+            print(f"{especialidad}: {', '.join(consultorios) if consultorios else 'cualquier consultorio'}")
+        except Exception as e:
+            print(f"Error al asignar consultorios a {especialidad}: {e}")
+            sys.exit(1)
+
+    if args.mantener_particiones:
+        resultado = mantener_particiones(retencion_dias=args.retencion_dias)
+        if resultado is None:
+            print("pacientes_especialidades no está particionada")
+        else:
+            for nombre in resultado['creadas']:
+                print(f"Partición creada: {nombre}")
+            for nombre in resultado['archivadas']:
+                print(f"Partición archivada: archivo.{nombre}")
+
+    if args.verificar_planes:
+        fallas = verificar_planes(args.dias, args.pacientes_por_dia)
+        for nombre, tablas in fallas:
+            print(f"Seq Scan en '{nombre}': {', '.join(tablas)}")
+        if fallas:
+            sys.exit(1)
+        print("Todas las consultas calientes usan índices")
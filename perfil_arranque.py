@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROGRAMAS = ["admision", "consultoria", "sala_espera", "hub_colas"]
+
+def leer_importaciones(ruta):
+    # Formato de -X importtime: "import time: propio | acumulado | [sangría]módulo" (microsegundos)
+    importaciones = []
+    with open(ruta, encoding='utf-8', errors='replace') as archivo:
+        for linea in archivo:
+            if not linea.startswith("import time:"):
+                continue
+            partes = linea[len("import time:"):].split("|")
+            if len(partes) != 3 or not partes[0].strip().isdigit():
+                continue
+            nombre = partes[2].rstrip("\n")
+            importaciones.append({
+                'modulo': nombre.strip(),
+                'nivel': (len(nombre) - len(nombre.lstrip())) // 2,
+                'propio_ms': int(partes[0]) / 1000,
+                'acumulado_ms': int(partes[1]) / 1000
+            })
+    return importaciones
+
+def perfilar(programa, espera=30.0, solo_importar=False, argumentos=()):
+    # Lanza el programa con -X importtime y espera la línea de hitos que escribe
+    # al recibir sus primeros datos (o a que termine, con --solo-importar).
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    fd, ruta_hitos = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    fd, ruta_errores = tempfile.mkstemp(suffix=".log")
+    errores = os.fdopen(fd, 'wb')
+    entorno = dict(os.environ, HOSPITAL_PERFIL_ARRANQUE=ruta_hitos)
+    if programa == "hub_colas":
+        # El hub no arranca sin token; para medirlo alcanza con uno cualquiera
+        entorno.setdefault('HOSPITAL_HUB_TOKEN', 'perfil')
+    if solo_importar:
+        comando = [sys.executable, "-X", "importtime", "-c", f"import {programa}"]
+    else:
+        comando = [sys.executable, "-X", "importtime", os.path.join(directorio, f"{programa}.py"), *argumentos]
+
+    lanzado = time.time()
+    proceso = subprocess.Popen(comando, cwd=directorio, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=errores)
+    hitos = None
+    try:
+        limite = lanzado + espera
+        while time.time() < limite:
+            with open(ruta_hitos, encoding='utf-8') as archivo:
+                linea = archivo.readline()
+            if linea:
+                hitos = json.loads(linea)
+                break
+            if proceso.poll() is not None:
+                break
+            time.sleep(0.05)
+    finally:
+        if proceso.poll() is None:
+            proceso.terminate()
+            try:
+                proceso.wait(5)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        os.remove(ruta_hitos)
+        errores.close()
+
+    try:
+        importaciones = leer_importaciones(ruta_errores)
+    finally:
+        os.remove(ruta_errores)
+
+    resultado = {
+        'programa': programa,
+        'codigo_salida': proceso.returncode,
+        'importaciones': importaciones,
+        'importacion_total_ms': round(sum(i['acumulado_ms'] for i in importaciones if i['nivel'] == 0), 1),
+        'hitos': None
+    }
+    if hitos:
+        # Los hitos vienen relativos a la importación de hospital_lib; aquí se
+        # cuentan desde que se lanzó el proceso
+        desfase = hitos['inicio'] - lanzado
+        resultado['hitos'] = [(nombre, round(desfase + segundos, 3)) for nombre, segundos in hitos['hitos']]
+    return resultado
+
+def imprimir(resultado, cantidad):
+    print(f"== {resultado['programa']} ==")
+    print(f"Importaciones: {resultado['importacion_total_ms']:.1f} ms en total")
+    if not resultado['importaciones'] and resultado['codigo_salida']:
+        print(f"  El proceso terminó con código {resultado['codigo_salida']} antes de importar")
+    principales = sorted(resultado['importaciones'], key=lambda i: i['acumulado_ms'], reverse=True)
+    print("  Módulos de primer nivel más lentos (acumulado):")
+    for i in [i for i in principales if i['nivel'] == 0][:cantidad]:
+        print(f"    {i['acumulado_ms']:8.1f} ms  {i['modulo']}")
+    print("  Módulos más lentos por sí mismos:")
+    for i in sorted(resultado['importaciones'], key=lambda i: i['propio_ms'], reverse=True)[:cantidad]:
+        print(f"    {i['propio_ms']:8.1f} ms  {i['modulo']}")
+    if resultado['hitos']:
+        print("  Hitos desde el lanzamiento:")
+        for nombre, segundos in resultado['hitos']:
+            print(f"    {segundos:8.3f} s  {nombre}")
+    elif resultado['codigo_salida'] is None or resultado['codigo_salida'] != 0:
+        print("  Sin hitos: el programa no llegó a recibir datos")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el arranque de los programas del hospital")
+    parser.add_argument("programas", nargs="*", default=PROGRAMAS[:3],
+                        help=f"Programas a medir ({', '.join(PROGRAMAS)})")
+    parser.add_argument("--solo-importar", action="store_true",
+                        help="Solo mide la importación del módulo, sin abrir ventanas ni la base")
+    parser.add_argument("--consultorio", default="1", help="Consultorio con el que se abre consultoria")
+    parser.add_argument("--espera", type=float, default=30.0, help="Segundos máximos hasta los primeros datos")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--salida", help="Guarda el perfil completo en este archivo JSON")
+    args = parser.parse_args()
+
+    resultados = []
+    for programa in args.programas:
+        if programa not in PROGRAMAS:
+            print(f"Programa desconocido: {programa}")
+            sys.exit(1)
+        argumentos = [args.consultorio] if programa == "consultoria" else []
+        resultado = perfilar(programa, args.espera, args.solo_importar, argumentos)
+        imprimir(resultado, args.top)
+        resultados.append(resultado)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+        print(f"Perfil guardado en {args.salida}")
@@ -1,12 +1,16 @@
 import tkinter as tk
 from tkinter import font as tkfont
 from datetime import datetime
-import threading
 import time
-import os
-import sys
-import pyttsx3
-from hospital_lib import cargar_datos
+from hospital_lib import (
+    cargar_datos,
+    datos_vacios,
+    EsquemaDesactualizado,
+    suscribir_cambios,
+    marcar_hito,
+    reportar_arranque,
+)
+from widgets import EjecutorTareas, ListaConClaves, ColaAnuncios, PRIORIDAD_PACIENTE, cargar_imagen
 
 WINDOW_WIDTH = 1200
 WINDOW_HEIGHT = 800
@@ -14,41 +18,18 @@ FONT_TITLE_SIZE = 28
 FONT_LIST_SIZE = 26
 LOGO_WIDTH = 500
 LOGO_HEIGHT = 500
+# Veces que se lee cada llamado
+REPETICIONES_LLAMADO = 1
 
 class SalaEspera:
     def __init__(self):
-        self.audio_enabled = True
-        self.current_audio_thread = None
         self.ultimo_llamado = None
-        self.engine = pyttsx3.init()
+        self.voice_spanish = None
+        # Un solo hilo de voz: los llamados que coinciden se encolan en lugar de pisarse
+        self.anuncios = ColaAnuncios(self._configurar_voz, repeticiones=REPETICIONES_LLAMADO)
 
-        try:
-            self.engine = pyttsx3.init()
-
-            # Cambiar la velocidad de lectura
-            rate = self.engine.getProperty('rate')
-            self.engine.setProperty('rate', rate - 70)  # Reduce la velocidad en 70 palabras por minuto
-
-            # Obtener las voces disponibles
-            voices = self.engine.getProperty('voices')
-
-            # Buscar y seleccionar la voz "Microsoft Sabina Desktop - México"
-            for voice in voices:
-                if "Sabina" in voice.name and "Mexico" in voice.name:  # Verifica si la voz es Sabina - México
-                    self.voice_spanish = voice.id
-                    self.engine.setProperty('voice', self.voice_spanish)
-                    print(f"Voz seleccionada: {voice.name}")
-                    break
-            else:
-                print("No se encontró la voz 'Microsoft Sabina Desktop - México', usando la voz predeterminada.")
-                self.voice_spanish = voices[0].id  # Si no se encuentra, usa la primera voz disponible
-                self.engine.setProperty('voice', self.voice_spanish)
-
-        except Exception as e:
-            print(f"Error al inicializar pyttsx3: {e}")
-            self.audio_enabled = False
-
-        self.datos = cargar_datos()
+        self.datos = datos_vacios()
+        self.cargando = True
         self.logo = None
 
         self.root = tk.Tk()
@@ -62,19 +43,41 @@ class SalaEspera:
         self.fuente_lst = tkfont.Font(family='Arial', size=FONT_LIST_SIZE)
 
         self._setup_ui()
-        self._cargar_listas()
+        self.lista_espera.actualizar([("cargando", "Cargando pacientes...")])
+        marcar_hito('ventana creada')
+        self.root.after_idle(marcar_hito, 'ventana visible')
+
+        # Solo se consulta la base cuando llega un aviso de cambio (o el de respaldo),
+        # en el ejecutor; el resultado se aplica en el hilo de la ventana
+        self.tareas = EjecutorTareas(self.root)
+        suscribir_cambios(lambda evento: self._verificar_cambios())
         self._verificar_cambios()
+        # pyttsx3 tarda en cargar las voces: arranca cuando la ventana ya está visible
+        self.root.after_idle(self.anuncios.iniciar)
 
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
-        
-    def _execute_audio_playback(self, texto):
-        try:
-            print(f"Reproduciendo mensaje en español: {texto}")
-            self.engine.setProperty('voice', self.voice_spanish)  # Asegúrate de que siempre use la voz en español
-            self.engine.say(texto)
-            self.engine.runAndWait()
-        except Exception as e:
-            print(f"Error en síntesis de voz: {e}")
+
+    def _configurar_voz(self, engine):
+        # Corre en el hilo de voz, una sola vez
+        # Cambiar la velocidad de lectura
+        rate = engine.getProperty('rate')
+        engine.setProperty('rate', rate - 70)  # Reduce la velocidad en 70 palabras por minuto
+
+        # Obtener las voces disponibles
+        voices = engine.getProperty('voices')
+
+        # Buscar y seleccionar la voz "Microsoft Sabina Desktop - México"
+        for voice in voices:
+            if "Sabina" in voice.name and "Mexico" in voice.name:  # Verifica si la voz es Sabina - México
+                self.voice_spanish = voice.id
+                engine.setProperty('voice', self.voice_spanish)
+                print(f"Voz seleccionada: {voice.name}")
+                break
+        else:
+            print("No se encontró la voz 'Microsoft Sabina Desktop - México', usando la voz predeterminada.")
+            self.voice_spanish = voices[0].id  # Si no se encuentra, usa la primera voz disponible
+            engine.setProperty('voice', self.voice_spanish)
+        marcar_hito('voz lista')
 
     def _setup_ui(self):
         total_width = self.root.winfo_screenwidth()
@@ -117,6 +120,8 @@ class SalaEspera:
         self.txt_espera = tk.Listbox(espera_frame, font=self.fuente_lst, bg='#e6f3ff', xscrollcommand=scroll_x.set, yscrollcommand=scroll_y.set)
         self.txt_espera.grid(row=0, column=0, sticky='nsew')
 
+        self.lista_espera = ListaConClaves(self.txt_espera)
+
         scroll_x.config(command=self.txt_espera.xview)
         scroll_y.config(command=self.txt_espera.yview)
 
@@ -140,6 +145,8 @@ class SalaEspera:
         self.txt_atencion = tk.Listbox(atencion_frame, font=self.fuente_lst, bg='#ffe6e6', xscrollcommand=scroll_x2.set, yscrollcommand=scroll_y2.set)
         self.txt_atencion.grid(row=0, column=0, sticky='nsew')
 
+        self.lista_atencion = ListaConClaves(self.txt_atencion)
+
         scroll_x2.config(command=self.txt_atencion.xview)
         scroll_y2.config(command=self.txt_atencion.yview)
 
@@ -148,27 +155,10 @@ class SalaEspera:
         self.lbl_last.config(text="Último atendido: Ninguno")
 
         try:
-            posibles_rutas = [
-                os.path.join(os.path.dirname(__file__)),
-                os.path.dirname(sys.executable),
-                os.getcwd()
-            ]
-            logo_path = None
-            for ruta in posibles_rutas:
-                temp_path = os.path.join(ruta, 'logo_hospital.png')
-                if os.path.exists(temp_path):
-                    logo_path = temp_path
-                    break
-
-            if logo_path:
-                from PIL import Image, ImageTk
-                image = Image.open(logo_path)
-                logo_size = int(left_width * 0.4)
-                image = image.resize((logo_size, logo_size), Image.LANCZOS)
-                self.logo = ImageTk.PhotoImage(image)
-                tk.Label(izq, image=self.logo, bg='#DCEEFF').grid(row=2, column=0, pady=(10,20))
-            else:
-                raise FileNotFoundError("Logo no encontrado")
+            # Variante ya escalada de la caché de imágenes: solo la primera vez con
+            # este tamaño de pantalla se escala el original
+            self.logo = cargar_imagen('logo_hospital.png', int(left_width * 0.4))
+            tk.Label(izq, image=self.logo, bg='#DCEEFF').grid(row=2, column=0, pady=(10,20))
         except Exception as e:
             print(f"Error al cargar logo: {e}")
             tk.Label(izq, text="HOSPITAL DE APOYO PALPA", font=('Arial', FONT_TITLE_SIZE, 'bold'), fg='black', bg='#DCEEFF').grid(row=2, column=0, pady=(10,20))
@@ -193,8 +183,6 @@ class SalaEspera:
 
 
     def _cargar_listas(self):
-        self.txt_espera.delete(0, tk.END)
-        self.txt_atencion.delete(0, tk.END)
         pacientes = self.datos.get('pacientes', [])
 
         pacientes_pendientes = {}
@@ -226,9 +214,12 @@ class SalaEspera:
                     }
                 pacientes_atendidos[paciente_id]['consultorios'].append(f"{especialidad} - {consultorio}")
 
+        # Las listas solo reciben las líneas que cambiaron, por paciente
+        lineas = []
         for pid, info in pacientes_pendientes.items():
             lista_consultorios = ", ".join(info['consultorios'])
-            self.txt_espera.insert(tk.END, f"{pid}. {info['nombre']} ({lista_consultorios})")
+            lineas.append((pid, f"{pid}. {info['nombre']} ({lista_consultorios})"))
+        self.lista_espera.actualizar(lineas)
 
         atendidos_ordenados = sorted(
             pacientes_atendidos.items(),
@@ -236,62 +227,65 @@ class SalaEspera:
             reverse=True
         )
 
+        lineas = []
         for pid, info in atendidos_ordenados:
             h_reg = info['fecha_registro'].strftime("%H:%M") if info['fecha_registro'] else ""
             h_aten = info['fecha_atencion'].strftime("%H:%M") if info['fecha_atencion'] else ""
             lista_consultorios = ", ".join(info['consultorios'])
-            self.txt_atencion.insert(tk.END, f"{pid}. {info['nombre']} ({lista_consultorios}) - Reg: {h_reg}, At: {h_aten}")
+            lineas.append((pid, f"{pid}. {info['nombre']} ({lista_consultorios}) - Reg: {h_reg}, At: {h_aten}"))
+        self.lista_atencion.actualizar(lineas)
 
     def _verificar_cambios(self):
-        try:
-            nuevos_datos = cargar_datos()
-            nuevo_llamado = nuevos_datos.get('ultimo_llamado')
-
-            if nuevo_llamado != self.ultimo_llamado:
-                if nuevo_llamado and nuevo_llamado.startswith("RELLAMADO_"):
-                    mensaje = nuevo_llamado.split('_', 1)[1]
-                    self._play_audio(mensaje)
-                    self.lbl_last.config(text=f"Re-llamando: {mensaje}")
-                    self._blink_lbl_last()  # <-- Llama al efecto aquí
-                elif nuevo_llamado:
-                    self._play_audio(nuevo_llamado)
-                    self.lbl_last.config(text=f"{nuevo_llamado}")
-                    self._blink_lbl_last()  # <-- Y también aquí
-
-                self.ultimo_llamado = nuevo_llamado
+        # La caché compartida trae solo los turnos que cambiaron y devuelve
+        # el mismo objeto si no hubo cambios
+        self.tareas.enviar(
+            cargar_datos,
+            clave='datos',
+            repetir=True,
+            al_terminar=self._aplicar_datos,
+            al_fallar=self._error_datos
+        )
 
+    def _error_datos(self, e):
+        print(f"Error al verificar cambios: {e}")
+        if self.cargando:
+            # Se reintenta con el próximo aviso o con el de respaldo; con la base sin
+            # migrar no sirve reintentar y se muestra qué hacer
+            aviso = str(e) if isinstance(e, EsquemaDesactualizado) else "Sin conexión, reintentando..."
+            self.lista_espera.actualizar([("cargando", aviso)])
+
+    def _aplicar_datos(self, nuevos_datos):
+        if self.cargando:
+            self.cargando = False
+            marcar_hito('primeros datos')
+            reportar_arranque('sala_espera')
+
+        nuevo_llamado = nuevos_datos.get('ultimo_llamado')
+
+        if nuevo_llamado != self.ultimo_llamado:
+            if nuevo_llamado and nuevo_llamado.startswith("RELLAMADO_"):
+                mensaje = nuevo_llamado.split('_', 1)[1]
+                self._play_audio(mensaje)
+                self.lbl_last.config(text=f"Re-llamando: {mensaje}")
+                self._blink_lbl_last()  # <-- Llama al efecto aquí
+            elif nuevo_llamado:
+                self._play_audio(nuevo_llamado)
+                self.lbl_last.config(text=f"{nuevo_llamado}")
+                self._blink_lbl_last()  # <-- Y también aquí
+
+            self.ultimo_llamado = nuevo_llamado
+
+        if nuevos_datos is not self.datos:
             self.datos = nuevos_datos
             self._cargar_listas()
-        except Exception as e:
-            print(f"Error al verificar cambios: {e}")
-        finally:
-            self.root.after(3000, self._verificar_cambios)
 
     def _play_audio(self, texto):
         print(f"_play_audio llamado con texto: {texto}")
-        if not self.audio_enabled:
+        if not self.anuncios.anunciar(texto, PRIORIDAD_PACIENTE):
             print("Audio deshabilitado, no se reproducirá el mensaje")
-            return
-
-        self._stop_audio()
-
-        self.current_audio_thread = threading.Thread(
-            target=self._execute_audio_playback,
-            args=(texto,),
-            daemon=True
-        )
-        self.current_audio_thread.start()
-
-    def _stop_audio(self):
-        # pyttsx3 no necesita detener audio explícitamente
-        pass
 
     def _on_close(self):
-        try:
-            if self.audio_enabled:
-                self.engine.stop()
-        except:
-            pass
+        self.anuncios.cerrar()
         self.root.destroy()
                
     def run(self):
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+# Los módulos del hospital están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Base descartable para las pruebas contra PostgreSQL; se crea de nuevo en cada corrida
+BASE_PRUEBAS = os.environ.get('HOSPITAL_BASE_PRUEBAS', 'hospital_pruebas')
+
+
+def _cerrar_pool(hospital_lib):
+    if hospital_lib.connection_pool is not None:
+        hospital_lib.connection_pool.closeall()
+        hospital_lib.connection_pool = None
+
+
+def _administrar(hospital_lib, sentencia):
+    conexion = psycopg2.connect(**dict(hospital_lib.DB_CONFIG, dbname='postgres'), connect_timeout=3)
+    try:
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute(sentencia)
+    finally:
+        conexion.close()
+
+
+@pytest.fixture(scope='session')
+def base_pruebas():
+    # Sin PostgreSQL a mano se omiten las pruebas que lo necesitan
+    import hospital_lib
+    import migraciones
+
+    base_original = hospital_lib.DB_CONFIG['dbname']
+    try:
+        _administrar(hospital_lib, f"DROP DATABASE IF EXISTS {BASE_PRUEBAS} WITH (FORCE)")
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL no disponible: {e}")
+    _administrar(hospital_lib, f"CREATE DATABASE {BASE_PRUEBAS}")
+
+    _cerrar_pool(hospital_lib)
+    hospital_lib.DB_CONFIG['dbname'] = BASE_PRUEBAS
+    try:
+        migraciones.aplicar_migraciones()
+        yield BASE_PRUEBAS
+    finally:
+        _cerrar_pool(hospital_lib)
+        hospital_lib.DB_CONFIG['dbname'] = base_original
+        _administrar(hospital_lib, f"DROP DATABASE IF EXISTS {BASE_PRUEBAS} WITH (FORCE)")
+
+
+@pytest.fixture
+def base(base_pruebas):
+    # Cada prueba empieza con las tablas vacías y las especialidades de siempre
+    import hospital_lib
+
+    conexion = hospital_lib.obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("""
+                TRUNCATE pacientes_especialidades, pacientes, ultimos_llamados, resumen_colas,
+                         especialidad_consultorios, especialidades
+                RESTART IDENTITY CASCADE
+            """)
+            cursor.execute("""
+                INSERT INTO especialidades (nombre)
+                VALUES ('Medicina General'), ('Pediatría'), ('Cardiología'), ('Traumatología')
+            """)
+        conexion.commit()
+    finally:
+        hospital_lib.liberar_conexion(conexion)
+    hospital_lib.mapa_especialidades(recargar=True)
+    hospital_lib.invalidar_cache()
+    return base_pruebas
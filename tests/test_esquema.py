@@ -0,0 +1,64 @@
+import psycopg2
+import pytest
+
+import hospital_lib
+import migraciones
+from hospital_lib import VERSION_ESQUEMA, EsquemaDesactualizado, verificar_esquema
+
+
+@pytest.fixture
+def base_sin_migrar(base_pruebas, monkeypatch):
+    # Una base recién creada, como la de un puesto al que nadie le corrió migraciones.py
+    nombre = f"{base_pruebas}_sin_migrar"
+    administracion = psycopg2.connect(**dict(hospital_lib.DB_CONFIG, dbname='postgres'))
+    administracion.autocommit = True
+    with administracion.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {nombre} WITH (FORCE)")
+        cursor.execute(f"CREATE DATABASE {nombre}")
+    monkeypatch.setitem(hospital_lib.DB_CONFIG, 'dbname', nombre)
+    monkeypatch.setattr(hospital_lib, 'connection_pool', None)
+    monkeypatch.setattr(hospital_lib, '_esquema_verificado', False)
+    try:
+        yield nombre
+    finally:
+        if hospital_lib.connection_pool is not None:
+            hospital_lib.connection_pool.closeall()
+        with administracion.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {nombre} WITH (FORCE)")
+        administracion.close()
+
+
+def test_version_es_la_ultima_migracion():
+    assert VERSION_ESQUEMA == max(version for version, _, _ in migraciones.MIGRACIONES)
+
+
+def test_base_migrada_se_verifica_una_vez(base_pruebas, monkeypatch):
+    monkeypatch.setattr(hospital_lib, '_esquema_verificado', False)
+    verificar_esquema()
+    assert hospital_lib._esquema_verificado
+
+    # Ya verificada, no vuelve a consultar
+    monkeypatch.setattr(hospital_lib, 'obtener_conexion', None)
+    verificar_esquema()
+
+
+def test_base_sin_migrar_pide_correr_migraciones(base_sin_migrar):
+    with pytest.raises(EsquemaDesactualizado, match=r"versión 0 .*ejecute migraciones.py"):
+        hospital_lib.cargar_datos(usar_cache=False)
+    with pytest.raises(EsquemaDesactualizado):
+        hospital_lib.cargar_datos_incremental()
+    with pytest.raises(EsquemaDesactualizado):
+        hospital_lib.consultar_cola_consultorio(1)
+    with pytest.raises(EsquemaDesactualizado):
+        hospital_lib.obtener_carga_consultorios()
+    assert not hospital_lib._esquema_verificado
+
+    migraciones.aplicar_migraciones()
+    assert hospital_lib.cargar_datos(usar_cache=False)['pacientes'] == []
+
+
+def test_base_atrasada_pide_correr_migraciones(base_pruebas, monkeypatch):
+    monkeypatch.setattr(hospital_lib, '_esquema_verificado', False)
+    monkeypatch.setattr(hospital_lib, 'VERSION_ESQUEMA', VERSION_ESQUEMA + 1)
+    with pytest.raises(EsquemaDesactualizado, match=f"versión {VERSION_ESQUEMA} .*la {VERSION_ESQUEMA + 1}"):
+        verificar_esquema()
@@ -0,0 +1,185 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import hospital_lib
+from hospital_lib import EstadoConsultorio
+
+HOY = date(2026, 3, 2)
+INICIO = datetime(2026, 3, 2, 8, 0)
+
+
+class BaseFalsa:
+    # Imita consultar_cola_consultorio sobre una lista de turnos en memoria: cada
+    # cambio recibe un txid creciente y el watermark es el próximo txid.
+    def __init__(self):
+        self.turnos = {}
+        self.txid = 1
+        self.fecha = HOY
+        self.reloj = INICIO
+
+    def _cambio(self, turno):
+        turno['txid'] = self.txid
+        self.txid += 1
+
+    def registrar(self, consultorio, nombre="Paciente"):
+        self.reloj += timedelta(minutes=1)
+        turno_id = len(self.turnos) + 1
+        turno = {
+            'turno_id': turno_id,
+            'paciente_id': turno_id,
+            'nombre': f"{nombre} {turno_id}",
+            'especialidad': "Medicina General",
+            'consultorio': f"Consultorio {consultorio}",
+            'fecha_registro': self.reloj,
+            'atendido': False,
+            'fecha_atencion': None
+        }
+        self._cambio(turno)
+        self.turnos[turno_id] = turno
+        return turno_id
+
+    def llamar(self, consultorio):
+        pendientes = sorted(
+            (t for t in self.turnos.values() if t['consultorio'] == f"Consultorio {consultorio}" and not t['atendido']),
+            key=lambda t: (t['fecha_registro'], t['turno_id'])
+        )
+        turno = pendientes[0]
+        self.reloj += timedelta(minutes=1)
+        turno['atendido'] = True
+        turno['fecha_atencion'] = self.reloj
+        self._cambio(turno)
+        return turno['turno_id']
+
+    def mover(self, turno_id, consultorio):
+        turno = self.turnos[turno_id]
+        turno['consultorio'] = f"Consultorio {consultorio}"
+        self._cambio(turno)
+
+    def nuevo_dia(self):
+        self.turnos = {}
+        self.fecha = HOY + timedelta(days=1)
+        self.reloj = INICIO + timedelta(days=1)
+
+    def consultar(self, consultorio_id, watermark=None, conocidos=(),
+                  limite_espera=hospital_lib.LIMITE_ESPERA_CONSULTORIO,
+                  limite_historial=hospital_lib.LIMITE_HISTORIAL_CONSULTORIO):
+        consultorio = f"Consultorio {consultorio_id}"
+        propios = [t for t in self.turnos.values() if t['consultorio'] == consultorio]
+        espera = sorted((t for t in propios if not t['atendido']), key=lambda t: (t['fecha_registro'], t['turno_id']))
+        historial = sorted((t for t in propios if t['atendido']),
+                           key=lambda t: (t['fecha_atencion'], t['turno_id']), reverse=True)
+        if watermark is None:
+            turnos = espera[:limite_espera] + historial[:limite_historial]
+        else:
+            turnos = [t for t in self.turnos.values()
+                      if t['txid'] >= watermark and (t['consultorio'] == consultorio or t['turno_id'] in conocidos)]
+        return {
+            'completo': watermark is None,
+            'watermark': self.txid,
+            'fecha': self.fecha,
+            'total_espera': len(espera),
+            'total_historial': len(historial),
+            'turnos': [{campo: t[campo] for campo in hospital_lib.CAMPOS_TURNO} for t in turnos]
+        }
+
+
+@pytest.fixture
+def base(monkeypatch):
+    base = BaseFalsa()
+    monkeypatch.setattr(hospital_lib, 'consultar_cola_consultorio', base.consultar)
+    return base
+
+
+def ids(turnos):
+    return [t['turno_id'] for t in turnos]
+
+
+def test_delta_suma_registros_y_pasa_atendidos_al_historial(base):
+    primeros = [base.registrar(1) for _ in range(3)]
+    base.registrar(2)
+    estado = EstadoConsultorio(1)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == primeros
+
+    nuevo = base.registrar(1)
+    llamado = base.llamar(1)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == primeros[1:] + [nuevo]
+    assert ids(listas['historial']) == [llamado]
+    assert listas['total_espera'] == 3
+    assert listas['total_historial'] == 1
+
+
+def test_con_corte_no_guarda_los_que_llegan_detras(base):
+    todos = [base.registrar(1) for _ in range(10)]
+    estado = EstadoConsultorio(1, limite_espera=4)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == todos[:4]
+    assert estado.corte is not None
+
+    base.registrar(1)
+    listas = estado.actualizar()
+    # Llegó detrás de los seis que no se trajeron: solo cambia el total
+    assert ids(listas['espera']) == todos[:4]
+    assert listas['total_espera'] == 11
+
+
+def test_recarga_al_quedar_menos_de_la_mitad(base):
+    todos = [base.registrar(1) for _ in range(10)]
+    estado = EstadoConsultorio(1, limite_espera=4)
+    estado.actualizar()
+
+    base.llamar(1)
+    base.llamar(1)
+    listas = estado.actualizar()
+    # Quedan dos de cuatro: todavía no recarga
+    assert ids(listas['espera']) == todos[2:4]
+
+    base.llamar(1)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == todos[3:7]
+    assert listas['total_espera'] == 7
+
+
+def test_turno_movido_a_otro_consultorio_sale_de_la_cola(base):
+    turnos = [base.registrar(1) for _ in range(3)]
+    estado = EstadoConsultorio(1)
+    estado.actualizar()
+
+    base.mover(turnos[1], 2)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == [turnos[0], turnos[2]]
+
+    # Y el que llega desde otro consultorio entra
+    otro = base.registrar(2)
+    estado.actualizar()
+    base.mover(otro, 1)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == [turnos[0], turnos[2], otro]
+
+
+def test_historial_conserva_solo_lo_visible(base):
+    for _ in range(5):
+        base.registrar(1)
+    estado = EstadoConsultorio(1, limite_historial=2)
+    estado.actualizar()
+
+    llamados = [base.llamar(1) for _ in range(3)]
+    listas = estado.actualizar()
+    assert ids(listas['historial']) == llamados[:0:-1]
+    assert listas['total_historial'] == 3
+    assert llamados[0] not in estado.turnos
+
+
+def test_cambio_de_dia_empieza_de_nuevo(base):
+    base.registrar(1)
+    estado = EstadoConsultorio(1)
+    estado.actualizar()
+
+    base.nuevo_dia()
+    nuevo = base.registrar(1)
+    listas = estado.actualizar()
+    assert ids(listas['espera']) == [nuevo]
+    assert list(estado.turnos) == [nuevo]
+    assert estado.fecha == base.fecha
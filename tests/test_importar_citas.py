@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+import hospital_lib
+from hospital_lib import importar_citas_csv
+
+
+def _archivo(tmp_path, texto, nombre="citas.csv"):
+    ruta = tmp_path / nombre
+    ruta.write_text(texto, encoding='utf-8')
+    return str(ruta)
+
+
+def _contenido():
+    # Todo lo que una importación puede tocar, para comparar antes y después
+    conexion = hospital_lib.obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT id, nombre FROM pacientes ORDER BY id")
+            pacientes = cursor.fetchall()
+            cursor.execute("""
+                SELECT p.nombre, e.nombre, pe.consultorio, pe.fecha_registro
+                FROM pacientes_especialidades pe
+                JOIN pacientes p ON p.id = pe.paciente_id
+                JOIN especialidades e ON e.id = pe.especialidad_id
+                ORDER BY pe.fecha_registro
+            """)
+            turnos = cursor.fetchall()
+            cursor.execute("SELECT consultorio, especialidad_id, pendientes FROM resumen_colas ORDER BY 1, 2")
+            resumen = cursor.fetchall()
+        conexion.commit()
+        return {'pacientes': pacientes, 'turnos': turnos, 'resumen': resumen}
+    finally:
+        hospital_lib.liberar_conexion(conexion)
+
+
+def test_importa_en_orden_y_agrupa_por_paciente(base, tmp_path):
+    ruta = _archivo(tmp_path, (
+        "nombre;especialidad;consultorio\n"
+        "Rosa  Quispe;pediatria;3\n"
+        "Luis Ramos;Cardiología;Consultorio 5\n"
+        "Rosa Quispe;CARDIOLOGIA;consultorio 5\n"
+    ))
+    resultado = importar_citas_csv(ruta, "2026-03-02")
+    assert resultado == {'pacientes': 2, 'turnos': 3, 'errores': []}
+
+    turnos = _contenido()['turnos']
+    assert [t[:3] for t in turnos] == [
+        ("Rosa Quispe", "Pediatría", "Consultorio 3"),
+        ("Luis Ramos", "Cardiología", "Consultorio 5"),
+        ("Rosa Quispe", "Cardiología", "Consultorio 5"),
+    ]
+    assert all(t[3].date() == datetime(2026, 3, 2).date() for t in turnos)
+
+
+def test_rechaza_filas_invalidas_y_duplicadas(base, tmp_path):
+    ruta = _archivo(tmp_path, (
+        "Ana Torres,Pediatría,1\n"
+        "Ana Torres,Dermatología,2\n"
+        "Ana Torres,pediatría,4\n"
+        "Jo,Pediatría,1\n"
+        "Mario 2,Pediatría,1\n"
+        "Carla Soto,Pediatría,cero\n"
+        "Carla Soto,Pediatría\n"
+    ))
+    resultado = importar_citas_csv(ruta)
+    assert (resultado['pacientes'], resultado['turnos']) == (1, 1)
+    assert resultado['errores'] == [
+        (2, "Especialidad 'Dermatología' no encontrada"),
+        (3, "Turno duplicado de Ana Torres en pediatría"),
+        (4, "El nombre debe tener al menos 3 caracteres"),
+        (5, "El nombre no puede contener números"),
+        (6, "Consultorio 'cero' no válido"),
+        (7, "Se esperaban 3 columnas: nombre, especialidad, consultorio"),
+    ]
+    assert [t[:3] for t in _contenido()['turnos']] == [("Ana Torres", "Pediatría", "Consultorio 1")]
+
+
+def test_archivo_sin_filas_validas_no_toca_las_tablas(base, tmp_path):
+    importar_citas_csv(_archivo(tmp_path, "Ana Torres,Pediatría,1\n", "previo.csv"))
+    antes = _contenido()
+
+    ruta = _archivo(tmp_path, (
+        "nombre,especialidad,consultorio\n"
+        "Luis Ramos,Neurocirugía,2\n"
+        "Ab,Pediatría,2\n"
+        "Rosa Quispe,Pediatría,0\n"
+    ))
+    resultado = importar_citas_csv(ruta)
+    assert (resultado['pacientes'], resultado['turnos']) == (0, 0)
+    assert [fila for fila, _ in resultado['errores']] == [2, 3, 4]
+    assert _contenido() == antes
+
+
+def test_fecha_invalida_no_toca_las_tablas(base, tmp_path):
+    importar_citas_csv(_archivo(tmp_path, "Ana Torres,Pediatría,1\n", "previo.csv"))
+    antes = _contenido()
+
+    ruta = _archivo(tmp_path, "Luis Ramos,Pediatría,2\nRosa Quispe,Cardiología,3\n")
+    for fecha in ("2026-02-30", "mañana"):
+        with pytest.raises(psycopg2.Error):
+            importar_citas_csv(ruta, fecha)
+        assert _contenido() == antes
+
+
+def test_error_a_mitad_deshace_todo(base, tmp_path, monkeypatch):
+    # Los INSERT ya corrieron cuando falla el aviso: el rollback los deshace
+    importar_citas_csv(_archivo(tmp_path, "Ana Torres,Pediatría,1\n", "previo.csv"))
+    antes = _contenido()
+
+    def fallar(cursor, tipo, **datos):
+        raise RuntimeError("aviso caído")
+    monkeypatch.setattr(hospital_lib, 'notificar_cambio', fallar)
+
+    ruta = _archivo(tmp_path, "Luis Ramos,Pediatría,2\nRosa Quispe,Cardiología,3\n")
+    with pytest.raises(RuntimeError):
+        importar_citas_csv(ruta)
+    assert _contenido() == antes
+
+    # La conexión vuelve sana al pool y la tabla temporal no quedó
+    monkeypatch.undo()
+    assert importar_citas_csv(ruta)['turnos'] == 2
@@ -0,0 +1,95 @@
+import unicodedata
+
+from hospital_lib import IndiceFiltro
+
+FILAS = [
+    ("José Núñez", "Pediatría", "Consultorio 1"),
+    ("Maria Garcia", "Cardiología", "Consultorio 2"),
+    ("María García López", "Pediatría", "Consultorio 2"),
+    ("Ana  Pérez", "Medicina General", "Consultorio 1"),
+    ("José Núñez", "Cardiología", "Consultorio 2"),
+    ("Luis Ñahui", "Medicina General", "Consultorio 3"),
+]
+
+
+def _indice(filas=FILAS):
+    nombres, especialidades, consultorios = zip(*filas) if filas else ((), (), ())
+    return IndiceFiltro(list(nombres), list(especialidades), list(consultorios))
+
+
+def _a_mano(filas, texto="", especialidad="", consultorio=""):
+    # Lo que debe devolver el índice, recorriendo todas las filas
+    def normal(valor):
+        valor = unicodedata.normalize('NFKD', valor.strip().lower())
+        return " ".join("".join(c for c in valor if not unicodedata.combining(c)).split())
+    return [
+        i for i, (nombre, esp, cons) in enumerate(filas)
+        if normal(texto) in normal(nombre)
+        and (not especialidad or esp == especialidad)
+        and (not consultorio or cons == consultorio)
+    ]
+
+
+def test_sin_filtros_devuelve_none():
+    assert _indice().filtrar("", "", "") is None
+    assert _indice().filtrar("   ") is None
+
+
+def test_nombre_sin_importar_tildes_ni_mayusculas():
+    indice = _indice()
+    assert indice.filtrar("garcia") == [1, 2]
+    assert indice.filtrar("GARCÍA") == [1, 2]
+    assert indice.filtrar("nunez") == [0, 4]
+    assert indice.filtrar("Núñez") == [0, 4]
+    assert indice.filtrar("ñahui") == [5]
+    assert indice.filtrar("nahui") == [5]
+
+
+def test_espacios_repetidos_no_cuentan():
+    indice = _indice()
+    assert indice.filtrar("ana perez") == [3]
+    assert indice.filtrar("  ana   pérez ") == [3]
+
+
+def test_textos_de_menos_de_tres_letras():
+    indice = _indice()
+    assert indice.filtrar("a") == _a_mano(FILAS, "a")
+    assert indice.filtrar("lu") == [5]
+    assert indice.filtrar("jo") == [0, 4]
+    assert indice.filtrar("x") == []
+
+
+def test_nombre_que_no_existe():
+    indice = _indice()
+    assert indice.filtrar("zzz") == []
+    assert indice.filtrar("garciaz") == []
+
+
+def test_filtros_combinados():
+    indice = _indice()
+    assert indice.filtrar(especialidad="Pediatría") == [0, 2]
+    assert indice.filtrar(consultorio="Consultorio 2") == [1, 2, 4]
+    assert indice.filtrar(especialidad="Cardiología", consultorio="Consultorio 2") == [1, 4]
+    assert indice.filtrar("jose", "Cardiología") == [4]
+    assert indice.filtrar("maria", "Pediatría", "Consultorio 2") == [2]
+    assert indice.filtrar("maria", "Pediatría", "Consultorio 1") == []
+    assert indice.filtrar(especialidad="Dermatología") == []
+
+
+def test_seguir_escribiendo_y_borrar():
+    # La búsqueda anterior acota la siguiente solo si el texto nuevo la contiene
+    indice = _indice()
+    for texto in ("m", "ma", "mar", "mari", "maria g", "maria ga", "mar", "jo", "josé n", "lopez", "a"):
+        assert indice.filtrar(texto) == _a_mano(FILAS, texto), texto
+
+
+def test_indice_nuevo_tras_cargar_otros_datos():
+    # La pantalla descarta el índice al cargar la tabla y arma otro con la siguiente búsqueda
+    indice = _indice()
+    assert indice.filtrar("garcia") == [1, 2]
+    nuevas = [("Rosa Garcia", "Pediatría", "Consultorio 4")] + FILAS[3:]
+    indice = _indice(nuevas)
+    assert indice.filtrar("garcia") == [0]
+    assert indice.filtrar("garcia", consultorio="Consultorio 2") == []
+    assert indice.filtrar(consultorio="Consultorio 2") == [2]
+    assert _indice([]).filtrar("garcia") == []
@@ -0,0 +1,99 @@
+import itertools
+import random
+
+import pytest
+
+from widgets import ListaConClaves, _subsecuencia_creciente
+
+
+class ArbolFalso:
+    # Imita lo que ListaConClaves usa de un ttk.Treeview y cuenta las operaciones
+    def __init__(self):
+        self.filas = []
+        self.valores = {}
+        self.operaciones = 0
+
+    def insert(self, padre, posicion, iid, values):
+        self.filas.insert(posicion, iid)
+        self.valores[iid] = values
+        self.operaciones += 1
+
+    def delete(self, iid):
+        self.filas.remove(iid)
+        del self.valores[iid]
+        self.operaciones += 1
+
+    def detach(self, iid):
+        self.filas.remove(iid)
+        self.operaciones += 1
+
+    def move(self, iid, padre, posicion):
+        self.filas.insert(posicion, iid)
+        self.operaciones += 1
+
+    def item(self, iid, values):
+        self.valores[iid] = values
+        self.operaciones += 1
+
+    def contenido(self):
+        return [(iid, self.valores[iid]) for iid in self.filas]
+
+
+def _es_creciente_mas_larga(valores, indices):
+    elegidos = [valores[i] for i in sorted(indices)]
+    if any(a >= b for a, b in zip(elegidos, elegidos[1:])):
+        return False
+    # Fuerza bruta: ninguna subsecuencia estrictamente creciente es más larga
+    for largo in range(len(indices) + 1, len(valores) + 1):
+        for combinacion in itertools.combinations(valores, largo):
+            if all(a < b for a, b in zip(combinacion, combinacion[1:])):
+                return False
+    return True
+
+
+@pytest.mark.parametrize("valores", [[], [5], [1, 2, 3], [3, 2, 1], [2, 5, 3, 7, 11, 8, 10, 13, 6]])
+def test_subsecuencia_creciente_casos(valores):
+    assert _es_creciente_mas_larga(valores, _subsecuencia_creciente(valores))
+
+
+def test_subsecuencia_creciente_al_azar():
+    azar = random.Random(7)
+    for _ in range(200):
+        valores = azar.sample(range(30), azar.randint(0, 9))
+        assert _es_creciente_mas_larga(valores, _subsecuencia_creciente(valores))
+
+
+def test_lista_refleja_altas_bajas_y_movidas():
+    arbol = ArbolFalso()
+    lista = ListaConClaves(arbol)
+    lista.actualizar([(1, ("Ana",)), (2, ("Luis",)), (3, ("Rosa",))])
+    lista.actualizar([(3, ("Rosa",)), (1, ("Ana María",)), (4, ("Pedro",))])
+    assert arbol.contenido() == [("3", ("Rosa",)), ("1", ("Ana María",)), ("4", ("Pedro",))]
+
+
+def test_lista_sin_cambios_no_toca_el_widget():
+    arbol = ArbolFalso()
+    lista = ListaConClaves(arbol)
+    filas = [(i, (f"Paciente {i}",)) for i in range(50)]
+    lista.actualizar(filas)
+    antes = arbol.operaciones
+    lista.actualizar(filas)
+    assert arbol.operaciones == antes
+
+
+def test_lista_claves_repetidas_no_se_pisan():
+    arbol = ArbolFalso()
+    lista = ListaConClaves(arbol)
+    lista.actualizar([(7, ("Ana",)), (7, ("Ana",))])
+    assert arbol.contenido() == [("7", ("Ana",)), ("7#2", ("Ana",))]
+
+
+def test_lista_al_azar_coincide_con_las_filas():
+    azar = random.Random(11)
+    arbol = ArbolFalso()
+    lista = ListaConClaves(arbol)
+    for _ in range(100):
+        claves = azar.sample(range(20), azar.randint(0, 12))
+        filas = [(clave, (f"Paciente {clave}", azar.randint(0, 1))) for clave in claves]
+        lista.actualizar(filas)
+        assert arbol.contenido() == [(str(clave), valores) for clave, valores in filas]
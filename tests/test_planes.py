@@ -0,0 +1,20 @@
+import pytest
+
+import migraciones
+from migraciones import verificar_planes
+
+
+@pytest.mark.parametrize("dias, pacientes_por_dia", [(1, 5), (3, 50), (30, 200)])
+def test_consultas_calientes_usan_indices(base_pruebas, dias, pacientes_por_dia):
+    # El resultado no depende del tamaño de la siembra
+    assert verificar_planes(dias=dias, pacientes_por_dia=pacientes_por_dia) == []
+
+
+def test_detecta_consulta_que_no_puede_usar_indices(base_pruebas, monkeypatch):
+    monkeypatch.setattr(migraciones, 'CONSULTAS_CALIENTES', [
+        ("por dia de la semana", """
+            SELECT * FROM pacientes_especialidades
+            WHERE EXTRACT(DOW FROM fecha_registro) = 1
+        """, None),
+    ])
+    assert verificar_planes(dias=3, pacientes_por_dia=50) == [("por dia de la semana", ["pacientes_especialidades"])]
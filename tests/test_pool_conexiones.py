@@ -0,0 +1,109 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import hospital_lib
+from hospital_lib import PoolConexiones
+
+
+@pytest.fixture
+def pool(base_pruebas):
+    pool = PoolConexiones(1, 2, 0.3, hospital_lib.parametros_conexion())
+    yield pool
+    pool.closeall()
+
+
+def test_pool_agotado_espera_y_falla(pool):
+    a = pool.getconn()
+    b = pool.getconn()
+    inicio = time.monotonic()
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
+    assert time.monotonic() - inicio >= 0.3
+    assert pool.estadisticas()['agotamientos'] == 1
+    assert pool.estadisticas()['abiertas'] == 2
+    pool.putconn(a)
+    pool.putconn(b)
+
+
+def test_pool_entrega_la_conexion_devuelta_mientras_espera(pool):
+    a = pool.getconn()
+    b = pool.getconn()
+    threading.Timer(0.1, pool.putconn, (a,)).start()
+    c = pool.getconn()
+    assert c is a
+    datos = pool.estadisticas()
+    assert datos['esperas'] == 1
+    assert datos['agotamientos'] == 0
+    pool.putconn(b)
+    pool.putconn(c)
+
+
+def test_pool_devuelve_tras_error_con_la_transaccion_cerrada(pool):
+    conexion = pool.getconn()
+    with conexion.cursor() as cursor:
+        with pytest.raises(psycopg2.Error):
+            cursor.execute("SELECT * FROM tabla_que_no_existe")
+    assert conexion.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    pool.putconn(conexion)
+
+    otra = pool.getconn()
+    assert otra is conexion
+    assert otra.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    with otra.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        assert cursor.fetchone() == (1,)
+    pool.putconn(otra)
+
+
+def test_pool_restablece_autocommit(pool):
+    conexion = pool.getconn()
+    conexion.autocommit = True
+    pool.putconn(conexion)
+
+    otra = pool.getconn()
+    assert otra is conexion
+    assert otra.autocommit is False
+    pool.putconn(otra)
+
+
+def test_pool_descarta_conexion_cerrada(pool):
+    conexion = pool.getconn()
+    conexion.close()
+    pool.putconn(conexion)
+    datos = pool.estadisticas()
+    assert datos['abiertas'] == 0
+    assert datos['ocupadas'] == 0
+
+    nueva = pool.getconn()
+    assert not nueva.closed
+    pool.putconn(nueva)
+
+
+def test_pool_reemplaza_conexion_caida(pool, monkeypatch):
+    # Una conexión libre cuyo backend terminó se detecta al entregarla
+    conexion = pool.getconn()
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid()")
+        pid = cursor.fetchone()[0]
+    pool.putconn(conexion)
+
+    verificadora = psycopg2.connect(**hospital_lib.parametros_conexion())
+    try:
+        with verificadora.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        verificadora.commit()
+    finally:
+        verificadora.close()
+
+    monkeypatch.setattr(hospital_lib, 'VERIFICAR_CONEXION_TRAS', 0)
+    nueva = pool.getconn()
+    assert nueva is not conexion
+    with nueva.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    assert pool.estadisticas()['descartadas'] == 1
+    pool.putconn(nueva)
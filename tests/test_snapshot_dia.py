@@ -0,0 +1,88 @@
+from datetime import date, datetime, timedelta
+
+from hospital_lib import SnapshotDia
+
+HOY = date(2026, 3, 2)
+INICIO = datetime(2026, 3, 2, 8, 0)
+
+
+def _fila(turno_id, atendido=False, nombre="Ana"):
+    return {
+        'turno_id': turno_id,
+        'paciente_id': turno_id,
+        'nombre': nombre,
+        'especialidad': "Pediatría",
+        'consultorio': "Consultorio 1",
+        'fecha_registro': INICIO + timedelta(minutes=turno_id),
+        'atendido': atendido,
+        'fecha_atencion': INICIO + timedelta(hours=1) if atendido else None
+    }
+
+
+def _delta(pacientes, completo=False, watermark=1):
+    return {
+        'completo': completo,
+        'watermark': watermark,
+        'fecha': HOY,
+        'especialidades': [],
+        'pacientes': pacientes,
+        'ultimo_llamado': None
+    }
+
+
+def test_snapshot_entregado_no_cambia_con_deltas_posteriores():
+    snapshot = SnapshotDia()
+    snapshot.aplicar(_delta([_fila(1), _fila(2)], completo=True))
+    anterior = snapshot.como_datos()
+    huella = anterior['huella']
+
+    snapshot.aplicar(_delta([_fila(1, atendido=True), _fila(3)], watermark=2))
+    actual = snapshot.como_datos()
+
+    assert anterior['version'] == 1
+    assert [f['atendido'] for f in anterior['pacientes']] == [False, False]
+    assert len(anterior['pacientes']) == 2
+    assert anterior['huella'] == huella
+    assert actual['version'] == 2
+    assert [f['atendido'] for f in actual['pacientes']] == [True, False, False]
+    assert actual['huella'] != huella
+
+
+def test_snapshot_sin_cambios_no_sube_version():
+    snapshot = SnapshotDia()
+    snapshot.aplicar(_delta([_fila(1)], completo=True))
+    datos = snapshot.como_datos()
+    assert snapshot.aplicar(_delta([_fila(1)], watermark=2)) is None
+    assert snapshot.como_datos() is datos
+
+
+def test_filas_del_snapshot_se_comportan_como_dict():
+    snapshot = SnapshotDia()
+    original = _fila(1, atendido=True)
+    snapshot.aplicar(_delta([original, _fila(2)], completo=True))
+    fila = snapshot.como_datos()['pacientes'][0]
+
+    assert fila == original
+    assert original == fila
+    assert fila != _fila(2)
+    assert dict(fila) == original
+    assert 'nombre' in fila
+    assert 'txid' not in fila
+    assert len(fila) == len(original)
+    assert sorted(fila) == sorted(original)
+    assert dict(fila.items()) == original
+    assert list(fila.values()) == [original[campo] for campo in fila.keys()]
+    assert fila.get('txid', 'sin') == 'sin'
+
+
+def test_vista_de_turnos_es_una_secuencia():
+    snapshot = SnapshotDia()
+    filas = [_fila(1), _fila(2), _fila(3)]
+    snapshot.aplicar(_delta(filas, completo=True))
+    pacientes = snapshot.como_datos()['pacientes']
+
+    assert list(pacientes) == filas
+    assert pacientes[-1] == filas[-1]
+    assert pacientes[1:] == filas[1:]
+    assert filas[0] in pacientes
+    assert [f['turno_id'] for f in reversed(pacientes)] == [3, 2, 1]
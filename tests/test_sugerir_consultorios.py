@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import hospital_lib
+from hospital_lib import (
+    PESO_RITMO_HISTORICO_MIN,
+    consultorios_abiertos,
+    espera_estimada,
+    obtener_carga_consultorios,
+    sugerir_consultorios,
+)
+
+CONSULTORIOS = ["Consultorio 1", "Consultorio 2", "Consultorio 3"]
+
+
+def _carga(consultorios, especialidades=None, ritmo_general=6.0, ventana=60):
+    return {
+        'ventana': ventana,
+        'ritmo_general': ritmo_general,
+        'consultorios': {
+            cons: {
+                'pendientes': datos.get('pendientes', 0),
+                'atendidos_hoy': datos.get('atendidos_hoy', 0),
+                'atendidos_recientes': datos.get('atendidos_recientes', 0),
+                'ritmo_historico': datos.get('ritmo_historico')
+            } for cons, datos in consultorios.items()
+        },
+        'especialidades': especialidades or {}
+    }
+
+
+def test_espera_usa_el_ritmo_general_sin_historial():
+    carga = _carga({"Consultorio 1": {'pendientes': 4, 'atendidos_hoy': 2}}, ritmo_general=6.0)
+    por_minuto = (6.0 / 60 * PESO_RITMO_HISTORICO_MIN) / (60 + PESO_RITMO_HISTORICO_MIN)
+    assert espera_estimada(carga, "Consultorio 1") == pytest.approx(5 / por_minuto)
+
+    # El historial propio, si existe, manda sobre el general
+    carga['consultorios']["Consultorio 1"]['ritmo_historico'] = 12.0
+    por_minuto = (12.0 / 60 * PESO_RITMO_HISTORICO_MIN) / (60 + PESO_RITMO_HISTORICO_MIN)
+    assert espera_estimada(carga, "Consultorio 1") == pytest.approx(5 / por_minuto)
+
+
+def test_espera_de_consultorio_desconocido_es_finita():
+    carga = _carga({})
+    assert 0 < espera_estimada(carga, "Consultorio 9") < float('inf')
+
+
+def test_espera_cuenta_los_extra():
+    carga = _carga({"Consultorio 1": {'pendientes': 3, 'atendidos_recientes': 6}})
+    una = espera_estimada(carga, "Consultorio 1")
+    assert espera_estimada(carga, "Consultorio 1", extra=2) == pytest.approx(una * 6 / 4)
+
+
+def test_atender_mas_rapido_baja_la_espera():
+    carga = _carga({
+        "Consultorio 1": {'pendientes': 5, 'atendidos_recientes': 2},
+        "Consultorio 2": {'pendientes': 5, 'atendidos_recientes': 10},
+    })
+    assert espera_estimada(carga, "Consultorio 2") < espera_estimada(carga, "Consultorio 1")
+
+
+def test_no_sugiere_consultorios_cerrados():
+    # El 3 no tiene cola porque nadie atiende ahí hoy: no es el más rápido, está cerrado
+    carga = _carga({
+        "Consultorio 1": {'pendientes': 8, 'atendidos_hoy': 5},
+        "Consultorio 2": {'pendientes': 6, 'atendidos_hoy': 3},
+    })
+    assert consultorios_abiertos(carga, CONSULTORIOS) == ["Consultorio 1", "Consultorio 2"]
+    assert sugerir_consultorios(carga, ["Pediatría"], CONSULTORIOS) == ["Consultorio 2"]
+
+
+def test_al_abrir_valen_los_que_tienen_turnos_y_si_no_todos():
+    carga = _carga({"Consultorio 2": {'pendientes': 1}})
+    assert consultorios_abiertos(carga, CONSULTORIOS) == ["Consultorio 2"]
+    assert consultorios_abiertos(_carga({}), CONSULTORIOS) == CONSULTORIOS
+
+
+def test_empate_queda_el_primero():
+    carga = _carga({cons: {'pendientes': 2, 'atendidos_hoy': 1} for cons in CONSULTORIOS})
+    assert sugerir_consultorios(carga, ["Pediatría"], CONSULTORIOS) == ["Consultorio 1"]
+    assert sugerir_consultorios(carga, ["Pediatría"], CONSULTORIOS[::-1]) == ["Consultorio 3"]
+
+
+def test_turnos_sugeridos_cuentan_para_las_siguientes():
+    carga = _carga({
+        "Consultorio 1": {'pendientes': 0, 'atendidos_hoy': 1},
+        "Consultorio 2": {'pendientes': 1, 'atendidos_hoy': 1},
+    })
+    # El segundo turno del mismo paciente ya no encuentra vacío el consultorio 1
+    assert sugerir_consultorios(carga, ["Pediatría", "Cardiología", "Traumatología"], CONSULTORIOS) == \
+        ["Consultorio 1", "Consultorio 1", "Consultorio 2"]
+
+
+def test_respeta_los_consultorios_de_cada_especialidad():
+    carga = _carga(
+        {cons: {'pendientes': 3, 'atendidos_hoy': 1} for cons in CONSULTORIOS}
+        | {"Consultorio 3": {'pendientes': 9, 'atendidos_hoy': 1}},
+        especialidades={"Cardiología": ["Consultorio 3"]}
+    )
+    assert sugerir_consultorios(carga, ["Cardiología", "Pediatría"], CONSULTORIOS) == \
+        ["Consultorio 3", "Consultorio 1"]
+
+
+def _turno(cursor, nombre, especialidad_id, consultorio, registro, atencion=None):
+    cursor.execute("INSERT INTO pacientes (nombre, fecha_registro) VALUES (%s, %s) RETURNING id", (nombre, registro))
+    paciente_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO pacientes_especialidades
+            (paciente_id, especialidad_id, consultorio, fecha_registro, atendido, fecha_atencion)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (paciente_id, especialidad_id, consultorio, registro, atencion is not None, atencion))
+
+
+def test_carga_desde_la_base(base, monkeypatch):
+    ahora = datetime.now()
+    conexion = hospital_lib.obtener_conexion()
+    try:
+        with conexion.cursor() as cursor:
+            # Consultorio 1 con historial de ayer; el 2 solo tiene turnos de hoy
+            for i in range(4):
+                registro = ahora - timedelta(days=1, minutes=60 - i)
+                _turno(cursor, f"Ayer {i}", 1, "Consultorio 1", registro, registro + timedelta(minutes=10))
+            _turno(cursor, "Hoy atendido", 1, "Consultorio 1", ahora - timedelta(seconds=3), ahora - timedelta(seconds=1))
+            _turno(cursor, "Hoy espera", 1, "Consultorio 1", ahora - timedelta(seconds=2))
+            _turno(cursor, "Hoy espera 2", 2, "Consultorio 2", ahora - timedelta(seconds=2))
+            cursor.execute("""
+                INSERT INTO especialidad_consultorios (especialidad_id, consultorio)
+                VALUES (2, 'Consultorio 2'), (2, 'Consultorio 3')
+            """)
+        conexion.commit()
+    finally:
+        hospital_lib.liberar_conexion(conexion)
+    monkeypatch.setitem(hospital_lib._ritmo_historico, 'fecha', None)
+
+    carga = obtener_carga_consultorios()
+    uno = carga['consultorios']["Consultorio 1"]
+    dos = carga['consultorios']["Consultorio 2"]
+    assert (uno['pendientes'], uno['atendidos_hoy'], uno['atendidos_recientes']) == (1, 1, 1)
+    assert (dos['pendientes'], dos['atendidos_hoy'], dos['atendidos_recientes']) == (1, 0, 0)
+    assert uno['ritmo_historico'] and dos['ritmo_historico'] is None
+    assert carga['ritmo_general'] == pytest.approx(uno['ritmo_historico'])
+    assert carga['especialidades'] == {"Pediatría": ["Consultorio 2", "Consultorio 3"]}
+    # Pediatría solo va al 2 y al 3; el 3 no tiene turnos hoy
+    assert sugerir_consultorios(carga, ["Pediatría"], CONSULTORIOS) == ["Consultorio 2"]
@@ -0,0 +1,142 @@
+import collections
+import glob
+import json
+import os
+import time
+
+import pytest
+
+import hospital_lib
+from hospital_lib import CUBETAS_TRAZA, _trazar, percentil_resumen, resumen_trazas, resumen_vacio
+
+NOMBRE = "Juana Pérez Quispe"
+
+
+@pytest.fixture
+def trazas(monkeypatch, tmp_path):
+    # Trazas activas, todas las llamadas cuentan como lentas y van a una carpeta temporal;
+    # el hilo de volcado no se arranca
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'activas', True)
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'lenta_ms', 0.0)
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'argumentos', False)
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'carpeta', str(tmp_path))
+    monkeypatch.setattr(hospital_lib, '_trazas', collections.deque(maxlen=100))
+    monkeypatch.setattr(hospital_lib, '_resumen_periodo', {})
+    monkeypatch.setattr(hospital_lib, '_resumen_total', {})
+    monkeypatch.setattr(hospital_lib, '_volcado_iniciado', True)
+    return tmp_path
+
+
+def _lentas(carpeta):
+    lineas = []
+    for ruta in glob.glob(os.path.join(carpeta, "lentas-*.jsonl")):
+        with open(ruta, encoding='utf-8') as archivo:
+            lineas.extend(archivo.read().splitlines())
+    return lineas
+
+
+@_trazar
+def _registrar(nombre, especialidades, consultorio=None):
+    return {'pacientes': [nombre] * len(especialidades)}
+
+
+@_trazar
+def _fallar(nombre):
+    raise ValueError(f"Paciente duplicado: {nombre}")
+
+
+@_trazar
+def _filas(nombres):
+    for nombre in nombres:
+        yield nombre
+
+
+def test_registro_de_lentas_sin_datos_de_pacientes(trazas):
+    _registrar(NOMBRE, ["Pediatría", "Cardiología"], consultorio="Consultorio 3")
+    with pytest.raises(ValueError):
+        _fallar(NOMBRE)
+    list(_filas([NOMBRE, "Otro Paciente"]))
+
+    lineas = _lentas(trazas)
+    assert len(lineas) == 3
+    for linea in lineas:
+        assert "Juana" not in linea and "Quispe" not in linea and "Pediatría" not in linea
+        assert "Consultorio 3" not in linea
+
+    registros = {r['funcion']: r for r in map(json.loads, lineas)}
+    assert registros['_registrar']['argumentos'] == "str[18], list[2], consultorio=str[13]"
+    assert registros['_registrar']['filas'] == 2
+    assert registros['_fallar']['error'] == "ValueError"
+    assert registros['_filas']['filas'] == 2
+    # Tampoco en lo que queda en memoria
+    assert all("Juana" not in json.dumps(r, ensure_ascii=False) for r in hospital_lib.trazas_recientes())
+
+
+def test_argumentos_completos_solo_si_se_piden(trazas, monkeypatch):
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'argumentos', True)
+    with pytest.raises(ValueError):
+        _fallar(NOMBRE)
+    registro = json.loads(_lentas(trazas)[0])
+    assert NOMBRE in registro['argumentos']
+    assert NOMBRE in registro['error']
+
+
+def test_llamadas_rapidas_no_van_al_registro(trazas, monkeypatch):
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'lenta_ms', 10000.0)
+    _registrar(NOMBRE, ["Pediatría"])
+    assert _lentas(trazas) == []
+    assert resumen_trazas()['_registrar']['llamadas'] == 1
+
+
+def test_trazas_apagadas_no_escriben_ni_arrancan_el_volcado(trazas, monkeypatch):
+    monkeypatch.setitem(hospital_lib.TRAZAS_CONFIG, 'activas', False)
+    monkeypatch.setattr(hospital_lib, '_volcado_iniciado', False)
+    assert _registrar(NOMBRE, ["Pediatría"]) == {'pacientes': [NOMBRE]}
+    assert list(_filas(["a", "b"])) == ["a", "b"]
+    assert _lentas(trazas) == []
+    assert hospital_lib.trazas_recientes() == []
+    assert hospital_lib._volcado_iniciado is False
+
+
+def test_generador_no_cuenta_el_tiempo_de_quien_consume(trazas):
+    for _ in _filas(["a", "b", "c"]):
+        time.sleep(0.02)
+    registro = hospital_lib.trazas_recientes()[-1]
+    assert registro['filas'] == 3
+    assert registro['ejecucion_ms'] < 20
+
+
+def test_resumen_cuenta_llamadas_y_errores(trazas):
+    for _ in range(3):
+        _registrar("x", ["Pediatría"])
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            _fallar("x")
+    resumen = resumen_trazas()
+    assert resumen['_registrar']['llamadas'] == 3
+    assert resumen['_registrar']['filas'] == 3
+    assert resumen['_fallar']['errores'] == 2
+    assert resumen['_registrar']['modulos'] == {__name__: 3}
+
+
+def _resumen(duraciones):
+    resumen = resumen_vacio()
+    for ms in duraciones:
+        resumen['llamadas'] += 1
+        resumen['max_ms'] = max(resumen['max_ms'], ms)
+        resumen['cubetas'][sum(limite < ms for limite in CUBETAS_TRAZA)] += 1
+    return resumen
+
+
+def test_percentil_resumen():
+    resumen = _resumen([3] * 90 + [40] * 9 + [180])
+    assert percentil_resumen(resumen, 0.50) == 5
+    assert percentil_resumen(resumen, 0.90) == 5
+    assert percentil_resumen(resumen, 0.95) == 50
+    assert percentil_resumen(resumen, 1.0) == 180
+
+
+def test_percentil_resumen_acotado_por_el_maximo():
+    assert percentil_resumen(_resumen([1.5, 1.7]), 0.5) == 1.7
+    assert percentil_resumen(_resumen([20000]), 0.95) == 20000
+    assert percentil_resumen(resumen_vacio(), 0.95) == 0.0
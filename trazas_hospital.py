@@ -0,0 +1,93 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from hospital_lib import (
+    TRAZAS_CONFIG,
+    resumen_vacio,
+    sumar_resumen,
+    percentil_resumen,
+)
+
+def archivos_desde(carpeta, prefijo, desde):
+    # Los archivos llevan la fecha en el nombre: <prefijo>-AAAAMMDD.jsonl
+    rutas = []
+    for ruta in sorted(glob.glob(os.path.join(carpeta, f"{prefijo}-*.jsonl"))):
+        dia = os.path.basename(ruta)[len(prefijo) + 1:-len(".jsonl")]
+        if dia >= f"{desde:%Y%m%d}":
+            rutas.append(ruta)
+    return rutas
+
+def leer_lineas(rutas):
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    # Línea a medio escribir por un proceso que se cortó
+                    continue
+
+def juntar_resumenes(carpeta, desde, programa=None):
+    funciones = {}
+    for linea in leer_lineas(archivos_desde(carpeta, 'resumen', desde)):
+        if programa and linea['programa'] != programa:
+            continue
+        for nombre, datos in linea['funciones'].items():
+            if nombre not in funciones:
+                funciones[nombre] = resumen_vacio()
+            sumar_resumen(funciones[nombre], datos)
+    return funciones
+
+def imprimir_tabla(titulo, filas):
+    print(titulo)
+    print(f"  {'función':<40} {'llamadas':>8} {'total s':>9} {'prom ms':>8} {'p95 ms':>8} "
+          f"{'máx ms':>9} {'pool ms':>8} {'filas':>7} {'errores':>7}  llamada desde")
+    for nombre, datos in filas:
+        llamadas = datos['llamadas']
+        modulos = sorted(datos['modulos'].items(), key=lambda m: m[1], reverse=True)
+        print(f"  {nombre:<40} {llamadas:>8} {datos['total_ms'] / 1000:>9.2f} "
+              f"{datos['total_ms'] / llamadas:>8.1f} {percentil_resumen(datos, 0.95):>8.1f} "
+              f"{datos['max_ms']:>9.1f} {datos['adquisicion_ms'] / llamadas:>8.2f} "
+              f"{datos['filas'] / llamadas:>7.1f} {datos['errores']:>7}  "
+              + ", ".join(f"{modulo} ({cantidad})" for modulo, cantidad in modulos[:3]))
+    print()
+
+def imprimir_lentas(carpeta, desde, cantidad, programa=None):
+    lentas = [l for l in leer_lineas(archivos_desde(carpeta, 'lentas', desde))
+              if not programa or l['programa'] == programa]
+    lentas.sort(key=lambda l: l['total_ms'], reverse=True)
+    print(f"Llamadas más lentas ({len(lentas)} sobre el umbral)")
+    for l in lentas[:cantidad]:
+        momento = datetime.fromtimestamp(l['momento']).strftime('%d/%m %H:%M:%S')
+        error = f"  ERROR: {l['error']}" if l['error'] else ""
+        print(f"  {l['total_ms']:>9.1f} ms  {momento}  {l['programa']}/{l['modulo']}  "
+              f"{l['funcion']}({l['argumentos']})  pool {l['adquisicion_ms']:.1f} ms, {l['filas']} filas{error}")
+    print()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Operaciones de base de datos más costosas y más lentas")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--dias", type=int, default=1, help="Días hacia atrás, contando hoy")
+    parser.add_argument("--programa", help="Solo las trazas de este programa (admision, consultoria...)")
+    parser.add_argument("--carpeta", default=TRAZAS_CONFIG['carpeta'])
+    parser.add_argument("--lentas", action="store_true", help="Lista además las llamadas más lentas")
+    args = parser.parse_args()
+
+    desde = date.today() - timedelta(days=args.dias - 1)
+    funciones = juntar_resumenes(args.carpeta, desde, args.programa)
+    if not funciones:
+        print(f"No hay trazas desde el {desde:%d/%m/%Y} en {args.carpeta}")
+        if not TRAZAS_CONFIG['activas']:
+            print("Las trazas están apagadas en este puesto: active HOSPITAL_TRAZAS_ACTIVAS=1 en los programas a medir")
+        sys.exit(1)
+
+    imprimir_tabla("Operaciones más costosas (tiempo total)",
+                   sorted(funciones.items(), key=lambda f: f[1]['total_ms'], reverse=True)[:args.top])
+    imprimir_tabla("Operaciones más lentas (p95)",
+                   sorted(funciones.items(), key=lambda f: (percentil_resumen(f[1], 0.95), f[1]['max_ms']),
+                          reverse=True)[:args.top])
+    if args.lentas:
+        imprimir_lentas(args.carpeta, desde, args.top, args.programa)
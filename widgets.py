@@ -0,0 +1,554 @@
+import tkinter as tk
+from tkinter import ttk
+import os
+import sys
+import re
+import queue
+import bisect
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from hospital_lib import CARPETA_CACHE, normalizar_texto
+
+class EjecutorTareas:
+    # Corre las consultas en hilos de trabajo y entrega los resultados en el hilo de Tk
+    # con after(), así los callbacks pueden tocar widgets sin riesgo y la ventana nunca
+    # espera a la base. enviar() se puede llamar desde cualquier hilo.
+    def __init__(self, ventana, max_hilos=4, intervalo_ms=15):
+        self.ventana = ventana
+        self.intervalo_ms = intervalo_ms
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='tareas_ui')
+        self._resultados = queue.Queue()
+        self._en_curso = {}
+        self._repetir = {}
+        self._lock = threading.Lock()
+        self._revisar()
+
+    def enviar(self, funcion, *args, al_terminar=None, al_fallar=None, clave=None, repetir=False, **kwargs):
+        # Con clave no se encola otra tarea igual mientras la anterior no haya entregado
+        # su resultado (F2 repetido = una sola llamada). Con repetir=True la tarea se
+        # vuelve a correr una vez al terminar, para no perder un aviso llegado a mitad.
+        with self._lock:
+            if clave is not None and clave in self._en_curso:
+                if repetir:
+                    self._repetir[clave] = (funcion, args, kwargs, al_terminar, al_fallar)
+                return self._en_curso[clave]
+            futuro = self._ejecutor.submit(funcion, *args, **kwargs)
+            if clave is not None:
+                self._en_curso[clave] = futuro
+        futuro.add_done_callback(lambda f: self._resultados.put((f, clave, al_terminar, al_fallar)))
+        return futuro
+
+    def ocupado(self, clave):
+        with self._lock:
+            return clave in self._en_curso
+
+    def _revisar(self):
+        while True:
+            try:
+                futuro, clave, al_terminar, al_fallar = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                if clave is not None and self._en_curso.get(clave) is futuro:
+                    del self._en_curso[clave]
+                pendiente = self._repetir.pop(clave, None) if clave is not None else None
+            try:
+                error = futuro.exception()
+                if error is None:
+                    if al_terminar:
+                        al_terminar(futuro.result())
+                elif al_fallar:
+                    al_fallar(error)
+                else:
+                    print(f"Error en tarea de fondo: {error}")
+            except Exception as e:
+                print(f"Error al entregar resultado de tarea: {e}")
+            if pendiente:
+                funcion, args, kwargs, al_terminar, al_fallar = pendiente
+                self.enviar(funcion, *args, al_terminar=al_terminar, al_fallar=al_fallar, clave=clave, **kwargs)
+        try:
+            self.ventana.after(self.intervalo_ms, self._revisar)
+        except tk.TclError:
+            # La ventana se cerró
+            self._ejecutor.shutdown(wait=False)
+
+def _subsecuencia_creciente(valores):
+    # Índices de una subsecuencia creciente más larga (O(n log n))
+    colas = []
+    indices_colas = []
+    anterior = [-1] * len(valores)
+    for i, valor in enumerate(valores):
+        posicion = bisect.bisect_left(colas, valor)
+        if posicion == len(colas):
+            colas.append(valor)
+            indices_colas.append(i)
+        else:
+            colas[posicion] = valor
+            indices_colas[posicion] = i
+        anterior[i] = indices_colas[posicion - 1] if posicion else -1
+    resultado = set()
+    i = indices_colas[-1] if indices_colas else -1
+    while i != -1:
+        resultado.add(i)
+        i = anterior[i]
+    return resultado
+
+class ListaConClaves:
+    # Mantiene un Treeview o un Listbox al día aplicando solo las diferencias con la
+    # lista anterior (filas nuevas, borradas, movidas o con valores distintos), así no
+    # parpadea, conserva selección y scroll, y el trabajo de Tk es del tamaño del cambio.
+    def __init__(self, widget):
+        self.widget = widget
+        self.es_listbox = isinstance(widget, tk.Listbox)
+        self._orden = []
+        self._valores = {}
+
+    def actualizar(self, filas):
+        # filas: lista de (clave, valores); valores es la tupla de columnas de un
+        # Treeview o el texto de la línea de un Listbox
+        nuevas = {}
+        orden = []
+        for clave, valores in filas:
+            iid = str(clave)
+            repeticion = 1
+            while iid in nuevas:
+                repeticion += 1
+                iid = f"{clave}#{repeticion}"
+            nuevas[iid] = valores
+            orden.append(iid)
+
+        # Borradas, de atrás hacia adelante para que los índices sigan valiendo
+        for posicion in range(len(self._orden) - 1, -1, -1):
+            iid = self._orden[posicion]
+            if iid not in nuevas:
+                self._quitar(posicion, iid, borrar=True)
+                del self._orden[posicion]
+                del self._valores[iid]
+
+        # Las filas que siguen en el mismo orden relativo se quedan donde están;
+        # el resto se saca y se vuelve a poner en su nueva posición
+        posicion_actual = {iid: i for i, iid in enumerate(self._orden)}
+        conservadas = [iid for iid in orden if iid in posicion_actual]
+        quietas = _subsecuencia_creciente([posicion_actual[iid] for iid in conservadas])
+        quietas = {conservadas[i] for i in quietas}
+        for posicion in range(len(self._orden) - 1, -1, -1):
+            iid = self._orden[posicion]
+            if iid not in quietas:
+                self._quitar(posicion, iid, borrar=False)
+                del self._orden[posicion]
+
+        for posicion, iid in enumerate(orden):
+            valores = nuevas[iid]
+            if iid in quietas:
+                if self._valores[iid] != valores:
+                    self._modificar(posicion, iid, valores)
+                    self._valores[iid] = valores
+                continue
+            self._poner(posicion, iid, valores, existe=iid in self._valores)
+            self._orden.insert(posicion, iid)
+            self._valores[iid] = valores
+
+    def _quitar(self, posicion, iid, borrar):
+        if self.es_listbox:
+            self.widget.delete(posicion)
+        elif borrar:
+            self.widget.delete(iid)
+        else:
+            self.widget.detach(iid)
+
+    def _poner(self, posicion, iid, valores, existe):
+        if self.es_listbox:
+            self.widget.insert(posicion, valores)
+        elif existe:
+            self.widget.move(iid, '', posicion)
+            if self._valores[iid] != valores:
+                self.widget.item(iid, values=valores)
+        else:
+            self.widget.insert('', posicion, iid=iid, values=valores)
+
+    def _modificar(self, posicion, iid, valores):
+        if self.es_listbox:
+            seleccionada = self.widget.selection_includes(posicion)
+            self.widget.delete(posicion)
+            self.widget.insert(posicion, valores)
+            if seleccionada:
+                self.widget.selection_set(posicion)
+        else:
+            self.widget.item(iid, values=valores)
+
+class TablaVirtual:
+    # Treeview que solo materializa las filas visibles. Los datos viven en un almacén
+    # por columnas (una lista por columna) y al desplazarse se reescriben los valores
+    # de las mismas filas de Tk, así el costo no depende del total de filas.
+    def __init__(self, parent, columnas, ancho=130):
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columnas, show="headings", selectmode="browse")
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.barra = tk.Scrollbar(self.frame, orient="vertical", command=self._desplazar)
+        self.barra.grid(row=0, column=1, sticky="ns")
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+        for col in columnas:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, anchor="w", width=ancho)
+
+        self.columnas = columnas
+        self.datos = [[] for _ in columnas]
+        self.claves = []
+        self.indices = []
+        self.inicio = 0
+        self.visibles = 1
+        self.seleccion = None
+        self._filas_tk = []
+
+        self.tree.bind("<Configure>", lambda e: self._ajustar_alto())
+        self.tree.bind("<<TreeviewSelect>>", self._al_seleccionar)
+        self.tree.bind("<MouseWheel>", lambda e: self._mover(-1 if e.delta > 0 else 1, 3))
+        self.tree.bind("<Button-4>", lambda e: self._mover(-1, 3))
+        self.tree.bind("<Button-5>", lambda e: self._mover(1, 3))
+        self.tree.bind("<Up>", lambda e: self._mover_seleccion(-1))
+        self.tree.bind("<Down>", lambda e: self._mover_seleccion(1))
+        self.tree.bind("<Prior>", lambda e: self._mover_seleccion(-self.visibles))
+        self.tree.bind("<Next>", lambda e: self._mover_seleccion(self.visibles))
+
+    def cargar(self, filas, claves):
+        # filas: tuplas con los valores ya listos para mostrar, una por clave
+        self.datos = [list(columna) for columna in zip(*filas)] if filas else [[] for _ in self.columnas]
+        self.claves = claves
+        self.indices = range(len(claves))
+        self._pintar()
+
+    def filtrar(self, indices):
+        # indices: filas del almacén que quedan visibles, en orden (None = todas)
+        self.indices = range(len(self.claves)) if indices is None else indices
+        self._pintar()
+
+    def total_visibles(self):
+        return len(self.indices)
+
+    def valores_seleccionados(self):
+        if self.seleccion is None:
+            return None
+        try:
+            fila = self.claves.index(self.seleccion)
+        except ValueError:
+            return None
+        return tuple(columna[fila] for columna in self.datos)
+
+    def _ajustar_alto(self):
+        alto_fila = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visibles = max(1, (self.tree.winfo_height() - 25) // alto_fila)
+        if visibles != self.visibles:
+            self.visibles = visibles
+            self._pintar()
+
+    def _pintar(self):
+        total = len(self.indices)
+        self.inicio = max(0, min(self.inicio, total - self.visibles))
+        cantidad = min(self.visibles, total - self.inicio)
+
+        while len(self._filas_tk) < cantidad:
+            self._filas_tk.append(self.tree.insert("", "end"))
+        while len(self._filas_tk) > cantidad:
+            self.tree.delete(self._filas_tk.pop())
+
+        seleccionada = None
+        for posicion, iid in enumerate(self._filas_tk):
+            fila = self.indices[self.inicio + posicion]
+            self.tree.item(iid, values=tuple(columna[fila] for columna in self.datos))
+            if self.claves[fila] == self.seleccion:
+                seleccionada = iid
+
+        # <<TreeviewSelect>> vuelve a leer la misma fila, así que no hace falta filtrarlo
+        self.tree.selection_set(seleccionada if seleccionada else ())
+
+        if total:
+            self.barra.set(self.inicio / total, (self.inicio + cantidad) / total)
+        else:
+            self.barra.set(0, 1)
+
+    def _desplazar(self, accion, cantidad, unidad=None):
+        total = len(self.indices)
+        if accion == "moveto":
+            self.inicio = int(float(cantidad) * total)
+            self._pintar()
+        elif accion == "scroll":
+            self._mover(int(cantidad), self.visibles if unidad == "pages" else 1)
+
+    def _mover(self, direccion, paso):
+        self.inicio += direccion * paso
+        self._pintar()
+        return "break"
+
+    def _al_seleccionar(self, evento):
+        seleccion = self.tree.selection()
+        if seleccion and seleccion[0] in self._filas_tk:
+            fila = self.indices[self.inicio + self._filas_tk.index(seleccion[0])]
+            self.seleccion = self.claves[fila]
+
+    def _mover_seleccion(self, paso):
+        if not self.indices:
+            return "break"
+        posicion = -1
+        if self.seleccion is not None:
+            for i in range(self.inicio, min(self.inicio + self.visibles, len(self.indices))):
+                if self.claves[self.indices[i]] == self.seleccion:
+                    posicion = i
+                    break
+        posicion = max(0, min(len(self.indices) - 1, posicion + paso if posicion >= 0 else self.inicio))
+        self.seleccion = self.claves[self.indices[posicion]]
+        if posicion < self.inicio:
+            self.inicio = posicion
+        elif posicion >= self.inicio + self.visibles:
+            self.inicio = posicion - self.visibles + 1
+        self._pintar()
+        return "break"
+
+# Prioridad de los anuncios de voz: el perifoneo al personal pasa antes que los llamados
+PRIORIDAD_PERSONAL = 0
+PRIORIDAD_PACIENTE = 1
+MAX_ANUNCIOS_PENDIENTES = 10
+
+# "Paciente X, favor pasar al Consultorio N": la parte fija se graba una vez a .wav y
+# en cada llamado solo se sintetiza el nombre (solo en Windows, con winsound)
+PATRON_LLAMADO = re.compile(r"^(?P<vivo>.+?),?\s+(?P<fija>favor pasar al consultorio \d+)\s*\.?$", re.IGNORECASE)
+CONSULTORIOS_PREGRABADOS = 20
+CARPETA_FRASES = os.path.join(CARPETA_CACHE, 'frases')
+
+class ColaAnuncios:
+    # Un solo hilo es dueño del motor pyttsx3 y lee los anuncios de a uno, por
+    # prioridad y en orden de llegada; la ventana nunca espera a la voz.
+    def __init__(self, configurar_motor=None, repeticiones=1, maximo=MAX_ANUNCIOS_PENDIENTES,
+                 pregrabar=CONSULTORIOS_PREGRABADOS):
+        self.configurar_motor = configurar_motor
+        self.repeticiones = repeticiones
+        self.maximo = maximo
+        self.disponible = True
+        self._pendientes = []
+        self._orden = 0
+        self._en_curso = None
+        self._cerrada = False
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._motor = None
+        self._winsound = None
+        self._frases = {}
+        self._por_grabar = [f"favor pasar al Consultorio {n}" for n in range(1, pregrabar + 1)]
+        self.estadisticas = {'anunciados': 0, 'fusionados': 0, 'descartados': 0}
+
+    def iniciar(self):
+        with self._condicion:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._trabajar, daemon=True, name='anuncios_voz')
+                self._hilo.start()
+
+    def anunciar(self, texto, prioridad=PRIORIDAD_PACIENTE, repeticiones=None):
+        # Un anuncio igual a uno pendiente (o al que se está leyendo) no se repite;
+        # con la cola llena se descarta el más viejo de menor prioridad.
+        self.iniciar()
+        clave = normalizar_texto(texto)
+        repeticiones = repeticiones or self.repeticiones
+        with self._condicion:
+            if self._cerrada or not self.disponible:
+                return False
+            if clave == self._en_curso:
+                self.estadisticas['fusionados'] += 1
+                return True
+            for anuncio in self._pendientes:
+                if anuncio['clave'] == clave:
+                    anuncio['prioridad'] = min(anuncio['prioridad'], prioridad)
+                    anuncio['repeticiones'] = max(anuncio['repeticiones'], repeticiones)
+                    self.estadisticas['fusionados'] += 1
+                    return True
+            if len(self._pendientes) >= self.maximo:
+                menos_urgente = max(self._pendientes, key=lambda a: (a['prioridad'], -a['orden']))
+                if menos_urgente['prioridad'] < prioridad:
+                    self.estadisticas['descartados'] += 1
+                    print(f"Cola de anuncios llena, se descarta: {texto}")
+                    return False
+                self._pendientes.remove(menos_urgente)
+                self.estadisticas['descartados'] += 1
+                print(f"Cola de anuncios llena, se descarta: {menos_urgente['texto']}")
+            self._orden += 1
+            self._pendientes.append({
+                'clave': clave,
+                'texto': texto,
+                'prioridad': prioridad,
+                'repeticiones': repeticiones,
+                'orden': self._orden
+            })
+            self._condicion.notify()
+        return True
+
+    def pendientes(self):
+        with self._condicion:
+            return [a['texto'] for a in sorted(self._pendientes, key=lambda a: (a['prioridad'], a['orden']))]
+
+    def detener(self):
+        # Descarta lo pendiente y corta el anuncio en curso
+        with self._condicion:
+            self._pendientes.clear()
+        if self._motor:
+            try:
+                self._motor.stop()
+            except Exception as e:
+                print(f"Error al detener la voz: {e}")
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrada = True
+            self._condicion.notify()
+        self.detener()
+
+    def _iniciar_motor(self):
+        try:
+            import pyttsx3
+            self._motor = pyttsx3.init()
+            if self.configurar_motor:
+                self.configurar_motor(self._motor)
+        except Exception as e:
+            print(f"Error al inicializar pyttsx3: {e}")
+            with self._condicion:
+                self.disponible = False
+                self._pendientes.clear()
+            return False
+        try:
+            import winsound
+            self._winsound = winsound
+            os.makedirs(CARPETA_FRASES, exist_ok=True)
+        except (ImportError, OSError):
+            self._por_grabar = []
+        return True
+
+    def _trabajar(self):
+        if not self._iniciar_motor():
+            return
+        while True:
+            with self._condicion:
+                # Las frases fijas se graban solo mientras no hay nada que anunciar
+                while not self._pendientes and not self._cerrada and not self._por_grabar:
+                    self._condicion.wait()
+                if self._cerrada:
+                    return
+                anuncio = None
+                if self._pendientes:
+                    anuncio = min(self._pendientes, key=lambda a: (a['prioridad'], a['orden']))
+                    self._pendientes.remove(anuncio)
+                    self._en_curso = anuncio['clave']
+            if anuncio is None:
+                self._grabar_frase(self._por_grabar.pop(0))
+                continue
+            try:
+                for _ in range(anuncio['repeticiones']):
+                    self._decir(anuncio['texto'])
+                self.estadisticas['anunciados'] += 1
+            except Exception as e:
+                print(f"Error en síntesis de voz: {e}")
+            finally:
+                with self._condicion:
+                    self._en_curso = None
+
+    def _decir(self, texto):
+        partes = PATRON_LLAMADO.match(texto)
+        ruta = self._frases.get(normalizar_texto(partes.group('fija'))) if partes else None
+        if ruta:
+            self._motor.say(partes.group('vivo'))
+            self._motor.runAndWait()
+            self._winsound.PlaySound(ruta, self._winsound.SND_FILENAME)
+        else:
+            self._motor.say(texto)
+            self._motor.runAndWait()
+
+    def _grabar_frase(self, frase):
+        # El archivo depende de la voz y la velocidad: si cambian se graba de nuevo
+        try:
+            firma = f"{self._motor.getProperty('voice')}|{self._motor.getProperty('rate')}|{frase}"
+            ruta = os.path.join(CARPETA_FRASES, hashlib.sha1(firma.encode('utf-8')).hexdigest() + ".wav")
+            if not os.path.exists(ruta):
+                temporal = ruta + ".tmp"
+                self._motor.save_to_file(frase, temporal)
+                self._motor.runAndWait()
+                os.replace(temporal, ruta)
+            if os.path.getsize(ruta) > 0:
+                self._frases[normalizar_texto(frase)] = ruta
+        except Exception as e:
+            print(f"Error al pregrabar '{frase}': {e}")
+
+# Variantes ya escaladas de las imágenes, una por tamaño. El nombre lleva el hash
+# del original: si se cambia el logo, las variantes viejas se borran solas.
+CARPETA_RECURSOS = os.path.join(CARPETA_CACHE, 'recursos')
+_firmas_recursos = {}
+
+def ruta_recurso(nombre):
+    posibles = []
+    if getattr(sys, 'frozen', False):
+        posibles.append(sys._MEIPASS)
+        posibles.append(os.path.dirname(sys.executable))
+    posibles.append(os.path.dirname(os.path.abspath(__file__)))
+    posibles.append(os.getcwd())
+
+    for base in posibles:
+        ruta = os.path.join(base, nombre)
+        if os.path.isfile(ruta):
+            return ruta
+    return None
+
+def imagen_escalada(nombre, ancho, alto=None):
+    # Devuelve la ruta de un PNG del tamaño pedido; solo la primera vez se
+    # abre el original y se escala con PIL.
+    alto = alto or ancho
+    origen = ruta_recurso(nombre)
+    if not origen:
+        raise FileNotFoundError(f"{nombre} no encontrado en ninguna ruta conocida")
+
+    if origen not in _firmas_recursos:
+        with open(origen, 'rb') as archivo:
+            _firmas_recursos[origen] = hashlib.sha1(archivo.read()).hexdigest()[:16]
+    firma = _firmas_recursos[origen]
+    base = os.path.splitext(nombre)[0]
+    destino = os.path.join(CARPETA_RECURSOS, f"{base}-{firma}-{ancho}x{alto}.png")
+    if os.path.exists(destino):
+        return destino
+
+    from PIL import Image
+    os.makedirs(CARPETA_RECURSOS, exist_ok=True)
+    variante = re.compile(re.escape(base) + r"-[0-9a-f]{16}-\d+x\d+\.png")
+    for viejo in os.listdir(CARPETA_RECURSOS):
+        if variante.fullmatch(viejo) and not viejo.startswith(f"{base}-{firma}-"):
+            try:
+                os.remove(os.path.join(CARPETA_RECURSOS, viejo))
+            except OSError:
+                pass
+    with Image.open(origen) as imagen:
+        escalada = imagen.resize((ancho, alto), Image.LANCZOS)
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    escalada.save(temporal, format='PNG')
+    os.replace(temporal, destino)
+    return destino
+
+def cargar_imagen(nombre, ancho, alto=None):
+    # tk.PhotoImage lee el PNG ya escalado sin pasar por PIL
+    try:
+        return tk.PhotoImage(file=imagen_escalada(nombre, ancho, alto))
+    except FileNotFoundError:
+        raise
+    except OSError as e:
+        # Sin permiso para escribir la caché: se escala en memoria
+        print(f"Caché de imágenes no disponible: {e}")
+        from PIL import Image, ImageTk
+        with Image.open(ruta_recurso(nombre)) as imagen:
+            return ImageTk.PhotoImage(imagen.resize((ancho, alto or ancho), Image.LANCZOS))
+
+def cargar_logo(parent):
+    try:
+        logo = cargar_imagen('logo_hospital.png', 200)
+        lbl = tk.Label(parent, image=logo, bg='#f0f8ff')
+        lbl.image = logo
+        return lbl
+    except FileNotFoundError as e:
+        print(f"Error al cargar logo: {e}")
+        return tk.Label(parent, text="Logo no encontrado", bg='#f0f8ff')
+    except Exception as e:
+        print(f"Error al procesar logo: {e}")
+        return tk.Label(parent, text="Logo no cargado", bg='#f0f8ff')